@@ -1,24 +1,45 @@
 from flask import Flask, request, jsonify, send_from_directory, Response
 import traceback 
 from flask_cors import CORS  # Import CORS
-import fitz
-from PIL import Image
-from io import BytesIO
 import os
 import json
 from datetime import datetime
-import hashlib
+import uuid
 from functools import wraps
 from werkzeug.utils import secure_filename
-from autograder_logic import run_autograder_full, text_model, vision_model, extract_text_from_pdf
-from autograder_with_factors import run_autograder_with_factors  # <-- Import the new function
+from autograder_jobs import JobQueue, MAX_CONCURRENT_JOBS
+from autograder_pipeline import grade_pdf, run_rubric_cached
+from autograder_cache import result_cache, response_cache
+from autograder_structured import structured_stats
+from autograder_prompts import prefix_cache
+from autograder_store import SubmissionStore, DEFAULT_PAGE_SIZE
+from autograder_index import SubmissionIndex
+from autograder_pdf import check_pdf_limits, PdfLimitError, MAX_UPLOAD_MB
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Werkzeug rejects larger request bodies with 413 before they are read
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
 UPLOAD_FOLDER = "/tmp/autograder_uploads"
-SUBMISSIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'submissions')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(SUBMISSIONS_FOLDER, exist_ok=True)
+SUBMISSIONS_FOLDER = os.getenv(
+    "AUTOGRADER_SUBMISSIONS_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'submissions')
+)
+
+# Render pool workers are spawned, and spawn re-imports the script that started the
+# parent as __mp_main__. Under `python autograder_backend.py` that is this file, so
+# the database, index and job threads are only set up in the real server process.
+if __name__ != "__mp_main__":
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(SUBMISSIONS_FOLDER, exist_ok=True)
+
+    # Submissions live in SQLite. The in-memory index serves the admin list and also
+    # imports any JSON files dropped into SUBMISSIONS_FOLDER (including the legacy ones)
+    submission_store = SubmissionStore()
+    submission_index = SubmissionIndex(submission_store, watch_folder=SUBMISSIONS_FOLDER)
+
+    # Worker pool for grading jobs (size via AUTOGRADER_MAX_CONCURRENT_JOBS)
+    grading_queue = JobQueue(max_workers=MAX_CONCURRENT_JOBS)
+SSE_KEEPALIVE_SECONDS = 15
 
 # Admin credentials (in production, use environment variables)
 ADMIN_USERNAME = "admin"
@@ -49,8 +70,6 @@ def authenticate():
 # Function to save submission data
 def save_submission(student_name, student_pid, architect_name, grade, score, rubric_scores, detailed_evaluation):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{student_pid}_{timestamp}.json"
-    filepath = os.path.join(SUBMISSIONS_FOLDER, filename)
     
     submission_data = {
         "student_name": student_name,
@@ -63,24 +82,13 @@ def save_submission(student_name, student_pid, architect_name, grade, score, rub
         "detailed_evaluation": detailed_evaluation
     }
     
-    with open(filepath, 'w') as f:
-        json.dump(submission_data, f, indent=2)
-    
-    return filepath
+    row_id = submission_store.add(submission_data)
+    submission_index.add(submission_data)
+    return row_id
 
-# Function to get all submissions
+# Function to get all submissions (newest first, ordered by the timestamp index)
 def get_all_submissions():
-    submissions = []
-    for filename in os.listdir(SUBMISSIONS_FOLDER):
-        if filename.endswith('.json'):
-            filepath = os.path.join(SUBMISSIONS_FOLDER, filename)
-            with open(filepath, 'r') as f:
-                submission = json.load(f)
-                submissions.append(submission)
-    
-    # Sort by timestamp (newest first)
-    submissions.sort(key=lambda x: x['timestamp'], reverse=True)
-    return submissions
+    return submission_store.all()
 
 @app.route("/", methods=["GET"])
 def homepage():
@@ -98,8 +106,49 @@ def admin_page():
 @app.route("/api/submissions", methods=["GET"])
 @login_required
 def get_submissions():
-    submissions = get_all_submissions()
-    return jsonify(submissions)
+    # ?page=&limit=&grade=&architect=&q=&sort= ; rows omit detailed_evaluation
+    try:
+        result = submission_index.query(
+            page=request.args.get("page", 1),
+            limit=request.args.get("limit", DEFAULT_PAGE_SIZE),
+            grade=request.args.get("grade"),
+            architect=request.args.get("architect"),
+            q=request.args.get("q"),
+            sort=request.args.get("sort", "-timestamp")
+        )
+    except ValueError:
+        return jsonify({"error": "page and limit must be integers"}), 400
+    result["architects"] = submission_index.architects()
+    return jsonify(result)
+
+@app.route("/api/submissions/<student_pid>/<timestamp>", methods=["GET"])
+@login_required
+def get_submission_details(student_pid, timestamp):
+    submission = submission_store.get(student_pid, timestamp)
+    if submission is None:
+        return jsonify({"error": "Submission not found."}), 404
+    return jsonify(submission)
+
+def grade_pdf_submission(filepath, student_name, student_pid, architect_name, on_event=None):
+    try:
+        # Rubric, feedback and factor reflection (the factor branch runs concurrently)
+        graded = grade_pdf(filepath, student_name, student_pid, architect_name, on_event=on_event)
+
+        # Save submission data
+        save_submission(
+            student_name=student_name,
+            student_pid=student_pid,
+            architect_name=architect_name,
+            grade=graded['grade'],
+            score=graded['score'],
+            rubric_scores=graded['rubric_scores'],
+            detailed_evaluation=graded['detailed_evaluation']
+        )
+
+        return graded
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
 
 @app.route("/", methods=["POST"])
 def grade_student():
@@ -111,66 +160,89 @@ def grade_student():
     if not uploaded_file or not uploaded_file.filename.endswith(".pdf"):
         return jsonify({"error": "No PDF file uploaded."}), 400
 
-    filename = secure_filename(uploaded_file.filename)
+    # Prefix with a random token so concurrent uploads of "submission.pdf" don't collide
+    filename = f"{uuid.uuid4().hex}_{secure_filename(uploaded_file.filename)}"
     filepath = os.path.join(UPLOAD_FOLDER, filename)
     uploaded_file.save(filepath)
-
     try:
-        # Extract text from PDF
-        text = extract_text_from_pdf(filepath)
-        
-        # Run the autograder to get the scores
-        result = run_autograder_full(filepath, architect_name=architect_name, debug=False)
-        
-        # Get the detailed evaluation text from the result
-        detailed_evaluation_text = result.get("detailed_evaluation", "No detailed evaluation available.")
+        check_pdf_limits(filepath)
+    except PdfLimitError as e:
+        os.remove(filepath)
+        return jsonify({"error": str(e)}), e.status_code
 
-        feedback_prompt = f"""
-You are an instructor providing constructive feedback on a student's university architecture assignment.
-The student is {student_name} (PID: {student_pid}). The assignment is about the architect: {architect_name}.
-Their final score is {result['final_percent']}% and grade is {result['grade']}.
+    # Grading takes 30-90 s, so hand it to the worker pool and let the client poll
+    job = grading_queue.submit(
+        grade_pdf_submission, filepath, student_name, student_pid, architect_name, with_events=True
+    )
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }), 202
 
-Please ONLY give specific, actionable suggestions for improvement on their architecture submission. 
-- Focus on the content, structure, images, citations, and clarity of their work.
-- Give concrete examples of what could be improved (e.g., "Instead of X, you could do Y").
-- Do NOT mention anything about programming, servers, databases, or unrelated technical topics.
-- Do NOT praise the student's scholarly effort.
-- Write in a friendly, undergraduate-appropriate tone.
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload is larger than the {MAX_UPLOAD_MB} MB limit."}), 413
 
-Begin your feedback below:
-"""
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = grading_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    job_data = job.to_dict()
+    if job.status == "queued":
+        job_data["queue_position"] = grading_queue.queue_position(job_id)
+    return jsonify(job_data)
 
-        gemini_feedback = text_model.generate_content([feedback_prompt]).text
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id):
+    # Server-Sent Events: one event per pipeline stage, ending with done/error.
+    # Reconnecting clients resume after the Last-Event-ID they send.
+    job = grading_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    try:
+        last_id = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_id = 0
 
-        # ALSO run the factor-operationalizer
-        factor_result = run_autograder_with_factors(filepath, architect_name)
+    def generate():
+        nonlocal last_id
+        while True:
+            events = job.events_after(last_id, timeout=SSE_KEEPALIVE_SECONDS)
+            for event in events:
+                last_id = event["id"]
+                yield f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["stage"] in ("done", "error"):
+                    return
+            # A client resuming after the terminal event has nothing left to wait for
+            if job.finished and last_id >= len(job.events):
+                return
+            if not events:
+                yield ": keep-alive\n\n"
 
-        # Save submission data
-        save_submission(
-            student_name=student_name,
-            student_pid=student_pid,
-            architect_name=architect_name,
-            grade=result['grade'],
-            score=result['final_percent'],
-            rubric_scores=result['rubric_scores'],
-            detailed_evaluation=result['detailed_evaluation']
-        )
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-        os.remove(filepath)  
+@app.route("/api/jobs", methods=["GET"])
+@login_required
+def get_job_stats():
+    return jsonify(grading_queue.stats())
 
-        return jsonify({
-            "feedback": gemini_feedback,
-            "detailed_evaluation": detailed_evaluation_text,
-            "score": result["final_percent"],
-            "grade": result["grade"],
-            "rubric_scores": result["rubric_scores"],
-            "factor_table": factor_result["factor_table"].to_dict(orient="records"),
-            "factor_reflection": factor_result["reflection"]
-        })
+@app.route("/api/cache", methods=["GET"])
+@login_required
+def get_cache_stats():
+    # response_cache hits (by_kind: image, rubric_pages) are vision calls saved, and
+    # structured reruns_avoided are rubric calls repaired by re-asks instead of re-sent
+    # (repaired also counts image verdicts)
+    return jsonify({"results": result_cache.stats(), "responses": response_cache.stats(),
+                    "structured": structured_stats.snapshot(), "context_cache": prefix_cache.stats()})
 
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+@app.route("/api/cache", methods=["DELETE"])
+@login_required
+def purge_cache():
+    removed = result_cache.purge() + response_cache.purge()
+    return jsonify({"removed": removed})
 
 @app.route('/grade', methods=['POST'])
 def grade_submission():
@@ -184,8 +256,13 @@ def grade_submission():
         if not all([student_name, student_pid, architect_name, pdf_path]):
             return jsonify({"error": "Missing required fields"}), 400
         
-        # Run the autograder
-        result = run_autograder_full(pdf_path, architect_name)
+        # Run the autograder through the job queue so /grade counts against the same
+        # concurrency limit as uploads, but keep this endpoint synchronous
+        job = grading_queue.submit(run_rubric_cached, pdf_path, architect_name)
+        job.future.result()
+        if job.status == "error":
+            return jsonify({"error": job.error}), 500
+        result = job.result
         
         # Save the submission
         save_submission(
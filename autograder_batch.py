@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from autograder_store import SubmissionStore
+
+# Batch grader for a folder of PDFs or a Canvas submissions ZIP:
+#
+#   python autograder_batch.py submissions.zip --architect "Zaha Hadid" --workers 4
+#
+# Every finished submission is appended to a JSONL checkpoint keyed by the PDF's
+# SHA-256, the student and the architect, so rerunning the same command after a crash
+# only grades what is left (including a second student who handed in the same file),
+# while rerunning with a different --architect grades everything again.
+BATCH_WORKERS = int(os.getenv("AUTOGRADER_BATCH_WORKERS", "4"))
+DEFAULT_ARCHITECT = "Bjarke Ingels"
+
+# Canvas names downloads <student>_[LATE_]<user id>_<submission id>_<original name>
+CANVAS_FILENAME = re.compile(r"^(?P<name>[^_]+)_(?:LATE_)?(?P<user_id>\d+)_(?P<submission_id>\d+)_(?P<original>.+)$")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def student_from_filename(filename):
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = CANVAS_FILENAME.match(os.path.basename(filename))
+    if match:
+        return match.group("name"), match.group("user_id")
+    # Not a Canvas export: the file name is all we have for both
+    return stem, stem
+
+
+def find_pdfs(source, extract_dir):
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            members = [m for m in archive.namelist()
+                       if m.lower().endswith(".pdf") and not m.startswith("__MACOSX/")]
+            # extract() sanitises member names (.., drive letters, leading /), so use the
+            # path it actually wrote rather than joining the raw name
+            return sorted(archive.extract(member, extract_dir) for member in members)
+    return sorted(
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(source)
+        for filename in filenames if filename.lower().endswith(".pdf")
+    )
+
+
+def load_checkpoint(path, architect_name):
+    """Finished records for architect_name by (PDF sha256, student pid); other architects' gradings don't count."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash mid-write leaves at most one torn final line
+                continue
+            if record.get("status") == "done" and record.get("architect_name") == architect_name:
+                done[(record["sha256"], record["student_pid"])] = record
+    return done
+
+
+def grade_one(pdf_path, student_name, student_pid, architect_name):
+    """Runs in a pool worker; returns a checkpoint record plus this process's API counters."""
+    from autograder_pipeline import grade_pdf
+    from autograder_ratelimit import api_usage
+    start = time.perf_counter()
+    record = {"file": os.path.basename(pdf_path), "student_name": student_name, "student_pid": student_pid}
+    try:
+        graded = grade_pdf(pdf_path, student_name, student_pid, architect_name)
+        record.update({
+            "status": "done",
+            "grade": graded["grade"],
+            "score": graded["score"],
+            "rubric_scores": graded["rubric_scores"],
+            "detailed_evaluation": graded["detailed_evaluation"]
+        })
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+    record["seconds"] = round(time.perf_counter() - start, 2)
+    return record, os.getpid(), api_usage.snapshot()
+
+
+def _render_in_process():
+    # The grading processes already use the cores; a render pool in each would oversubscribe them
+    from autograder_render_pool import render_pool
+    render_pool.workers = 0
+
+
+class BatchGrader:
+    def __init__(self, architect_name=DEFAULT_ARCHITECT, workers=BATCH_WORKERS, use_processes=False,
+                 checkpoint_path="grading_checkpoint.jsonl", store=None):
+        self.architect_name = architect_name
+        self.workers = workers
+        self.use_processes = use_processes
+        self.checkpoint_path = checkpoint_path
+        self.store = store or SubmissionStore()
+        self._checkpoint_lock = threading.Lock()
+        # Latest cumulative counters per worker process (or just this one for threads)
+        self._usage_by_pid = {}
+
+    def _make_executor(self):
+        if self.use_processes:
+            # spawn: fitz and the genai client don't survive a fork from a threaded parent
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_render_in_process)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-grade")
+
+    def _checkpoint(self, record):
+        with self._checkpoint_lock, open(self.checkpoint_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _save(self, record):
+        self.store.add({
+            "student_name": record["student_name"],
+            "student_pid": record["student_pid"],
+            "architect_name": self.architect_name,
+            # Workers finish several submissions a second; with whole seconds, two for
+            # the same pid would replace each other in the store (pid + timestamp is unique)
+            "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S_%f"),
+            "grade": record["grade"],
+            "score": record["score"],
+            "rubric_scores": record["rubric_scores"],
+            "detailed_evaluation": record["detailed_evaluation"]
+        })
+
+    def usage(self):
+        totals = {"calls": 0, "retries": 0, "failures": 0, "bytes_sent": 0, "input_tokens": 0, "output_tokens": 0}
+        for snapshot in self._usage_by_pid.values():
+            for key in totals:
+                totals[key] += snapshot[key]
+        return totals
+
+    def run(self, source):
+        start = time.perf_counter()
+        done = load_checkpoint(self.checkpoint_path, self.architect_name)
+        graded = failed = 0
+        with tempfile.TemporaryDirectory(prefix="autograder_batch_") as extract_dir:
+            pending = []
+            for pdf_path in find_pdfs(source, extract_dir):
+                sha256 = file_sha256(pdf_path)
+                name, pid = student_from_filename(pdf_path)
+                if (sha256, pid) in done:
+                    continue
+                pending.append((pdf_path, sha256, name, pid))
+            print(f"{len(done)} already graded, {len(pending)} to grade with {self.workers} "
+                  f"{'processes' if self.use_processes else 'threads'}")
+
+            with self._make_executor() as executor:
+                futures = {
+                    executor.submit(grade_one, pdf_path, name, pid, self.architect_name): sha256
+                    for pdf_path, sha256, name, pid in pending
+                }
+                for future in as_completed(futures):
+                    record, worker_pid, usage = future.result()
+                    record["sha256"] = futures[future]
+                    record["architect_name"] = self.architect_name
+                    self._usage_by_pid[worker_pid] = usage
+                    if record["status"] == "done":
+                        # Store first: a record in the checkpoint means it is in the store
+                        self._save(record)
+                        graded += 1
+                    else:
+                        failed += 1
+                        print(f"  {record['file']}: {record['error']}")
+                    self._checkpoint({key: value for key, value in record.items() if key != "detailed_evaluation"})
+                    print(f"[{graded + failed}/{len(pending)}] {record['file']}: "
+                          f"{record.get('grade', 'error')} ({record['seconds']}s)")
+
+        return self.report(graded, failed, len(done), time.perf_counter() - start)
+
+    def report(self, graded, failed, skipped, seconds):
+        usage = self.usage()
+        report = {
+            "graded": graded,
+            "failed": failed,
+            "skipped": skipped,
+            "seconds": round(seconds, 1),
+            "submissions_per_minute": round(graded / seconds * 60, 2) if seconds else 0.0,
+            "api_calls": usage["calls"],
+            "api_retries": usage["retries"],
+            "bytes_sent": usage["bytes_sent"],
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"]
+        }
+        print(f"Graded {graded} ({failed} failed, {skipped} skipped) in {report['seconds']}s: "
+              f"{report['submissions_per_minute']} submissions/min, {usage['calls']} API calls "
+              f"({usage['retries']} retries), {usage['bytes_sent'] / (1024 * 1024):.1f} MB sent, "
+              f"{usage['input_tokens']} input tokens")
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade a folder or Canvas ZIP of PDF submissions.")
+    parser.add_argument("source", help="directory of PDFs or a Canvas submissions .zip")
+    parser.add_argument("--architect", default=DEFAULT_ARCHITECT)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--processes", action="store_true", help="grade in worker processes instead of threads")
+    parser.add_argument("--checkpoint", default="grading_checkpoint.jsonl")
+    args = parser.parse_args()
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    report = BatchGrader(args.architect, args.workers, args.processes, args.checkpoint).run(args.source)
+    sys.exit(1 if report["failed"] else 0)
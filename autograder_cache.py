@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import threading
+
+# On-disk cache of finished grading stages, keyed by what actually determines the
+# result: the PDF bytes, the architect, the model and the prompt/rubric version.
+CACHE_FOLDER = os.getenv(
+    "AUTOGRADER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+CACHE_MAX_BYTES = int(os.getenv("AUTOGRADER_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def make_cache_key(*parts):
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.kind_counts = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key, kind=None):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._count(kind, "misses")
+            return None
+        # mtime doubles as the LRU clock
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count(kind, "hits")
+        return value
+
+    def _count(self, kind, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if kind is not None:
+                counts = self.kind_counts.setdefault(kind, {"hits": 0, "misses": 0})
+                counts[outcome] += 1
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        return removed
+
+    def purge(self):
+        with self._lock:
+            removed = 0
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "by_kind": {kind: dict(counts) for kind, counts in self.kind_counts.items()}
+            }
+
+
+# Whole-stage results (rubric, factors) for byte-identical resubmissions
+result_cache = ResultCache()
+# Individual model responses (one embedded image, one rendered page set), so a
+# resubmission that only changed a caption still reuses everything else. Every hit
+# here is one vision API call that wasn't made.
+response_cache = ResultCache(folder=os.path.join(CACHE_FOLDER, "responses"))
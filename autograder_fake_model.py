@@ -0,0 +1,117 @@
+import os
+import re
+import json
+import time
+import random
+
+# Offline stand-in for genai.GenerativeModel. Set AUTOGRADER_FAKE_MODEL=1 to grade
+# without an API key (load testing the job queue, local frontend work, etc.).
+# AUTOGRADER_FAKE_MODEL_DELAY adds a per-call sleep to mimic Gemini latency.
+# AUTOGRADER_FAKE_MODEL_MALFORMED is the fraction of replies to corrupt (truncated
+# JSON, dropped fields, bad values, prose around the JSON, missing scores), for
+# exercising the structured-output validation and re-asks.
+
+FAKE_RUBRIC_CATEGORIES = [
+    "Architect Selection & Scope",
+    "Organization & Document Setup",
+    "Biographical Content",
+    "Citation of Architect Biography",
+    "Selection & Quality of Images",
+    "Image Citation & Attribution",
+    "Coverage of 10 Famous Buildings",
+    "Image Relevance",
+    "Personal Bio & Photo",
+    "Overall Completeness & Presentation"
+]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name="fake-model", delay=None, score=4, malformed=None, seed=None, cached_contents=None):
+        self.model_name = model_name
+        # Stands in for a context-cached prefix: prepended to every call's contents
+        self.cached_contents = list(cached_contents or [])
+        self.delay = float(os.getenv("AUTOGRADER_FAKE_MODEL_DELAY", "0")) if delay is None else delay
+        self.score = score
+        self.malformed = float(os.getenv("AUTOGRADER_FAKE_MODEL_MALFORMED", "0")) if malformed is None else malformed
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        contents = self.cached_contents + list(contents)
+        corrupt = self.malformed and self.random.random() < self.malformed
+        if generation_config and generation_config.get("response_schema"):
+            schema = generation_config["response_schema"]
+            if schema.get("type", "").upper() == "ARRAY":
+                image_count = sum(1 for part in contents if not isinstance(part, str))
+                value = [dict(self._from_schema(schema["items"]), image_index=i + 1) for i in range(image_count)]
+            else:
+                value = self._from_schema(schema)
+            return FakeResponse(self._corrupt_json(value) if corrupt else json.dumps(value))
+        prompt = "\n".join(part for part in contents if isinstance(part, str))
+        if "RUBRIC CRITERIA" in prompt:
+            text = self._rubric_response()
+            if corrupt:
+                # Free-form failure: some scores and the summary table go missing
+                text = re.sub(r"Score: \d/5", lambda m: m.group() if self.random.random() < 0.5 else "Score: N/A",
+                              text.split("\nSummary Table")[0])
+            return FakeResponse(text)
+        if "JSON array" in prompt:
+            image_count = sum(1 for part in contents if not isinstance(part, str))
+            return FakeResponse(json.dumps([
+                dict(self._image_verdict(), image_index=i + 1) for i in range(image_count)
+            ]))
+        if "JSON format" in prompt:
+            return FakeResponse(json.dumps(self._image_verdict()))
+        return FakeResponse("Fake feedback: consider adding captions with sources to every image.")
+
+    def _from_schema(self, schema):
+        kind = schema.get("type", "").upper()
+        if kind == "OBJECT":
+            return {name: self._from_schema(child) for name, child in schema.get("properties", {}).items()}
+        if kind == "INTEGER":
+            # "Score from 1 to 5" / "Relevance from 0 to 10": scaled to the fake score out of 5
+            top = re.search(r"to (\d+)", schema.get("description", ""))
+            return round(self.score * int(top.group(1)) / 5) if top else self.score
+        if kind == "BOOLEAN":
+            return True
+        return "Fake evaluation of your work."
+
+    def _corrupt_json(self, value):
+        mode = self.random.choice(["truncate", "drop", "bad_value", "prose"])
+        if mode == "prose":
+            return f"Here is the evaluation:\n```json\n{json.dumps(value, indent=2)}\n```\nLet me know if you need more."
+        if isinstance(value, dict) and mode in ("drop", "bad_value"):
+            names = self.random.sample(sorted(value), max(1, len(value) // 3))
+            for name in names:
+                if mode == "drop":
+                    del value[name]
+                else:
+                    value[name] = "N/A"
+            return json.dumps(value)
+        text = json.dumps(value)
+        return text[:self.random.randint(1, max(1, len(text) - 1))]
+
+    def _image_verdict(self):
+        return {
+            "building_detected": "Unknown",
+            "interior_or_exterior": "exterior",
+            "relevance_score": f"{self.score * 2}/10",
+            "justification": "Fake model verdict.",
+            "architectural_features_visible": True
+        }
+
+    def _rubric_response(self):
+        sections = [
+            f"**{category}**\nfeedback: Fake evaluation of your work.\nScore: {self.score}/5\n"
+            for category in FAKE_RUBRIC_CATEGORIES
+        ]
+        rows = "\n".join(f"| {category} | {self.score}/5 |" for category in FAKE_RUBRIC_CATEGORIES)
+        return "\n".join(sections) + "\nSummary Table\n| Criterion | Score |\n|---|---|\n" + rows + "\n"
@@ -0,0 +1,182 @@
+import os
+import json
+import bisect
+import threading
+from autograder_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SORT_COLUMNS
+
+# In-process index of submission summaries for the admin list view. It is built once
+# from the store, updated by save_submission, and catches rows written by other
+# processes (id > last seen) and JSON files dropped into the legacy folder (folder
+# mtime) on each refresh, so no request re-reads or re-parses unchanged data.
+
+
+class SubmissionSummary:
+    __slots__ = ("student_name", "student_pid", "architect_name", "timestamp", "grade", "score",
+                 "rubric_scores", "search_text")
+
+    def __init__(self, submission):
+        self.student_name = submission.get("student_name") or ""
+        self.student_pid = submission.get("student_pid") or ""
+        self.architect_name = submission.get("architect_name")
+        self.timestamp = submission.get("timestamp") or ""
+        self.grade = submission.get("grade") or ""
+        self.score = submission.get("score")
+        self.rubric_scores = submission.get("rubric_scores") or {}
+        self.search_text = f"{self.student_name}\n{self.student_pid}".lower()
+
+    @property
+    def key(self):
+        return (self.timestamp, self.student_pid)
+
+    def to_dict(self):
+        return {
+            "student_name": self.student_name,
+            "student_pid": self.student_pid,
+            "architect_name": self.architect_name,
+            "timestamp": self.timestamp,
+            "grade": self.grade,
+            "score": self.score,
+            "rubric_scores": self.rubric_scores
+        }
+
+
+class SubmissionIndex:
+    def __init__(self, store, watch_folder=None):
+        self.store = store
+        self.watch_folder = watch_folder
+        self._lock = threading.RLock()
+        self._by_key = {}
+        # Keys sorted by (timestamp, pid) ascending; newest-first reads walk backwards
+        self._order = []
+        self._by_architect = {}
+        self._by_grade_letter = {}
+        self._last_id = 0
+        self._folder_mtime = None
+        self._seen_files = set()
+        self.refresh()
+
+    def add(self, submission):
+        summary = SubmissionSummary(submission)
+        with self._lock:
+            key = summary.key
+            previous = self._by_key.get(key)
+            if previous is not None:
+                self._remove_secondary(previous)
+            else:
+                bisect.insort(self._order, key)
+            self._by_key[key] = summary
+            bisect.insort(self._by_architect.setdefault(summary.architect_name, []), key)
+            bisect.insort(self._by_grade_letter.setdefault(summary.grade[:1].upper(), []), key)
+
+    def _remove_secondary(self, summary):
+        for bucket in (self._by_architect.get(summary.architect_name, []),
+                       self._by_grade_letter.get(summary.grade[:1].upper(), [])):
+            position = bisect.bisect_left(bucket, summary.key)
+            if position < len(bucket) and bucket[position] == summary.key:
+                bucket.pop(position)
+
+    def refresh(self):
+        with self._lock:
+            self._scan_folder()
+            # Rows written by other workers/processes since we last looked, plus any the
+            # folder scan just imported (add() is keyed, so those are only replaced)
+            for row_id, submission in self.store.summaries_after(self._last_id):
+                self.add(submission)
+                self._last_id = max(self._last_id, row_id)
+
+    def _scan_folder(self):
+        if not self.watch_folder or not os.path.isdir(self.watch_folder):
+            return
+        # The directory mtime only moves when entries are added/removed/renamed
+        mtime = os.stat(self.watch_folder).st_mtime_ns
+        if mtime == self._folder_mtime:
+            return
+        self._folder_mtime = mtime
+        for entry in os.scandir(self.watch_folder):
+            if not entry.name.endswith(".json") or entry.name in self._seen_files:
+                continue
+            self._seen_files.add(entry.name)
+            # <pid>_<YYYYMMDD>_<HHMMSS>.json: skip files we already hold without parsing them
+            parts = entry.name[:-len(".json")].rsplit("_", 2)
+            if len(parts) == 3 and (f"{parts[1]}_{parts[2]}", parts[0]) in self._by_key:
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    submission = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {entry.name}: {e}")
+                continue
+            self.store.add(submission)
+            self.add(submission)
+
+    def architects(self):
+        with self._lock:
+            return sorted(name for name, keys in self._by_architect.items() if name and keys)
+
+    def query(self, page=1, limit=DEFAULT_PAGE_SIZE, grade=None, architect=None, q=None, sort="-timestamp"):
+        """Same contract as SubmissionStore.query, answered from memory."""
+        page = max(1, int(page))
+        limit = min(max(1, int(limit)), MAX_PAGE_SIZE)
+        self.refresh()
+        with self._lock:
+            # Start from the smallest pre-sorted bucket that satisfies one filter
+            candidates = self._order
+            covered = set()
+            if architect:
+                candidates = self._by_architect.get(architect, [])
+                covered = {"architect"}
+            if grade and len(self._by_grade_letter.get(grade[:1].upper(), [])) < len(candidates):
+                candidates = self._by_grade_letter.get(grade[:1].upper(), [])
+                covered = {"grade"} if len(grade) == 1 else set()
+            needle = q.lower() if q else None
+            grade_prefix = grade.upper() if grade else None
+
+            def matches(summary):
+                return ((not grade_prefix or summary.grade.upper().startswith(grade_prefix))
+                        and (not architect or summary.architect_name == architect)
+                        and (not needle or needle in summary.search_text))
+
+            offset = (page - 1) * limit
+            filters = {name for name, value in (("architect", architect), ("grade", grade), ("q", q)) if value}
+            if sort == "-timestamp" and filters <= covered:
+                # The bucket is exactly the result set: O(limit)
+                total = len(candidates)
+                end = max(total - offset, 0)
+                rows = [self._by_key[key] for key in reversed(candidates[max(end - limit, 0):end])]
+            elif sort == "-timestamp":
+                # Walk newest-first; only the requested page is materialised
+                total = 0
+                rows = []
+                for key in reversed(candidates):
+                    summary = self._by_key[key]
+                    if not matches(summary):
+                        continue
+                    if offset <= total < offset + limit:
+                        rows.append(summary)
+                    total += 1
+            else:
+                selected = [self._by_key[key] for key in candidates if matches(self._by_key[key])]
+                selected.sort(key=lambda summary: summary.timestamp, reverse=True)
+                selected.sort(key=_sort_key(sort), reverse=sort.startswith("-"))
+                total = len(selected)
+                rows = selected[offset:offset + limit]
+            return {
+                "submissions": [summary.to_dict() for summary in rows],
+                "total": total,
+                "page": page,
+                "limit": limit
+            }
+
+
+def _sort_key(sort):
+    sort_key = sort.lstrip("-")
+    if sort_key.startswith("rubric."):
+        criterion = sort_key[len("rubric."):]
+        return lambda summary: _nulls_first(summary.rubric_scores.get(criterion))
+    attribute = SORT_COLUMNS.get(sort_key, "timestamp")
+    return lambda summary: _nulls_first(getattr(summary, attribute))
+
+
+def _nulls_first(value):
+    # Mirrors SQLite ordering, where NULL sorts before every value
+    return (value is not None, value if value is not None else 0)
@@ -0,0 +1,131 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of grading jobs allowed to talk to Gemini at the same time. Everything
+# beyond this waits in the queue instead of pinning a Flask worker thread.
+MAX_CONCURRENT_JOBS = int(os.getenv("AUTOGRADER_MAX_CONCURRENT_JOBS", "4"))
+# Finished jobs are kept this long so clients can still poll for the result.
+JOB_TTL_SECONDS = int(os.getenv("AUTOGRADER_JOB_TTL_SECONDS", "3600"))
+
+
+class Job:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        # Ordered progress events for streaming; ids are 1-based and never reused
+        self.events = []
+        self._events_changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def emit(self, stage, data=None):
+        with self._events_changed:
+            self._append(stage, data)
+
+    def finish(self, status, data=None):
+        # The done/error event goes in before the status flips (finished is read without
+        # the lock), so a reader never sees a finished job whose terminal event isn't there yet
+        with self._events_changed:
+            self.finished_at = time.time()
+            self._append(status, data)
+            self.status = status
+
+    def _append(self, stage, data):
+        self.events.append({"id": len(self.events) + 1, "stage": stage, "data": data or {}, "time": time.time()})
+        self._events_changed.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """Events newer than last_id, waiting up to timeout for one if there are none yet."""
+        with self._events_changed:
+            if len(self.events) <= last_id and not self.finished and timeout:
+                self._events_changed.wait(timeout)
+            return self.events[last_id:]
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "error":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, ttl_seconds=JOB_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grading-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, with_events=False, **kwargs):
+        # with_events=True passes on_event=job.emit so fn can report progress
+        job = Job(uuid.uuid4().hex)
+        if with_events:
+            kwargs["on_event"] = job.emit
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job.emit("queued")
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job_id):
+        # 1-based position among jobs still waiting for a worker, 0 once started
+        with self._lock:
+            waiting = sorted((j for j in self._jobs.values() if j.status == "queued"), key=lambda j: j.created_at)
+        for position, job in enumerate(waiting, start=1):
+            if job.id == job_id:
+                return position
+        return 0
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"max_workers": self.max_workers, "jobs": counts}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        job.emit("running")
+        try:
+            job.result = fn(*args, **kwargs)
+            job.finish("done", job.result)
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.finish("error", {"error": job.error})
+        return job.result
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -2,6 +2,7 @@ __all__ = [
     "run_autograder_full",
     "extract_text_from_pdf",
     "extract_images_from_pdf",
+    "iter_images_from_pdf",
     "evaluate_images_with_gemini",
     "evaluate_image_structure_and_captions",
     "gemini_detailed_rubric_eval",
@@ -10,23 +11,43 @@ __all__ = [
 import os
 import re
 import json
-import fitz  
-from PIL import Image
+import hashlib
+import tempfile
 from io import BytesIO
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-import spacy
-import google.generativeai as genai
-from dotenv import load_dotenv
-from IPython.display import display, Markdown
-import matplotlib.pyplot as plt
-import pandas as pd
-from tqdm import tqdm
-nlp = spacy.load("en_core_web_sm")
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-text_model = genai.GenerativeModel("gemini-2.0-flash")
-vision_model = genai.GenerativeModel("gemini-2.0-flash")
+from autograder_pdf import ParsedSubmission
+from autograder_render import RenderStats, iter_page_parts, format_page_list
+from autograder_cache import response_cache, make_cache_key
+from autograder_ratelimit import generate_with_retry, TokenBudgetError
+from autograder_models import get_nlp, get_text_model, get_vision_model
+from autograder_rubric_parser import parse_rubric_response
+from autograder_structured import (
+    STRUCTURED_OUTPUT, STRUCTURED_VERSION, IMAGE_VERDICT_VALIDATORS, json_config, load_json, validate_object,
+    image_batch_schema, request_image_verdict, request_rubric_scores, structured_rubric_note,
+    format_structured_evaluation
+)
+from autograder_prompts import PromptTemplate, prefix_cache
+from autograder_prescore import (
+    PRESCORE_ENABLED, PRESCORE_CONFIDENCE, PRESCORE_VERSION, HIGH_RES_MIN_WIDTH, REFERENCES_HEADING,
+    detect_structure, find_biography_section, score_organization, score_biography, score_references, score_image_quality,
+    confident_signals, format_local_evaluation
+)
+
+# spaCy, genai, pandas and the notebook display helpers are loaded on first use
+# (see autograder_models / autograder_notebook), not at import time
+def __getattr__(name):
+    if name == "nlp":
+        return get_nlp()
+    if name == "text_model":
+        return get_text_model()
+    if name == "vision_model":
+        return get_vision_model()
+    if name == "generate_detailed_scorecard":
+        from autograder_notebook import generate_detailed_scorecard
+        return generate_detailed_scorecard
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 rubric = {
     "architect_chosen": 5,
     "doc_and_slides": 5,
@@ -56,70 +77,131 @@ rubric_descriptions = {
 }
 # pdf_path = "/Users/tanishqsingh/Desktop/XR_Lab/cogs160submisson1.pdf"
 def extract_text_from_pdf(pdf_path):
-    print(f" Extracting text from: {pdf_path}")
-    text = ""
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        text += page.get_text()
-    print(" Extracted text from PDF")
-    return text
-def extract_images_from_pdf(pdf_path, min_width=1200, save_folder="/Users/tanishqsingh/Desktop/XR_Lab/Extracted_images"):
-    print(f" Extracting images from: {pdf_path}")
-    doc = fitz.open(pdf_path)
-    os.makedirs(save_folder, exist_ok=True)
-    image_data = []
-    for page_index in range(len(doc)):
-        page = doc[page_index]
-        images = page.get_images(full=True)
-        for img_index, img in enumerate(images):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
+    with ParsedSubmission.opened(pdf_path) as submission:
+        print(f" Extracting text from: {submission.pdf_path}")
+        text = submission.text
+        print(" Extracted text from PDF")
+        return text
+def iter_images_from_pdf(pdf_path, min_width=1200, save_folder=None, decode=False, save=False):
+    """
+    One entry per distinct embedded image (repeated placements of the same xref are
+    listed under "pages"). By default "image" is a Gemini blob part holding the
+    original encoded bytes and the size comes from the PDF's image metadata, so
+    nothing is decoded or re-encoded; decode=True gives a PIL image instead.
+    Nothing is written to disk unless save_folder is given or save=True, which
+    writes into a fresh temp dir per call (returned in each entry's "path";
+    the caller removes it). Images are extracted and yielded one at a time; a
+    later placement of an already-yielded image only appends to its "pages".
+    """
+    with ParsedSubmission.opened(pdf_path) as submission:
+        if save and save_folder is None:
+            save_folder = tempfile.mkdtemp(prefix="autograder_images_")
+        if save_folder:
+            os.makedirs(save_folder, exist_ok=True)
+        by_xref = {}
+        for embedded in submission.iter_embedded_images():
+            page_number, img_index, xref = embedded["page"], embedded["index"], embedded["xref"]
+            if xref in by_xref:
+                by_xref[xref]["pages"].append(page_number)
+                continue
+            base_image = embedded["base_image"]
             image_bytes = base_image["image"]
-            img_pil = Image.open(BytesIO(image_bytes))
-            width, height = img_pil.size
-            img_pil.save(os.path.join(save_folder, f"page{page_index+1}_img{img_index+1}.png"))
-            image_data.append({
-                "page": page_index + 1,
+            width, height = base_image["width"], base_image["height"]
+            filename = f"page{page_number}_img{img_index}.{base_image['ext']}"
+            if decode:
+                from PIL import Image
+                image = Image.open(BytesIO(image_bytes))
+            else:
+                image = submission.image_blob(xref, base_image)
+            entry = {
+                "page": page_number,
+                "pages": [page_number],
+                "xref": xref,
                 "width": width,
                 "height": height,
-                "coordinates": img[1:5],
-                "image": img_pil,
-                "filename": f"page{page_index+1}_img{img_index+1}.png",
+                "coordinates": embedded["info"][1:5],
+                "image": image,
+                "filename": filename,
+                "sha256": hashlib.sha256(image_bytes).hexdigest(),
                 "is_high_res": width >= min_width
-            })
-    print(f" Extracted {len(image_data)} images")
-    return image_data
-def get_caption_candidates(text, image_data):
+            }
+            if save_folder:
+                entry["path"] = os.path.join(save_folder, filename)
+                with open(entry["path"], "wb") as f:
+                    f.write(image_bytes)
+            by_xref[xref] = entry
+            yield entry
+def extract_images_from_pdf(pdf_path, min_width=1200, save_folder=None, decode=False, save=False):
+    with ParsedSubmission.opened(pdf_path) as submission:
+        print(f" Extracting images from: {submission.pdf_path}")
+        image_data = list(iter_images_from_pdf(submission, min_width, save_folder, decode, save))
+        print(f" Extracted {len(image_data)} images")
+        return image_data
+# Captions sit just below (or, less often, above) their image; blocks further away
+# than this, or longer than a caption plausibly is, aren't considered
+CAPTION_MAX_DISTANCE = 72  # points, one inch
+CAPTION_MAX_CHARS = 400
+
+def _caption_distance(image_rect, block_rect):
+    # Vertical gap when the block overlaps the image horizontally, otherwise the
+    # straight-line gap between the two boxes; text above is penalised slightly
+    dx = max(block_rect.x0 - image_rect.x1, image_rect.x0 - block_rect.x1, 0)
+    below = block_rect.y0 - image_rect.y1
+    above = image_rect.y0 - block_rect.y1
+    dy = max(below, above * 1.5, 0)
+    return dy if dx == 0 else (dx ** 2 + dy ** 2) ** 0.5
+
+def _caption_context(img, caption_text, distance=None):
+    lowered = caption_text.lower()
+    return {
+        "page": img["page"],
+        "image": img["filename"],
+        "matched_caption": caption_text,
+        "distance": distance,
+        "has_citation": any(x in lowered for x in ["source", "http", "photographer"]),
+        "has_building_name": bool(re.search(r"(building|tower|museum|villa|house|center)", caption_text, re.IGNORECASE)),
+        "has_interior_note": bool(re.search(r"(interior|lobby|hall|inside)", caption_text, re.IGNORECASE))
+    }
+
+def get_caption_candidates(text, image_data, pdf_path=None):
+    """
+    Matches each image with the nearest text block on its own page, using the page
+    layout (text block and image bounding boxes). Each page is looked at once, so the
+    cost grows with the document rather than images x lines. Without pdf_path (or an
+    xref per image), falls back to searching the text for the image's file name.
+    """
     print("Scanning for image captions...")
+    if pdf_path is None or any("xref" not in img for img in image_data):
+        return _caption_candidates_by_filename(text, image_data)
+
+    with ParsedSubmission.opened(pdf_path) as submission:
+        results = []
+        for img in image_data:
+            layout = submission.page_layout(img["page"] - 1)
+            best_text, best_distance = "", None
+            for image_rect in layout["image_rects"].get(img["xref"], []):
+                for block_rect, block_text in layout["text_blocks"]:
+                    if len(block_text) > CAPTION_MAX_CHARS or block_rect.intersects(image_rect):
+                        continue
+                    distance = _caption_distance(image_rect, block_rect)
+                    if distance <= CAPTION_MAX_DISTANCE and (best_distance is None or distance < best_distance):
+                        best_text, best_distance = block_text, distance
+            results.append(_caption_context(img, best_text, round(best_distance, 1) if best_distance is not None else None))
+        return results
+
+def _caption_candidates_by_filename(text, image_data):
     lines = text.split("\n")
     results = []
-
     for img in image_data:
-        context = {
-            "page": img["page"],
-            "image": img["filename"],
-            "matched_caption": "",
-            "has_citation": False,
-            "has_building_name": False,
-            "has_interior_note": False
-        }
+        context = _caption_context(img, "")
+        stem = img["filename"].split(".")[0]
         for i, line in enumerate(lines):
-            if f"{img['filename'].split('.')[0]}" in line:
-                nearby_lines = lines[max(i-2, 0): i+3]
-                caption_text = " ".join(nearby_lines)
-                context["matched_caption"] = caption_text
-                context["has_citation"] = any(x in caption_text.lower() for x in ["source", "http", "photographer"])
-                context["has_building_name"] = bool(re.search(r"(building|tower|museum|villa|house|center)", caption_text, re.IGNORECASE))
-                context["has_interior_note"] = bool(re.search(r"(interior|lobby|hall|inside)", caption_text, re.IGNORECASE))
+            if stem in line:
+                context = _caption_context(img, " ".join(lines[max(i-2, 0): i+3]))
                 break
         results.append(context)
     return results
-def evaluate_images_with_gemini(image_data, architect_name, debug=False):
-    print(" Evaluating image content and relevance using Gemini...")
-    enriched_image_feedback = []
-
-    for img in tqdm(image_data, desc="Evaluating images"):
-        prompt = f"""
+IMAGE_PROMPT_TEMPLATE = """
 You are reviewing an image submitted for a university architecture project about {architect_name}.
 Please analyze this image and answer:
 
@@ -137,36 +219,136 @@ Give your feedback in the following JSON format:
   "architectural_features_visible": true/false
 }}
 """
-        try:
-            response = vision_model.generate_content([img["image"], prompt])
+IMAGE_BATCH_PROMPT_TEMPLATE = """
+You are reviewing {image_count} images submitted for a university architecture project about {architect_name}.
+For EACH image, in the order given, answer:
+
+1. Does this image show a building designed by {architect_name}? If yes, specify the building.
+2. Is this an interior or exterior shot?
+3. Does this image clearly show architectural features (e.g., lighting, geometry, layout)?
+4. How relevant is this image for an academic project about {architect_name}?
+
+Reply with ONLY a JSON array containing exactly {image_count} objects, one per image, in this format:
+[
+  {{
+    "image_index": 1,
+    "building_detected": "...",
+    "interior_or_exterior": "...",
+    "relevance_score": "x/10",
+    "justification": "...",
+    "architectural_features_visible": true/false
+  }}
+]
+"""
+# Cached verdicts differ in shape and validation with structured output on or off,
+# so, as in RUBRIC_VERSION, the structured settings are part of the version
+IMAGE_PROMPT_VERSION = hashlib.sha256(
+    json.dumps([IMAGE_PROMPT_TEMPLATE, STRUCTURED_OUTPUT, STRUCTURED_VERSION]).encode()
+).hexdigest()[:16]
+IMAGE_BATCH_PROMPT_VERSION = hashlib.sha256(
+    json.dumps([IMAGE_BATCH_PROMPT_TEMPLATE, STRUCTURED_OUTPUT, STRUCTURED_VERSION]).encode()
+).hexdigest()[:16]
+# Concurrent image calls per submission; the shared token bucket still caps the rate
+IMAGE_EVAL_WORKERS = int(os.getenv("AUTOGRADER_IMAGE_EVAL_WORKERS", "8"))
+def image_content_hash(img):
+    # Hash of the embedded stream when we have it, else of the decoded pixels
+    if img.get("sha256"):
+        return img["sha256"]
+    image = img["image"]
+    return hashlib.sha256(image["data"] if isinstance(image, dict) else image.tobytes()).hexdigest()
+def strip_json_fences(text):
+    cleaned_text = text.strip()
+    if cleaned_text.startswith("```"):
+        cleaned_text = re.sub(r"```(?:json)?", "", cleaned_text)
+        cleaned_text = cleaned_text.replace("```", "").strip()
+    return cleaned_text
+IMAGE_VERDICT_FALLBACK = {
+    "building_detected": "Unknown",
+    "interior_or_exterior": "Unknown",
+    "relevance_score": "5/10",
+    "justification": "Could not parse feedback from Gemini.",
+    "architectural_features_visible": False
+}
+def ask_gemini_about_image(img, prompt, debug=False):
+    try:
+        if STRUCTURED_OUTPUT:
+            # Schema-constrained reply; fields that still fail after re-asks take the fallback
+            verdict, complete = request_image_verdict(get_vision_model(), [img["image"], prompt])
             if debug:
-                print(f"Image {img['filename']} feedback:\n", response.text)
-            cleaned_text = response.text.strip()
-            if cleaned_text.startswith("```"):
-                cleaned_text = re.sub(r"```(?:json)?", "", cleaned_text)
-                cleaned_text = cleaned_text.replace("```", "").strip()
-
-            try:
-                data = json.loads(cleaned_text)
-            except Exception as e:
-                print(f" Still failed to parse JSON from {img['filename']}: {e}")
-                data = {
-                    "building_detected": "Unknown",
-                    "interior_or_exterior": "Unknown",
-                    "relevance_score": "5/10",
-                    "justification": "Could not parse feedback from Gemini.",
-                    "architectural_features_visible": False
-                }
+                print(f"Image {img['filename']} feedback:\n", verdict)
+            return dict(IMAGE_VERDICT_FALLBACK, **verdict), complete
+        response = generate_with_retry(get_vision_model(), [img["image"], prompt], label="image")
+        if debug:
+            print(f"Image {img['filename']} feedback:\n", response.text)
+        cleaned_text = strip_json_fences(response.text)
+
+        try:
+            return json.loads(cleaned_text), True
         except Exception as e:
-            print(f"⚠️ Error processing {img['filename']}: {e}")
-            data = {
-                "building_detected": "Unknown",
-                "interior_or_exterior": "Unknown",
-                "relevance_score": "5/10",
-                "justification": "Could not extract structured feedback.",
-                "architectural_features_visible": False
-            }
+            print(f" Still failed to parse JSON from {img['filename']}: {e}")
+            return dict(IMAGE_VERDICT_FALLBACK), False
+    except Exception as e:
+        print(f"⚠️ Error processing {img['filename']}: {e}")
+        return dict(IMAGE_VERDICT_FALLBACK, justification="Could not extract structured feedback."), False
+def ask_gemini_about_images(imgs, architect_name, single_prompt, debug=False):
+    """
+    One multi-image call returning a JSON array. Any image the reply doesn't cover
+    (bad JSON, short array) falls back to its own single-image call.
+    """
+    prompt = IMAGE_BATCH_PROMPT_TEMPLATE.format(image_count=len(imgs), architect_name=architect_name)
+    verdicts = [None] * len(imgs)
+    try:
+        config = {"generation_config": json_config(image_batch_schema())} if STRUCTURED_OUTPUT else {}
+        response = generate_with_retry(get_vision_model(), [img["image"] for img in imgs] + [prompt], label="image_batch",
+                                       **config)
+        if debug:
+            print(f"Batch of {len(imgs)} images feedback:\n", response.text)
+        parsed = load_json(response.text) if STRUCTURED_OUTPUT else json.loads(strip_json_fences(response.text))
+        if isinstance(parsed, list):
+            for position, item in enumerate(parsed[:len(imgs)]):
+                if isinstance(item, dict):
+                    item.pop("image_index", None)
+                    if STRUCTURED_OUTPUT:
+                        # Only items that pass validation count; the rest get single calls
+                        item, missing = validate_object(item, IMAGE_VERDICT_VALIDATORS)
+                        if missing:
+                            continue
+                    verdicts[position] = (item, True)
+    except Exception as e:
+        print(f" Batch image evaluation failed, falling back to single calls: {e}")
+    return [verdict or ask_gemini_about_image(img, single_prompt, debug=debug) for img, verdict in zip(imgs, verdicts)]
+def evaluate_images_with_gemini(image_data, architect_name, debug=False, max_workers=IMAGE_EVAL_WORKERS, batch_size=1):
+    print(" Evaluating image content and relevance using Gemini...")
+    prompt = IMAGE_PROMPT_TEMPLATE.format(architect_name=architect_name)
+    prompt_version = IMAGE_BATCH_PROMPT_VERSION if batch_size > 1 else IMAGE_PROMPT_VERSION
+
+    # Unchanged images in a resubmission reuse their stored verdict
+    cache_keys = [
+        make_cache_key("image", image_content_hash(img), architect_name, get_vision_model().model_name, prompt_version)
+        for img in image_data
+    ]
+    verdicts = [response_cache.get(key, kind="image") for key in cache_keys]
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    batches = [pending[i:i + max(1, batch_size)] for i in range(0, len(pending), max(1, batch_size))]
+
+    def evaluate_batch(indices):
+        if len(indices) == 1:
+            return [ask_gemini_about_image(image_data[indices[0]], prompt, debug=debug)]
+        return ask_gemini_about_images([image_data[i] for i in indices], architect_name, prompt, debug=debug)
+
+    # map() keeps results in submission order however the calls finish
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        from tqdm import tqdm
+        results = tqdm(pool.map(evaluate_batch, batches), total=len(batches), desc="Evaluating images")
+        for indices, batch_results in zip(batches, results):
+            for i, (data, parsed) in zip(indices, batch_results):
+                if parsed:
+                    response_cache.put(cache_keys[i], data)
+                verdicts[i] = data
 
+    enriched_image_feedback = []
+    for img, data in zip(image_data, verdicts):
+        data = dict(data)
         data.update({
             "filename": img["filename"],
             "page": img["page"],
@@ -210,10 +392,7 @@ def evaluate_image_structure_and_captions(image_feedback, caption_context):
         "score": int((avg_score / 10) * rubric["image_citations"]),
         "details": per_image_feedback
     }
-def gemini_detailed_rubric_eval(text, architect_name, pdf_path):
-    print(" Gemini evaluating full rubric with explanations")
-
-    prompt = f"""
+RUBRIC_PROMPT_HEADER = """
 You are evaluating a student's architecture assignment on the architect {architect_name}.
 
 This is a formal submission for university credit. You are receiving the full document as **images**, so you can directly observe the formatting, embedded images, captions, structure, and layout.
@@ -250,157 +429,203 @@ Score: x/5
 
 ###  Categories and Rubric Anchors
 
-**1. Architect Selection & Scope**
+"""
+
+# (internal score key, category title, anchors). Categories scored locally by
+# autograder_prescore are left out of the prompt, and the rest renumbered.
+RUBRIC_CATEGORIES = [
+    ("architect_chosen", "Architect Selection & Scope", """
 - 5 = Clearly identifies one architect from Book Two, explicitly stated, on-topic
 - 4 = Identifies an architect from Book Two; minor details or justification may be lacking but overall meets the requirement.
 - 3 = Identifies an architect, but there are ambiguities in selection or misalignment with Book Two.
 - 1–2 = Architect unclear, off-topic, or not from Book Two
-
-**2. Organization & Document Setup**
+"""),
+    ("doc_and_slides", "Organization & Document Setup", """
 - 5 = Clear Table of Contents + labeled sections for bio, buildings, refs, student bio
 - 4 = includes most required sections; minor issues with headings or order but generally follows recommended structure.
 - 3 = includes sections but they are not clearly distinguished or organized, causing minor readability issues.
 - 1–2 =  is poorly organized; critical sections (e.g., biography, personal bio) are missing or very difficult to identify.
-
-**3. Biographical Content (750 words)**
+"""),
+    ("bio_750_words", "Biographical Content (750 words)", """
 - 5 = Contains a comprehensive 750-word biography that Covers who they are, achievements, education, significance, 1st building, typologies
 - 4 = Biography is approximately 750 words and covers the main topics; minor omissions or slight lack in depth may be present.
 - 3 = Biography is present but is underdeveloped (significant sections missing or less than 750 words) or lacks sufficient detail in one or more areas
 - 1–2 = Underdeveloped or below word count, missing major points
-
-**4. Citation of Architect Biography**
+"""),
+    ("bio_references", "Citation of Architect Biography", """
 - 5 = 5–10 academic references, correct APA formatting, includes DOIs and citation counts
 - 4 = Provides at least 5 references in APA format with minor formatting issues; most citations include DOIs and are appropriate.
 - 3 = Fewer than 5 academic references provided or multiple APA formatting errors; some references may not be entirely credible.
 - 1–2 = Few or no academic references, poor or irrelevant sources
-
-**5. Selection & Quality of Images**
+"""),
+    ("image_quality", "Selection & Quality of Images", """
 - 5 = 10 buildings, 3+ exterior + 5+ interior per building, high-res
 - 4 = Most of the 10 buildings include the required number of high-resolution images; images generally meet quality standards with a few exceptions.
 - 3 = Some buildings have insufficient or lower-quality images (e.g., missing interior images, resolution below recommended); overall image selection is uneven.
 - 1–2 = Many buildings missing images or poor quality
-
-**6. Image Citation & Attribution**
+"""),
+    ("image_citations", "Image Citation & Attribution", """
 - 5 = Every image has clear, consistent source or photographer citation
 - 4 = Most images are properly cited; a few minor citation errors or omissions exist.
 - 3 = Some images have citations while many do not; inconsistency in attribution is evident.
 - 1–2 = Citations mostly missing, inconsistent, or improperly formatted
-
-**7. Coverage of 10 Famous Buildings**
+"""),
+    ("10_buildings_with_images", "Coverage of 10 Famous Buildings", """
 - 5 = All 10 named + location + significance statement (1–2 sentences)
 - 4 = Covers all 10 buildings with essential details provided; however, some buildings may have less detailed significance statements or image suggestions might be less robust.
 - 3 = Details for fewer than 10 buildings or several entries lack adequate information (e.g., missing significance statements, incomplete image details).
 - 1–2 = Several missing or incomplete building descriptions
-
-**8. Image Relevance**
+"""),
+    ("image_relevance", "Image Relevance", """
 - 5 = All images relate directly to described buildings, match descriptions, show architectural value
 - 3–4 = Most images relevant, some generic or misaligned
 - 1–2 = Several images are off-topic or not associated with described buildings
-
-**9. Personal Bio & Photo**
+"""),
+    ("personal_bio_photo", "Personal Bio & Photo", """
 - 5 = Professional photo and bio (1–2 sentences), correctly placed after TOC
 - 3–4 = Present but minor formatting/image issues
 - 1–2 = Photo or bio is low quality, misplaced, or absent
-
-**10. Overall Completeness & Presentation**
+"""),
+    ("presentation_polish", "Overall Completeness & Presentation", """
 - 5 = Fully polished, clean layout, minimal repetition, suitable for web/publication
 - 4 = Overall work is solid with minor formatting or content issues; nearly all requirements are satisfied; presentation is clear.
 - 3 = Work meets basic requirements but has several issues with formatting, clarity, or content completeness; presentation lacks polish in certain areas.
 - 1–2 = Sloppy or rushed presentation; visual issues hurt readability
+"""),
+]
 
----
+RUBRIC_PROMPT_FOOTER = """---
 Give a table of all the scores with the criterion 
  Please start your rubric-based analysis below:
 """
 
-    doc = fitz.open(pdf_path)
-    all_pages_as_images = [page.get_pixmap(dpi=300).pil_tobytes("png") for page in doc]
+@lru_cache(maxsize=None)
+def rubric_prompt_template(skip=frozenset()):
+    # Compiled once per set of locally scored categories; only the architect varies
+    categories = [category for category in RUBRIC_CATEGORIES if category[0] not in skip]
+    anchors = "\n".join(
+        f"**{number}. {title}**{anchor}" for number, (_, title, anchor) in enumerate(categories, start=1)
+    )
+    prefix = RUBRIC_PROMPT_HEADER + anchors.replace("{", "{{").replace("}", "}}") + "\n" + RUBRIC_PROMPT_FOOTER
+    if STRUCTURED_OUTPUT:
+        note = structured_rubric_note([(key, title) for key, title, _ in categories])
+        prefix += note.replace("{", "{{").replace("}", "}}")
+    return PromptTemplate(prefix)
+
+def build_rubric_prompt(architect_name, skip=()):
+    return rubric_prompt_template(frozenset(skip)).render(architect_name=architect_name)
+
+# The full prompt, with every category sent to Gemini
+RUBRIC_PROMPT_TEMPLATE = rubric_prompt_template().text
+
+# Changes whenever the prompt or rubric changes; part of every result cache key
+RUBRIC_VERSION = hashlib.sha256(
+    json.dumps([RUBRIC_PROMPT_TEMPLATE, rubric, rubric_descriptions, PRESCORE_ENABLED, PRESCORE_CONFIDENCE,
+                PRESCORE_VERSION, STRUCTURED_OUTPUT, STRUCTURED_VERSION], sort_keys=True).encode()
+).hexdigest()[:16]
+# How much of the extracted text accompanies a sampled (degraded) document
+RUBRIC_DEGRADED_TEXT_CHARS = 60000
+def gemini_detailed_rubric_eval(text, architect_name, pdf_path, render_config=None, render_stats=None, on_event=None,
+                                skip=()):
+    print(" Gemini evaluating full rubric with explanations")
 
-    try:
-        response = vision_model.generate_content(
-             [prompt] + [Image.open(BytesIO(img_bytes)) for img_bytes in all_pages_as_images]
-        )
-    except Exception as e:
-        print(f"Gemini Vision rubric evaluation failed: {e}")
-        return {k: {"score": 0} for k in rubric.keys()}, ""  # Default to zeros to prevent crash
-
-    print(response.text)
-
-    def extract_score(label, out_of):
-        # Try multiple patterns to extract the score
-        patterns = [
-            rf"{label}.*?Score:\s*(\d+)/{out_of}",  # Standard format
-            rf"{label}.*?(\d+)/{out_of}",  # Just the score
-            rf"{label}.*?Score:\s*(\d+)",  # Score without denominator
-            rf"{label}.*?(\d+)\s*/\s*{out_of}"  # Score with spaces
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, response.text, re.IGNORECASE | re.DOTALL)
-            if match:
-                return int(match.group(1))
-        
-        # If not found in the main text, try to find it in the summary section
-        summary_match = re.search(r"\*\*FINAL SUMMARY\*\*.*?(?=\*\*OVERALL COMMENTS|\Z)", response.text, re.DOTALL | re.IGNORECASE)
-        if summary_match:
-            summary_text = summary_match.group(0)
-            for pattern in patterns:
-                match = re.search(pattern, summary_text, re.IGNORECASE | re.DOTALL)
-                if match:
-                    return int(match.group(1))
-        
-        return 0
-
-    scores = {
-        "architect_chosen": {"score": extract_score("Architect Selection", 5)},
-        "doc_and_slides": {"score": extract_score("Organization", 5)},
-        "bio_750_words": {"score": extract_score("Biographical Content", 5)},
-        "bio_structure": {"score": extract_score("Biographical Structure", 5)},
-        "bio_references": {"score": extract_score("Citation of Architect Biography", 5)},
-        "10_buildings_with_images": {"score": extract_score("Coverage of 10 Famous Buildings", 5)},
-        "image_quality": {"score": extract_score("Selection & Quality of Images", 5)},
-        "image_citations": {"score": extract_score("Image Citation & Attribution", 5)},
-        "image_relevance": {"score": extract_score("Image Relevance", 5)},
-        "personal_bio_photo": {"score": extract_score("Personal Bio", 5)},
-        "presentation_polish": {"score": extract_score("Overall Completeness", 5)},
-        "overall_completeness": {"score": extract_score("Overall Completeness", 5)}  # Add this for the admin interface
-    }
+    # Criteria in skip were scored locally and are left out of the prompt
+    prompt = build_rubric_prompt(architect_name, skip)
+
+    # Pages are rendered one at a time at an adaptive DPI and sent as encoded blobs,
+    # so no page is ever held as a decoded RGB raster next to the others; documents
+    # over the render budget are sampled (autograder_render.iter_page_parts)
+    if render_stats is None:
+        render_stats = RenderStats()
+    with ParsedSubmission.opened(pdf_path) as submission:
+        page_parts = list(iter_page_parts(submission, render_config, render_stats))
+    print(f" Rendered {render_stats.pages} pages: {render_stats.payload_bytes / 1024:.0f} KB payload, "
+          f"peak RSS {render_stats.peak_rss_mb:.0f} MB")
+    notes = []
+    if render_stats.degraded:
+        # Sampled document: say so, or Gemini will mark the missing pages as missing work
+        print(f" Degraded mode ({render_stats.degraded_reason}): sent pages {render_stats.sent_pages}")
+        notes.append(f"\nNote: this document has {render_stats.document_pages} pages, which is too large to send "
+                     f"in full, so you are seeing a sample of {render_stats.pages} of them (pages "
+                     f"{', '.join(map(str, render_stats.sent_pages))}). Do not deduct points for content that "
+                     f"may be on pages you cannot see; the extracted text below covers the whole document.\n"
+                     f"{text[:RUBRIC_DEGRADED_TEXT_CHARS]}")
+    if render_stats.text_pages or render_stats.blank_pages:
+        # Triage sent some pages as text or left them out; without this Gemini would
+        # read the missing images as missing work
+        print(f" Triage: {render_stats.pages} pages as images, {len(render_stats.text_pages)} as text, "
+              f"{len(render_stats.blank_pages)} blank pages dropped")
+        notes.append(f"\nNote: to keep this request small, only pages that need visual judgment are shown as "
+                     f"images. Pages {format_page_list(render_stats.text_pages) or 'none'} are given as their "
+                     f"extracted text, marked \"sent as extracted text\"; judge their content from that text and "
+                     f"do not deduct for layout or images you cannot see on them. Pages "
+                     f"{format_page_list(render_stats.blank_pages) or 'none'} are blank and were left out.\n")
+    # The prompt is the same for every submission on this architect, so it can live in
+    # the provider's context cache; otherwise it goes inline ahead of the pages
+    model = prefix_cache.model_for(get_vision_model(), prompt)
+    contents = ([] if model else [prompt]) + notes + page_parts
+    model = model or get_vision_model()
+    if on_event:
+        on_event("pages_rendered", render_stats.to_dict())
+
+    # Keyed on the rendered pages rather than the file bytes, so a re-exported PDF
+    # (new timestamps, same pages) still reuses the stored evaluation
+    page_hashes = [hashlib.sha256(part["data"] if isinstance(part, dict) else part.encode("utf-8")).hexdigest()
+                   for part in page_parts]
+    cache_key = make_cache_key(
+        "rubric_pages", *page_hashes, architect_name, get_vision_model().model_name, RUBRIC_VERSION,
+        *sorted(skip)
+    )
+    cached = response_cache.get(cache_key, kind="rubric_pages")
+    structured, missing = None, []
+    if cached is not None:
+        print(f" Reusing cached rubric evaluation for {len(page_hashes)} unchanged pages")
+        response_text = cached["text"]
+        structured = cached.get("structured")
+    elif STRUCTURED_OUTPUT:
+        categories = [(key, title) for key, title, _ in RUBRIC_CATEGORIES if key not in skip]
+        try:
+            # Invalid criteria are re-asked for from the text alone, not by re-sending the pages
+            structured, missing = request_rubric_scores(
+                model, contents, categories,
+                context=f"Extracted document text:\n{text[:RUBRIC_DEGRADED_TEXT_CHARS]}"
+            )
+        except TokenBudgetError:
+            raise
+        except Exception as e:
+            print(f"Gemini Vision rubric evaluation failed: {e}")
+            return {k: {"score": 0} for k in rubric.keys()}, ""  # Default to zeros to prevent crash
+        response_text = format_structured_evaluation(structured, categories)
+        if missing:
+            print(f" No valid score for {', '.join(missing)}; not caching this evaluation")
+        else:
+            response_cache.put(cache_key, {"text": response_text, "structured": structured})
+    else:
+        try:
+            response_text = generate_with_retry(model, contents, label="rubric").text
+        except TokenBudgetError:
+            raise
+        except Exception as e:
+            print(f"Gemini Vision rubric evaluation failed: {e}")
+            return {k: {"score": 0} for k in rubric.keys()}, ""  # Default to zeros to prevent crash
+        response_cache.put(cache_key, {"text": response_text})
+
+    print(response_text)
+
+    if structured is not None:
+        # Scores straight from the validated JSON; criteria without one score 0 as before
+        scores = {key: dict(structured.get(key, {"score": 0, "justification": ""})) for key in rubric}
+        scores["overall_completeness"] = dict(scores["presentation_polish"])
+        for key in missing:
+            scores[key]["missing"] = True
+    else:
+        # One pass over the response yields every criterion's score and its feedback
+        # (copied, since the parse is cached and callers may edit the dicts)
+        scores = {key: dict(value) for key, value in parse_rubric_response(response_text)["scores"].items()}
 
-    detailed_evaluation_text = response.text
+    detailed_evaluation_text = response_text
 
     return scores, detailed_evaluation_text
-def generate_detailed_scorecard(scores, image_caption_details=None):
-    print(" Compiling final scorecard")
-
-    # Total and max only for defined rubric keys
-    total = sum([scores[k]["score"] for k in scores if k in rubric])
-    max_total = sum([rubric[k] for k in scores if k in rubric])
-    final_percentage = (total / max_total) * 100 if max_total else 0
-
-    grade = "A" if final_percentage >= 50 else "B" if final_percentage >= 46 else "C" if final_percentage >= 42 else "D"
-
-    # print(f"Final Grade: {grade} ({round(final_percentage, 2)}%)")
-    rubric_table = pd.DataFrame([
-        {
-            "Criterion": k.replace("_", " ").title(),
-            "Score": scores[k]["score"],
-            "Max": rubric[k],
-            "Description": rubric_descriptions.get(k, "")
-        }
-        for k in rubric if k in scores
-    ])
-    display(rubric_table)
-    if image_caption_details:
-        print("\n Image Caption & Relevance Feedback:")
-        df = pd.DataFrame(image_caption_details["details"])
-        display(df)
-
-    return {
-        "rubric_scores": {k: scores[k]["score"] for k in rubric if k in scores},
-        "final_percent": round(final_percentage, 2),
-        "grade": grade,
-        "image_feedback_table": image_caption_details
-    }
 def extract_references_from_text(text):
     print(" Extracting references from text")
     lines = text.split("\n")
@@ -410,11 +635,26 @@ def extract_references_from_text(text):
             references.append(line.strip())
     return references
 
-def evaluate_biography(text):
+def count_alpha_words(text, full_parse=False):
+    """
+    Alphabetic tokens in text. is_alpha is a lexical attribute, so the tokenizer alone
+    gives the same count as the full pipeline; full_parse=True runs tagger/parser/NER
+    as before and is kept for comparison (see benchmark_biography.py).
+    """
+    nlp = get_nlp()
+    if full_parse:
+        return sum(1 for token in nlp(text) if token.is_alpha)
+    # Tokenize paragraph by paragraph so a long document never becomes one big Doc
+    paragraphs = [paragraph for paragraph in text.split("\n\n") if paragraph.strip()]
+    return sum(1 for doc in nlp.tokenizer.pipe(paragraphs) for token in doc if token.is_alpha)
+
+def evaluate_biography(text, full_parse=False):
     print(" Evaluating biography: checking word count and required sections")
     result = {}
-    doc = nlp(text)
-    result["word_count"] = len([token.text for token in doc if token.is_alpha])
+    start, end = find_biography_section(text)
+    bio_text = text[start:end]
+    result["section_found"] = (start, end) != (0, len(text))
+    result["word_count"] = count_alpha_words(bio_text, full_parse)
 
     required_sections = [
         "who they are",
@@ -426,7 +666,7 @@ def evaluate_biography(text):
         "first building"
     ]
 
-    section_hits = sum([1 for section in required_sections if section.lower() in text.lower()])
+    section_hits = sum([1 for section in required_sections if section.lower() in bio_text.lower()])
     result["structure_score"] = int((section_hits / len(required_sections)) * rubric["bio_structure"])
     result["score"] = rubric["bio_750_words"] if result["word_count"] >= 700 else int((result["word_count"] / 750) * rubric["bio_750_words"])
 
@@ -442,60 +682,52 @@ def evaluate_image_quality(image_data):
     print(f" {high_res_count}/{total_images} images are high resolution")
     return {"high_res_count": high_res_count, "score": quality_score}
 
-def run_autograder_full(pdf_path, architect_name="Bjarke Ingels", debug=False):
+def local_prescore(submission, text):
+    """Cheap, deterministic signals for the measurable criteria (see autograder_prescore)."""
+    print(" Pre-scoring measurable criteria locally")
+    # Whitespace splitting over-counts words, so it's enough to rule out a short document.
+    # The whole document is counted, not the detected bio section: a missed heading
+    # must not turn into a confident low score
+    document_words = len(text.split())
+    if document_words < 750:
+        document_words = count_alpha_words(text)
+    image_data = [
+        {"is_high_res": placement["width"] >= HIGH_RES_MIN_WIDTH}
+        for placement in submission.image_placements()
+    ]
+    image_quality = evaluate_image_quality(image_data)
+    return {
+        "doc_and_slides": score_organization(detect_structure(text)),
+        "bio_750_words": score_biography(document_words),
+        "bio_references": score_references(extract_references_from_text(text), bool(REFERENCES_HEADING.search(text))),
+        "image_quality": score_image_quality(len(image_data), image_quality["high_res_count"])
+    }
+
+def run_autograder_full(pdf_path, architect_name="Bjarke Ingels", debug=False, render_config=None, on_event=None):
     print("Starting full grading pipeline")
-    text = extract_text_from_pdf(pdf_path)
-    
-    # Get the scores and detailed evaluation from gemini_detailed_rubric_eval
-    gemini_scores, detailed_evaluation_text = gemini_detailed_rubric_eval(text, architect_name, pdf_path)
-    
-    # Extract summary scores from the detailed evaluation
-    summary_scores = {}
-    
-    # Look for the Summary Table in the response
-    # First, try to find the table section
-    table_section_pattern = r"(?:Summary Table|Here's a table summarizing the scores:|Here's a table summarizing your scores:).*?(?=\n\n|$)"
-    table_section_match = re.search(table_section_pattern, detailed_evaluation_text, re.DOTALL | re.IGNORECASE)
+    render_stats = RenderStats()
+    with ParsedSubmission.opened(pdf_path) as submission:
+        text = extract_text_from_pdf(submission)
+
+        # Clear-cut measurable criteria are scored here and never sent to Gemini
+        signals = local_prescore(submission, text) if PRESCORE_ENABLED else {}
+        local_scores = confident_signals(signals)
+        if local_scores:
+            print(f" Scored locally: {', '.join(local_scores)}")
+
+        # Get the scores and detailed evaluation from gemini_detailed_rubric_eval
+        gemini_scores, detailed_evaluation_text = gemini_detailed_rubric_eval(
+            text, architect_name, submission, render_config=render_config, render_stats=render_stats,
+            on_event=on_event, skip=set(local_scores)
+        )
+    # A failed call comes back as zeros with no text; checked before the local
+    # evaluation is appended below, which would make the text non-empty
+    rubric_failed = not detailed_evaluation_text.strip()
     
-    if table_section_match:
-        table_section = table_section_match.group(0)
-        print("Found Summary Table section, extracting scores...")
-        
-        # Extract all table rows
-        # This pattern matches lines with | Category | Score | format
-        table_rows = re.findall(r"\|\s*([^|]+)\s*\|\s*(\d+)/5\s*\|", table_section)
-        
-        if table_rows:
-            print(f"Found {len(table_rows)} score entries in the table")
-            
-            # Map table categories to our internal keys
-            category_mapping = {
-                "Architect Selection & Scope": "architect_chosen",
-                "Organization & Document Setup": "doc_and_slides",
-                "Biographical Content": "bio_750_words",
-                "Citation of Architect Biography": "bio_references",
-                "Selection & Quality of Images": "image_quality",
-                "Image Citation & Attribution": "image_citations",
-                "Coverage of 10 Famous Buildings": "10_buildings_with_images",
-                "Image Relevance": "image_relevance",
-                "Personal Bio & Photo": "personal_bio_photo",
-                "Overall Completeness & Presentation": "presentation_polish"
-            }
-            
-            # Process each row
-            for category, score in table_rows:
-                category = category.strip()
-                score = int(score)
-                print(f"Extracted: {category} = {score}/5")
-                
-                # Find the matching internal key
-                for table_category, internal_key in category_mapping.items():
-                    if table_category in category or category in table_category:
-                        summary_scores[internal_key] = score
-                        # Also set overall_completeness if it's the presentation score
-                        if internal_key == "presentation_polish":
-                            summary_scores["overall_completeness"] = score
-                        break
+    # The summary table comes from the same (cached) parse of the response
+    summary_scores = dict(parse_rubric_response(detailed_evaluation_text)["summary_scores"])
+    if summary_scores:
+        print(f"Found Summary Table section with {len(summary_scores)} score entries")
     
     # Use summary scores if available, otherwise fall back to extracted scores
     if summary_scores:
@@ -504,6 +736,13 @@ def run_autograder_full(pdf_path, architect_name="Bjarke Ingels", debug=False):
     else:
         print("Using extracted scores for grade calculation")
         scores_to_use = {k: v["score"] for k, v in gemini_scores.items()}
+
+    if local_scores:
+        for key, signal in local_scores.items():
+            scores_to_use[key] = signal["score"]
+        titles = {key: title for key, title, _ in RUBRIC_CATEGORIES}
+        detailed_evaluation_text = (detailed_evaluation_text + "\n\n" +
+                                    format_local_evaluation(local_scores, titles)).strip()
     
     # Calculate total score out of 50 (10 criteria × 5 points each)
     total = sum(scores_to_use.values())
@@ -547,7 +786,13 @@ def run_autograder_full(pdf_path, architect_name="Bjarke Ingels", debug=False):
         "rubric_scores": scores_to_use,
         "final_percent": final_percent,
         "grade": grade,
-        "detailed_evaluation": detailed_evaluation_text
+        "detailed_evaluation": detailed_evaluation_text,
+        "render_stats": render_stats.to_dict(),
+        "prescore": signals,
+        "rubric_failed": rubric_failed,
+        # Criteria the model never returned a valid score for (structured mode); scored 0
+        "incomplete_criteria": [key for key, value in gemini_scores.items()
+                                if value.get("missing") and key not in local_scores]
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import os
+import threading
+
+# One place that owns the heavy, slow-to-load model objects. Nothing here is
+# imported or created until a grading stage first asks for it, so importing the
+# backend (every gunicorn / job worker) stays cheap, and all modules share one
+# spaCy pipeline and one configured genai client.
+MODEL_NAME = os.getenv("AUTOGRADER_MODEL", "gemini-2.0-flash")
+SPACY_MODEL = os.getenv("AUTOGRADER_SPACY_MODEL", "en_core_web_sm")
+
+# _lock only guards the registry dicts. Each object loads under its own lock, so a
+# slow spaCy or embedding model load (possibly a download) doesn't stall get_model()
+# on the other job threads.
+_lock = threading.Lock()
+_load_locks = {}
+_models = {}
+_nlp = None
+_embedder = None
+_genai_configured = False
+
+
+def _load_lock(key):
+    with _lock:
+        return _load_locks.setdefault(key, threading.Lock())
+
+
+def use_fake_model():
+    # Read per call, so scripts and tests can switch it on after import
+    return os.getenv("AUTOGRADER_FAKE_MODEL", "0") == "1"
+
+
+def _configure_genai():
+    global _genai_configured
+    import google.generativeai as genai
+    if not _genai_configured:
+        with _load_lock("genai"):
+            if not _genai_configured:
+                from dotenv import load_dotenv
+                load_dotenv()
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai_configured = True
+    return genai
+
+
+def get_model(name=MODEL_NAME):
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _load_lock(("model", name)):
+        if name not in _models:
+            if use_fake_model():
+                from autograder_fake_model import FakeGenerativeModel
+                model = FakeGenerativeModel(name)
+            else:
+                model = _configure_genai().GenerativeModel(name)
+            with _lock:
+                _models.setdefault(name, model)
+        return _models[name]
+
+
+def register_model(model, name=MODEL_NAME):
+    """Install a model object (e.g. a FakeGenerativeModel) for every stage to use."""
+    with _lock:
+        _models[name] = model
+
+
+def get_cached_model(name, contents, ttl_seconds):
+    """A model whose context already holds contents, via Gemini context caching."""
+    if use_fake_model():
+        from autograder_fake_model import FakeGenerativeModel
+        return FakeGenerativeModel(name, cached_contents=contents)
+    import datetime
+    genai = _configure_genai()
+    cache = genai.caching.CachedContent.create(
+        model=name, contents=contents, ttl=datetime.timedelta(seconds=ttl_seconds)
+    )
+    return genai.GenerativeModel.from_cached_content(cached_content=cache)
+
+
+def get_text_model():
+    return get_model(MODEL_NAME)
+
+
+def get_vision_model():
+    # Same Gemini model serves both; kept separate so they can diverge via config
+    return get_model(MODEL_NAME)
+
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _load_lock("nlp"):
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL)
+    return _nlp
+
+
+def get_embedder():
+    # sentence-transformers when installed, else the NumPy hashed n-gram fallback
+    global _embedder
+    if _embedder is None:
+        with _load_lock("embedder"):
+            if _embedder is None:
+                from autograder_semantic import create_embedder
+                _embedder = create_embedder()
+    return _embedder
@@ -0,0 +1,38 @@
+from IPython.display import display
+import pandas as pd
+from autograder_logic import rubric, rubric_descriptions
+
+# Notebook-only helpers: they render tables with IPython.display, so they live here
+# instead of weighing down every server process that imports autograder_logic.
+def generate_detailed_scorecard(scores, image_caption_details=None):
+    print(" Compiling final scorecard")
+
+    # Total and max only for defined rubric keys
+    total = sum([scores[k]["score"] for k in scores if k in rubric])
+    max_total = sum([rubric[k] for k in scores if k in rubric])
+    final_percentage = (total / max_total) * 100 if max_total else 0
+
+    grade = "A" if final_percentage >= 50 else "B" if final_percentage >= 46 else "C" if final_percentage >= 42 else "D"
+
+    # print(f"Final Grade: {grade} ({round(final_percentage, 2)}%)")
+    rubric_table = pd.DataFrame([
+        {
+            "Criterion": k.replace("_", " ").title(),
+            "Score": scores[k]["score"],
+            "Max": rubric[k],
+            "Description": rubric_descriptions.get(k, "")
+        }
+        for k in rubric if k in scores
+    ])
+    display(rubric_table)
+    if image_caption_details:
+        print("\n Image Caption & Relevance Feedback:")
+        df = pd.DataFrame(image_caption_details["details"])
+        display(df)
+
+    return {
+        "rubric_scores": {k: scores[k]["score"] for k in rubric if k in scores},
+        "final_percent": round(final_percentage, 2),
+        "grade": grade,
+        "image_feedback_table": image_caption_details
+    }
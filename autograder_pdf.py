@@ -0,0 +1,283 @@
+import os
+import hashlib
+import threading
+import contextlib
+import fitz
+from autograder_render import RenderConfig, render_fitz_page
+from autograder_render_pool import render_pool
+
+# MuPDF is not thread-safe, and the pipeline now reads the same document from the
+# rubric thread and the factor thread at once, so every fitz call goes through here.
+FITZ_LOCK = threading.RLock()
+
+# Upload limits, checked before a grading job is queued
+MAX_UPLOAD_MB = int(os.getenv("AUTOGRADER_MAX_UPLOAD_MB", "200"))
+MAX_PDF_PAGES = int(os.getenv("AUTOGRADER_MAX_PDF_PAGES", "400"))
+
+# Embedded image formats Gemini takes as-is; anything else (JPX, JBIG2, ...) is converted
+BLOB_MIME_TYPES = {"jpeg": "image/jpeg", "jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+
+class ParsedSubmission:
+    """
+    One opened PDF shared by every grading stage. The document is parsed once and
+    page text, page rasters, embedded images and metadata are cached on first use.
+    """
+
+    def __init__(self, pdf_path=None, pdf_bytes=None):
+        if pdf_path is None and pdf_bytes is None:
+            raise ValueError("ParsedSubmission needs a pdf_path or pdf_bytes")
+        self.pdf_path = pdf_path
+        # Kept so render pool workers can open their own copy of an in-memory upload
+        self.pdf_bytes = pdf_bytes if pdf_path is None else None
+        self._pdf_bytes_hash = hashlib.sha256(pdf_bytes).hexdigest() if pdf_bytes is not None else None
+        with FITZ_LOCK:
+            if pdf_bytes is not None:
+                self.doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            else:
+                self.doc = fitz.open(pdf_path)
+        self._page_text = {}
+        self._text = None
+        self._rasters = {}
+        self._page_image_counts = {}
+        self._images = None
+        self._placements = None
+        self._blobs = {}
+        self._layouts = {}
+        self._profiles = {}
+        self._metadata = None
+
+    @classmethod
+    @contextlib.contextmanager
+    def opened(cls, source):
+        # Stages accept either a ParsedSubmission or a plain path (notebooks, /grade).
+        # A path is opened here and closed at the end of the with block; a submission
+        # the caller passed in stays open for the caller's other stages
+        if isinstance(source, cls):
+            yield source
+        else:
+            with cls(source) as submission:
+                yield submission
+
+    @property
+    def content_hash(self):
+        # SHA-256 of the uploaded bytes, the identity used by the result cache
+        if self._pdf_bytes_hash is None:
+            digest = hashlib.sha256()
+            with open(self.pdf_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._pdf_bytes_hash = digest.hexdigest()
+        return self._pdf_bytes_hash
+
+    @property
+    def page_count(self):
+        return self.doc.page_count
+
+    def page_text(self, index):
+        if index not in self._page_text:
+            with FITZ_LOCK:
+                self._page_text[index] = self.doc[index].get_text()
+        return self._page_text[index]
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "".join(self.page_text(i) for i in range(self.page_count))
+        return self._text
+
+    def page_image_count(self, index):
+        if index not in self._page_image_counts:
+            with FITZ_LOCK:
+                self._page_image_counts[index] = len(self.doc[index].get_images())
+        return self._page_image_counts[index]
+
+    def page_profile(self, index):
+        """
+        Cheap facts for page triage: {"chars", "images", "image_coverage", "area_sq_in"}.
+        image_coverage is the fraction of the page covered by image placements (overlaps
+        counted twice, capped at 1). Nothing is rendered or decoded.
+        """
+        if index not in self._profiles:
+            chars = len(self.page_text(index).strip())
+            with FITZ_LOCK:
+                page = self.doc[index]
+                area = abs(page.rect)
+                covered = 0.0
+                images = page.get_images(full=True)
+                for img in images:
+                    for rect in page.get_image_rects(img[0]):
+                        covered += abs(rect & page.rect)
+            self._profiles[index] = {
+                "chars": chars,
+                "images": len(images),
+                "image_coverage": min(covered / area, 1.0) if area else 0.0,
+                "area_sq_in": area / (72 * 72)
+            }
+        return self._profiles[index]
+
+    def render_page(self, index, config, has_images=True):
+        """
+        Rasterises one page with the DPI/format from a RenderConfig and returns
+        (encoded bytes, pixel count). Nothing is cached, so callers can stream.
+        """
+        with FITZ_LOCK:
+            return render_fitz_page(self.doc[index], config, has_images)
+
+    def page_raster(self, index, config=None):
+        config = config or RenderConfig()
+        key = (index, config.dpi, config.text_page_dpi, config.max_edge, config.image_format, config.quality)
+        if key not in self._rasters:
+            self._rasters[key] = self.render_page(index, config, self.page_image_count(index) > 0)[0]
+        return self._rasters[key]
+
+    def image_placements(self):
+        """
+        One dict per image placement (page, index on page, xref, width, height, raw
+        get_images() tuple), read from the page resources without extracting any
+        image data.
+        """
+        if self._placements is None:
+            placements = []
+            with FITZ_LOCK:
+                for page_index in range(self.page_count):
+                    for img_index, img in enumerate(self.doc[page_index].get_images(full=True)):
+                        placements.append({
+                            "page": page_index + 1,
+                            "index": img_index + 1,
+                            "xref": img[0],
+                            "width": img[2],
+                            "height": img[3],
+                            "info": img
+                        })
+            self._placements = placements
+        return self._placements
+
+    def iter_embedded_images(self):
+        """
+        Yields image placements with "base_image" (the extract_image() result) added,
+        extracting a few pages ahead at most so a large portfolio is never all in
+        memory; big documents are extracted on the render pool. A repeated placement
+        of an already-yielded xref gets base_image None.
+        """
+        seen = set()
+        placements = self.image_placements()
+        with render_pool.extract_images(self, placements) as extracted:
+            for placement in placements:
+                base_image = None
+                if placement["xref"] not in seen:
+                    seen.add(placement["xref"])
+                    base_image, blob = extracted.get(placement["xref"])
+                    if blob is not None:
+                        self._blobs[placement["xref"]] = blob
+                yield dict(placement, base_image=base_image)
+
+    def embedded_images(self):
+        """
+        Returns one dict per image placement: page, index on page, xref, the raw
+        get_images() tuple and the extract_image() result (original encoded bytes).
+        An image placed several times (a logo on every page) is extracted once.
+        Everything stays cached; use iter_embedded_images() to stream instead.
+        """
+        if self._images is None:
+            images = []
+            extracted = {}
+            for embedded in self.iter_embedded_images():
+                if embedded["base_image"] is not None:
+                    extracted[embedded["xref"]] = embedded["base_image"]
+                embedded["base_image"] = extracted[embedded["xref"]]
+                images.append(embedded)
+            self._images = images
+        return self._images
+
+    def image_blob(self, xref, base_image=None):
+        """
+        A Gemini blob part for an embedded image: the original stream when Gemini
+        accepts its format, otherwise a PNG re-encoded by MuPDF (no PIL decode).
+        """
+        if xref in self._blobs:
+            # Already converted by a render pool worker
+            return self._blobs.pop(xref)
+        with FITZ_LOCK:
+            if base_image is None:
+                base_image = self.doc.extract_image(xref)
+            return convert_image_blob(self.doc, xref, base_image)
+
+    def page_layout(self, index):
+        """
+        Text blocks and image placements of one page, in page coordinates (points):
+        {"text_blocks": [(fitz.Rect, text)], "image_rects": {xref: [fitz.Rect, ...]}}.
+        """
+        if index not in self._layouts:
+            with FITZ_LOCK:
+                page = self.doc[index]
+                text_blocks = []
+                for block in page.get_text("dict")["blocks"]:
+                    if block["type"] != 0:
+                        continue
+                    text = "\n".join(
+                        "".join(span["text"] for span in line["spans"]) for line in block["lines"]
+                    ).strip()
+                    if text:
+                        text_blocks.append((fitz.Rect(block["bbox"]), text))
+                image_rects = {img[0]: list(page.get_image_rects(img[0])) for img in page.get_images(full=True)}
+            self._layouts[index] = {"text_blocks": text_blocks, "image_rects": image_rects}
+        return self._layouts[index]
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            with FITZ_LOCK:
+                self._metadata = dict(self.doc.metadata or {})
+                self._metadata["page_count"] = self.doc.page_count
+        return self._metadata
+
+    def close(self):
+        with FITZ_LOCK:
+            self.doc.close()
+        self._rasters.clear()
+        self._images = None
+        self._placements = None
+        self._blobs.clear()
+        self._layouts.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_image_blob(doc, xref, base_image):
+    """Blob part for an extract_image() result, converting to PNG if Gemini can't take the original."""
+    ext = base_image["ext"].lower()
+    if ext in BLOB_MIME_TYPES:
+        return {"mime_type": BLOB_MIME_TYPES[ext], "data": base_image["image"]}
+    pix = fitz.Pixmap(doc, xref)
+    if pix.n - pix.alpha >= 4:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return {"mime_type": "image/png", "data": pix.tobytes("png")}
+
+
+class PdfLimitError(ValueError):
+    def __init__(self, message, status_code=413):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_pdf_limits(pdf_path, max_pages=MAX_PDF_PAGES):
+    """
+    Opens just enough of the file to count pages. Raises PdfLimitError if it isn't a
+    readable PDF or has more than max_pages pages; returns the page count otherwise.
+    """
+    try:
+        with FITZ_LOCK:
+            with fitz.open(pdf_path) as doc:
+                if not doc.is_pdf:
+                    raise PdfLimitError("Uploaded file is not a PDF.", 400)
+                page_count = doc.page_count
+    except (fitz.FileDataError, RuntimeError):
+        raise PdfLimitError("Could not read the PDF.", 400)
+    if page_count > max_pages:
+        raise PdfLimitError(f"PDF has {page_count} pages; the limit is {max_pages}.")
+    return page_count
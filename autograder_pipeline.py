@@ -0,0 +1,160 @@
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from autograder_logic import run_autograder_full, RUBRIC_VERSION
+from autograder_with_factors import run_autograder_with_factors, factors_version
+from autograder_models import get_text_model, get_vision_model
+from autograder_pdf import ParsedSubmission
+from autograder_cache import result_cache, make_cache_key
+from autograder_ratelimit import generate_with_retry, track_tokens
+from autograder_prompts import PromptTemplate
+
+# Per-submission execution plan:
+#
+#   rubric (vision) ──► feedback (needs final_percent / grade)
+#   factors + reflection ───────────────────────────────────────►
+#
+# The factor branch doesn't depend on the rubric, so it runs on this pool while the
+# calling thread does rubric -> feedback. Only the calling thread ever waits on a
+# future, so a shared pool can't deadlock however many jobs run at once.
+STAGE_WORKERS = int(os.getenv("AUTOGRADER_STAGE_WORKERS", "4"))
+_stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="grading-stage")
+
+
+FEEDBACK_PROMPT = PromptTemplate("""
+You are an instructor providing constructive feedback on a student's university architecture assignment.
+The student is {student_name} (PID: {student_pid}). The assignment is about the architect: {architect_name}.
+Their final score is {final_percent}% and grade is {grade}.
+
+Please ONLY give specific, actionable suggestions for improvement on their architecture submission.
+- Focus on the content, structure, images, citations, and clarity of their work.
+- Give concrete examples of what could be improved (e.g., "Instead of X, you could do Y").
+- Do NOT mention anything about programming, servers, databases, or unrelated technical topics.
+- Do NOT praise the student's scholarly effort.
+- Write in a friendly, undergraduate-appropriate tone.
+
+Begin your feedback below:
+""")
+
+
+def build_feedback_prompt(student_name, student_pid, architect_name, result):
+    return FEEDBACK_PROMPT.render(student_name=student_name, student_pid=student_pid, architect_name=architect_name,
+                                  final_percent=result['final_percent'], grade=result['grade'])
+
+
+def run_rubric_cached(submission, architect_name, on_event=None):
+    """run_autograder_full, reusing the stored result for identical PDF/architect/model/rubric."""
+    with ParsedSubmission.opened(submission) as submission:
+        key = make_cache_key("rubric", submission.content_hash, architect_name, get_vision_model().model_name, RUBRIC_VERSION)
+        cached = result_cache.get(key)
+        if cached is not None:
+            print(f"Result cache hit for rubric ({key[:12]})")
+            cached["cached"] = True
+            return cached
+        result = run_autograder_full(submission, architect_name=architect_name, debug=False, on_event=on_event)
+        # A failed vision call comes back as all zeros, and a structured reply can leave
+        # criteria unscored; don't pin either
+        if not result.get("rubric_failed") and not result.get("incomplete_criteria"):
+            result_cache.put(key, result)
+        result["cached"] = False
+        return result
+
+
+def run_factors_cached(submission, architect_name):
+    with ParsedSubmission.opened(submission) as submission:
+        key = make_cache_key("factors", submission.content_hash, architect_name, get_text_model().model_name, factors_version())
+        cached = result_cache.get(key)
+        if cached is not None:
+            print(f"Result cache hit for factors ({key[:12]})")
+            cached["cached"] = True
+            return cached
+        factor_result = run_autograder_with_factors(submission, architect_name)
+        result = {
+            "factor_table": factor_result["factor_table"].to_dict(orient="records"),
+            "reflection": factor_result["reflection"]
+        }
+        result_cache.put(key, result)
+        result["cached"] = False
+        return result
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    return fn(*args, **kwargs), round(time.perf_counter() - start, 2)
+
+
+def _no_events(stage, data=None):
+    pass
+
+
+def grade_pdf(filepath, student_name, student_pid, architect_name, on_event=None):
+    """
+    Grades one PDF. on_event(stage, data) is called as partial results become
+    available: parsed, pages_rendered, rubric_scored, feedback_ready, factors_ready.
+    """
+    emit = on_event or _no_events
+    start = time.perf_counter()
+    # Parse once; every stage below reads text/rasters from this shared object
+    submission = ParsedSubmission(filepath)
+    emit("parsed", {"pages": submission.page_count})
+
+    def factor_branch():
+        factor_result = run_factors_cached(submission, architect_name)
+        emit("factors_ready", {
+            "factor_table": factor_result["factor_table"],
+            "factor_reflection": factor_result["reflection"]
+        })
+        return factor_result
+
+    # Every Gemini call below counts against this submission's token ledger; the factor
+    # branch gets a copy of the context so its calls are counted too
+    with track_tokens() as tokens:
+        factor_future = _stage_executor.submit(contextvars.copy_context().run, _timed, factor_branch)
+        try:
+            result, rubric_seconds = _timed(run_rubric_cached, submission, architect_name, on_event=emit)
+            # Students see their score now rather than after feedback and reflection
+            emit("rubric_scored", {
+                "score": result["final_percent"],
+                "grade": result["grade"],
+                "rubric_scores": result["rubric_scores"],
+                "detailed_evaluation": result.get("detailed_evaluation", "")
+            })
+            feedback_prompt = build_feedback_prompt(student_name, student_pid, architect_name, result)
+            gemini_feedback, feedback_seconds = _timed(
+                lambda: generate_with_retry(get_text_model(), [feedback_prompt], label="feedback").text
+            )
+            emit("feedback_ready", {"feedback": gemini_feedback})
+
+            factor_result, factor_seconds = factor_future.result()
+        finally:
+            # The factor branch may still be reading the document if the rubric failed
+            wait([factor_future])
+            submission.close()
+    timings = {
+        "rubric": rubric_seconds,
+        "feedback": feedback_seconds,
+        "factors": factor_seconds,
+        "total": round(time.perf_counter() - start, 2)
+    }
+    token_usage = tokens.to_dict()
+    print(f"Pipeline finished in {timings['total']}s "
+          f"(rubric {rubric_seconds}s, feedback {feedback_seconds}s, factors {factor_seconds}s), "
+          f"{token_usage['input_tokens']} input tokens over {len(token_usage['calls'])} calls")
+
+    return {
+        "feedback": gemini_feedback,
+        "detailed_evaluation": result.get("detailed_evaluation", "No detailed evaluation available."),
+        "score": result["final_percent"],
+        "grade": result["grade"],
+        "rubric_scores": result["rubric_scores"],
+        "factor_table": factor_result["factor_table"],
+        "factor_reflection": factor_result["reflection"],
+        "timings": timings,
+        "render_stats": result.get("render_stats", {}),
+        "prescore": result.get("prescore", {}),
+        "incomplete_criteria": result.get("incomplete_criteria", []),
+        "rubric_failed": result.get("rubric_failed", False),
+        "tokens": token_usage,
+        "cached": {"rubric": result["cached"], "factors": factor_result["cached"]}
+    }
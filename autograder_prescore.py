@@ -0,0 +1,147 @@
+import os
+import re
+
+# Deterministic scores for rubric criteria that can be measured from the PDF itself.
+# Each rule returns a signal {"score", "confidence", "evidence"}; criteria whose
+# confidence reaches PRESCORE_CONFIDENCE are scored here and left out of the Gemini
+# prompt. Rules only claim confidence at the clear-cut ends of each criterion, and
+# anything in between still goes to Gemini.
+PRESCORE_ENABLED = os.getenv("AUTOGRADER_PRESCORE", "1") == "1"
+PRESCORE_CONFIDENCE = float(os.getenv("AUTOGRADER_PRESCORE_CONFIDENCE", "0.85"))
+# Bump when a rule changes; part of the rubric cache key
+PRESCORE_VERSION = "4"
+
+BIO_TARGET_WORDS = 750
+HIGH_RES_MIN_WIDTH = 1200
+# 10 buildings x (3 exterior + 5 interior) images for full marks
+IMAGES_REQUIRED = 80
+
+TOC_HEADING = re.compile(r"^\s*(table of contents|contents)\s*$", re.IGNORECASE | re.MULTILINE)
+REFERENCES_HEADING = re.compile(
+    r"^\s*(academic references|references|bibliography|works cited|sources)\s*:?\s*$", re.IGNORECASE | re.MULTILINE
+)
+
+
+def _heading(keywords, before=40, after=20):
+    # A short line that starts like a title (capital or number), so wrapped sentence
+    # lines that happen to contain the keyword don't count as headings
+    return re.compile(rf"^[ \t]*(?=[A-Z0-9])[^\n]{{0,{before}}}\b(?i:{keywords})\b[^\n]{{0,{after}}}$", re.MULTILINE)
+
+
+SECTION_HEADINGS = {
+    "architect background": _heading("background|biography"),
+    # Not "works": "Works Cited" is the references heading
+    "10 buildings": _heading("buildings|projects"),
+    "academic references": REFERENCES_HEADING,
+    "personal bio": _heading("personal bio|about me|about the author|student bio", before=20),
+}
+
+# Headings that end the biography: whatever section the document moves on to next
+BIOGRAPHY_END_HEADINGS = [SECTION_HEADINGS[name] for name in ("10 buildings", "academic references", "personal bio")]
+
+
+def find_biography_section(text):
+    """
+    (start, end) offsets of the architect biography, or (0, len(text)) if there is no
+    background/biography heading. The table of contents repeats the headings with
+    nothing between them, so the longest span after a heading is taken as the section.
+    """
+    best = None
+    for heading in SECTION_HEADINGS["architect background"].finditer(text):
+        start = heading.end()
+        end = min((match.start() for pattern in BIOGRAPHY_END_HEADINGS
+                   for match in [pattern.search(text, start)] if match), default=len(text))
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end)
+    return best or (0, len(text))
+
+
+def _signal(score, confidence, evidence):
+    return {"score": score, "confidence": confidence, "evidence": evidence}
+
+
+def _heading_lines(pattern, text):
+    # Offset of each matching heading's first character (REFERENCES_HEADING's \s* can
+    # start the match on a blank line above it)
+    return [match.start() + len(match.group()) - len(match.group().lstrip()) for match in pattern.finditer(text)]
+
+
+def detect_structure(text):
+    """
+    Required sections with a heading of their own: one heading line counts for at
+    most one section, so "Architect Background and Buildings" isn't two of them.
+    """
+    candidates = {name: _heading_lines(pattern, text) for name, pattern in SECTION_HEADINGS.items()}
+    owner = {}
+
+    def claim(name, seen):
+        # Take a free heading line, or one whose owner can move to another of its lines
+        for line in candidates[name]:
+            if line not in seen:
+                seen.add(line)
+                if line not in owner or claim(owner[line], seen):
+                    owner[line] = name
+                    return True
+        return False
+
+    found = [name for name in SECTION_HEADINGS if claim(name, set())]
+    return {"has_toc": bool(TOC_HEADING.search(text)), "sections": found}
+
+
+def score_organization(structure):
+    found, has_toc = structure["sections"], structure["has_toc"]
+    evidence = (f"Table of contents {'found' if has_toc else 'not found'}; "
+                f"{len(found)}/{len(SECTION_HEADINGS)} required section headings found"
+                + (f" ({', '.join(found)})" if found else ""))
+    if has_toc and len(found) == len(SECTION_HEADINGS):
+        return _signal(5, 0.9, evidence)
+    if not has_toc and len(found) <= 1:
+        return _signal(2, 0.9, evidence)
+    return _signal(4 if has_toc else 3, 0.5, evidence)
+
+
+def score_biography(document_words):
+    # The whole document's word count is an upper bound on the biography's, so only
+    # a short document is clear-cut; coverage of the bio topics needs a reader
+    evidence = f"The whole document has {document_words} words (biography target: {BIO_TARGET_WORDS})"
+    if document_words < BIO_TARGET_WORDS * 0.2:
+        return _signal(1, 0.95, evidence)
+    if document_words < BIO_TARGET_WORDS * 0.5:
+        return _signal(2, 0.9, evidence)
+    return _signal(4, 0.3, evidence)
+
+
+def score_references(references, has_references_heading):
+    with_doi = sum(1 for reference in references if "doi" in reference.lower())
+    evidence = (f"{len(references)} APA-style references detected ({with_doi} with DOIs); "
+                f"references heading {'found' if has_references_heading else 'not found'}")
+    if not references and not has_references_heading:
+        return _signal(1, 0.9, evidence)
+    if 5 <= len(references) <= 10 and with_doi == len(references):
+        return _signal(5, 0.6, evidence)
+    return _signal(3 if len(references) < 5 else 4, 0.5, evidence)
+
+
+def score_image_quality(image_count, high_res_count):
+    evidence = (f"{image_count} embedded images, {high_res_count} at least {HIGH_RES_MIN_WIDTH}px wide "
+                f"({IMAGES_REQUIRED} needed for 10 buildings)")
+    if image_count == 0:
+        return _signal(1, 0.95, evidence)
+    # A handful of images could still be few but excellent; only a reader can tell
+    if image_count < IMAGES_REQUIRED // 8:
+        return _signal(2, 0.5, evidence)
+    return _signal(min(5, 1 + round(4 * high_res_count / image_count)), 0.4, evidence)
+
+
+def confident_signals(signals, threshold=PRESCORE_CONFIDENCE):
+    return {key: signal for key, signal in signals.items() if signal["confidence"] >= threshold}
+
+
+def format_local_evaluation(local_scores, titles):
+    """Evaluation text for locally scored criteria, in the same shape Gemini writes."""
+    sections = []
+    for key, signal in local_scores.items():
+        sections.append(f"**{titles[key]}** (scored automatically)\n"
+                        f"feedback: {signal['evidence']}.\n"
+                        f"Score: {signal['score']}/5")
+    return "\n\n".join(sections)
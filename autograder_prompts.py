@@ -0,0 +1,87 @@
+import os
+import time
+import string
+import hashlib
+import threading
+from autograder_ratelimit import estimate_tokens
+
+# Prompt templates are split into literal text and fields once, when the module (and
+# so the rubric version) loads, rather than rebuilt for every submission. The long
+# static prompt prefix can also be held in Gemini's context cache, so each call only
+# sends what changes: the pages and the per-submission lines.
+CONTEXT_CACHE = os.getenv("AUTOGRADER_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("AUTOGRADER_CONTEXT_CACHE_TTL", "3600"))
+# Gemini won't cache less than this; shorter prefixes are sent inline
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("AUTOGRADER_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+
+class PromptTemplate:
+    """A str.format template, parsed once; render() only joins the pieces."""
+
+    def __init__(self, text):
+        self.text = text
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        self._pieces = list(string.Formatter().parse(text))
+        self.fields = {field for _, field, _, _ in self._pieces if field is not None}
+
+    def render(self, **values):
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt template needs {', '.join(sorted(missing))}")
+        rendered = []
+        for literal, field, spec, conversion in self._pieces:
+            rendered.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion == "r":
+                    value = repr(value)
+                rendered.append(format(value, spec or ""))
+        return "".join(rendered)
+
+
+class PrefixCache:
+    """
+    Models with a prompt prefix already in Gemini's context cache, one per distinct
+    (model, prefix) and renewed before the TTL runs out. model_for() returns None when
+    the prefix should just be sent inline: caching is off, the prefix is under the
+    provider minimum, or the provider/model doesn't support it.
+    """
+
+    def __init__(self, enabled=CONTEXT_CACHE, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+                 min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.hits = 0
+        self.created = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def model_for(self, model, prefix):
+        if not self.enabled or estimate_tokens(prefix) < self.min_tokens:
+            return None
+        model_name = getattr(model, "model_name", "")
+        key = hashlib.sha256(f"{model_name}\x1f{prefix}".encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            try:
+                from autograder_models import get_cached_model
+                cached_model = get_cached_model(model_name, [prefix], self.ttl_seconds)
+            except Exception as e:
+                print(f" Context caching unavailable ({e}); sending prompts inline")
+                self.enabled = False
+                return None
+            # Renew a minute early so a call never lands on an expired cache
+            self._entries[key] = (cached_model, time.monotonic() + max(self.ttl_seconds - 60, 0))
+            self.created += 1
+            return cached_model
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "entries": len(self._entries), "hits": self.hits, "created": self.created}
+
+
+prefix_cache = PrefixCache()
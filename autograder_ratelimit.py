@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from io import BytesIO
+
+# Shared client-side limits for every Gemini call in the process, sized to our quota.
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("AUTOGRADER_GEMINI_RPM", "60"))
+GEMINI_BURST = int(os.getenv("AUTOGRADER_GEMINI_BURST", "5"))
+GEMINI_MAX_RETRIES = int(os.getenv("AUTOGRADER_GEMINI_MAX_RETRIES", "4"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("AUTOGRADER_GEMINI_RETRY_BASE_DELAY", "1.0"))
+
+# Input-token cap for everything sent on behalf of one submission (0 = no cap).
+# Tokens are estimated before each call; "api" asks the model's count_tokens instead.
+MAX_INPUT_TOKENS_PER_SUBMISSION = int(os.getenv("AUTOGRADER_MAX_INPUT_TOKENS", "0"))
+TOKEN_COUNTING = os.getenv("AUTOGRADER_TOKEN_COUNTING", "estimate")  # estimate or api
+# Gemini bills an image as 258 tokens per 768px tile, or one tile if both edges are <= 384px
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_EDGE = 768
+CHARS_PER_TOKEN = 4
+
+# Rate limiting (429) and transient server errors are worth another try; 4xx are not
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available; returns how long the caller waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ApiUsage:
+    """Process-wide counters for Gemini traffic, read by the batch grader's throughput report."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, bytes_sent=0, retried=False, failed=False, input_tokens=0, output_tokens=0):
+        with self._lock:
+            self.calls += 1
+            self.retries += int(retried)
+            self.failures += int(failed)
+            self.bytes_sent += bytes_sent
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {"calls": self.calls, "retries": self.retries, "failures": self.failures,
+                    "bytes_sent": self.bytes_sent, "input_tokens": self.input_tokens,
+                    "output_tokens": self.output_tokens}
+
+
+class TokenBudgetError(Exception):
+    pass
+
+
+class TokenLedger:
+    """
+    Token counts for each Gemini call made for one submission, and the cap on their
+    input total. Installed for the current context by track_tokens().
+    """
+
+    def __init__(self, max_input_tokens=MAX_INPUT_TOKENS_PER_SUBMISSION):
+        self.max_input_tokens = max_input_tokens
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @property
+    def input_tokens(self):
+        return sum(call["input_tokens"] for call in self.calls)
+
+    def check(self, label, estimated_tokens):
+        with self._lock:
+            spent = self.input_tokens
+        if self.max_input_tokens and spent + estimated_tokens > self.max_input_tokens:
+            raise TokenBudgetError(
+                f"The {label} call needs about {estimated_tokens} input tokens, but this submission has used "
+                f"{spent} of its {self.max_input_tokens}-token budget."
+            )
+
+    def record(self, label, input_tokens, output_tokens, cached_tokens, estimated):
+        with self._lock:
+            self.calls.append({"label": label, "input_tokens": input_tokens, "output_tokens": output_tokens,
+                               "cached_tokens": cached_tokens, "estimated": estimated})
+
+    def to_dict(self):
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in calls),
+            "max_input_tokens": self.max_input_tokens,
+            "calls": calls
+        }
+
+
+_token_ledger = contextvars.ContextVar("token_ledger", default=None)
+
+
+@contextmanager
+def track_tokens(max_input_tokens=MAX_INPUT_TOKENS_PER_SUBMISSION):
+    """with track_tokens() as ledger: every call in this context (and contexts copied from it) is counted."""
+    ledger = TokenLedger(max_input_tokens)
+    token = _token_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _token_ledger.reset(token)
+
+
+def _parts(contents):
+    return contents if isinstance(contents, (list, tuple)) else [contents]
+
+
+def image_tokens(width, height):
+    if max(width, height) <= IMAGE_TILE_EDGE // 2:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE_EDGE) * math.ceil(height / IMAGE_TILE_EDGE) * IMAGE_TILE_TOKENS
+
+
+def estimate_tokens(contents):
+    """Input tokens for contents without an API call: ~4 characters per token, images by tile."""
+    total = 0
+    for part in _parts(contents):
+        if isinstance(part, str):
+            total += math.ceil(len(part) / CHARS_PER_TOKEN)
+        elif isinstance(part, dict) and "data" in part:
+            try:
+                from PIL import Image
+                # Only the header is read
+                total += image_tokens(*Image.open(BytesIO(part["data"])).size)
+            except Exception:
+                total += IMAGE_TILE_TOKENS
+        elif hasattr(part, "size") and hasattr(part, "mode"):
+            total += image_tokens(*part.size)
+    return total
+
+
+def count_input_tokens(model, contents):
+    if TOKEN_COUNTING == "api" and hasattr(model, "count_tokens"):
+        try:
+            return model.count_tokens(contents).total_tokens, False
+        except Exception as e:
+            print(f" count_tokens failed ({e}); estimating instead")
+    return estimate_tokens(contents), True
+
+
+def payload_bytes(contents):
+    # Request size as sent: prompt text in UTF-8 plus raw image/blob bytes
+    total = 0
+    for part in _parts(contents):
+        if isinstance(part, str):
+            total += len(part.encode("utf-8"))
+        elif isinstance(part, dict) and "data" in part:
+            total += len(part["data"])
+        elif hasattr(part, "size") and hasattr(part, "mode"):
+            # PIL image; the client uploads it re-encoded, so raw pixels is an upper bound
+            total += part.size[0] * part.size[1] * len(part.getbands())
+    return total
+
+
+gemini_rate_limiter = TokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60.0, GEMINI_BURST)
+api_usage = ApiUsage()
+
+
+def is_retryable(exc):
+    # google.api_core exceptions carry the HTTP status in .code
+    code = getattr(exc, "code", None)
+    if callable(code):
+        return False
+    return code in RETRYABLE_STATUS_CODES
+
+
+def generate_with_retry(model, contents, limiter=gemini_rate_limiter, max_retries=GEMINI_MAX_RETRIES,
+                        base_delay=GEMINI_RETRY_BASE_DELAY, label="gemini", **kwargs):
+    """
+    model.generate_content behind the shared token bucket, with jittered exponential
+    backoff. Input tokens are counted against the current submission's TokenLedger,
+    if any, before the call; label names the call in the ledger.
+    """
+    size = payload_bytes(contents)
+    ledger = _token_ledger.get()
+    input_tokens, estimated = count_input_tokens(model, contents)
+    if ledger is not None:
+        ledger.check(label, input_tokens)
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            response = model.generate_content(contents, **kwargs)
+        except Exception as e:
+            api_usage.record(size, retried=attempt > 0, failed=True)
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+            print(f" Gemini call failed ({e}); retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            continue
+        # The API reports what it actually billed; the estimate stands in when it doesn't
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None):
+            input_tokens, estimated = usage.prompt_token_count, False
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+        api_usage.record(size, retried=attempt > 0, input_tokens=input_tokens, output_tokens=output_tokens)
+        if ledger is not None:
+            ledger.record(label, input_tokens, output_tokens, cached_tokens, estimated)
+        return response
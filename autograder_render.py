@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+from io import BytesIO
+from autograder_render_pool import render_pool
+
+# Page rasterisation for the vision rubric call. Gemini downsamples large images
+# anyway, so rendering letter pages at 300 DPI PNG only costs RAM and upload time.
+RENDER_DPI = int(os.getenv("AUTOGRADER_RENDER_DPI", "150"))
+RENDER_TEXT_PAGE_DPI = int(os.getenv("AUTOGRADER_RENDER_TEXT_PAGE_DPI", "96"))
+RENDER_MAX_EDGE = int(os.getenv("AUTOGRADER_RENDER_MAX_EDGE", "2048"))
+RENDER_FORMAT = os.getenv("AUTOGRADER_RENDER_FORMAT", "jpeg")  # jpeg, webp or png
+RENDER_QUALITY = int(os.getenv("AUTOGRADER_RENDER_QUALITY", "80"))
+
+# Memory bounds for one rubric call. Past RENDER_MAX_PAGES, or once the encoded
+# payload is on track to exceed RENDER_MAX_PAYLOAD_MB, pages are sampled instead of
+# all being sent; rendering stops outright if the process passes the RSS ceiling.
+RENDER_MAX_PAGES = int(os.getenv("AUTOGRADER_RENDER_MAX_PAGES", "60"))
+RENDER_MAX_PAYLOAD_MB = float(os.getenv("AUTOGRADER_RENDER_MAX_PAYLOAD_MB", "40"))
+RENDER_MEMORY_CEILING_MB = float(os.getenv("AUTOGRADER_RENDER_MEMORY_CEILING_MB", "1536"))
+# Sampling always keeps the opening pages (title, table of contents, biography)
+RENDER_HEAD_PAGES = 6
+
+# Page triage: only pages that need visual judgment are rasterised. Mostly-text pages
+# (biography, bibliography) go as their extracted text, near-blank pages are dropped,
+# and at most RENDER_IMAGE_BUDGET pages per submission are sent as images; image
+# pages past the budget fall back to text. The opening pages are always shown, since
+# layout and the table of contents are graded.
+RENDER_TRIAGE = os.getenv("AUTOGRADER_RENDER_TRIAGE", "1") == "1"
+RENDER_IMAGE_BUDGET = int(os.getenv("AUTOGRADER_RENDER_IMAGE_BUDGET", "24"))
+TRIAGE_HEAD_PAGES = 2
+# Fraction of the page covered by images that makes it an image page
+TRIAGE_IMAGE_COVERAGE = float(os.getenv("AUTOGRADER_TRIAGE_IMAGE_COVERAGE", "0.15"))
+# Characters per square inch below which a page with images is judged on its images
+# (a full letter page of prose is ~30)
+TRIAGE_TEXT_DENSITY = float(os.getenv("AUTOGRADER_TRIAGE_TEXT_DENSITY", "5"))
+TRIAGE_BLANK_MAX_CHARS = 20
+TRIAGE_BLANK_MAX_COVERAGE = 0.01
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+
+class RenderConfig:
+    def __init__(self, dpi=RENDER_DPI, text_page_dpi=RENDER_TEXT_PAGE_DPI, max_edge=RENDER_MAX_EDGE,
+                 image_format=RENDER_FORMAT, quality=RENDER_QUALITY):
+        if image_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported render format: {image_format}")
+        self.dpi = dpi
+        self.text_page_dpi = text_page_dpi
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.image_format]
+
+    def page_dpi(self, width_pt, height_pt, has_images):
+        # Text-only pages stay legible at a lower DPI; the long edge is capped either way
+        dpi = self.dpi if has_images else min(self.dpi, self.text_page_dpi)
+        longest = max(width_pt, height_pt)
+        if longest and self.max_edge:
+            dpi = min(dpi, int(self.max_edge * 72 / longest))
+        return max(dpi, 36)
+
+
+class RenderStats:
+    def __init__(self):
+        self.pages = 0
+        self.text_only_pages = 0
+        self.payload_bytes = 0
+        self.raster_pixels = 0
+        self.peak_rss_mb = current_rss_mb()
+        self.seconds = 0.0
+        self.document_pages = 0
+        self.sent_pages = []
+        self.degraded_reason = None
+        self.text_pages = []
+        self.blank_pages = []
+        self.text_chars = 0
+        self.workers = 0
+
+    @property
+    def degraded(self):
+        return self.degraded_reason is not None
+
+    def record(self, payload_bytes, pixels, text_only, page_index=None):
+        self.pages += 1
+        if page_index is not None:
+            self.sent_pages.append(page_index + 1)
+        self.text_only_pages += int(text_only)
+        self.payload_bytes += payload_bytes
+        self.raster_pixels += pixels
+        self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+
+    def record_text(self, page_index, chars):
+        self.text_pages.append(page_index + 1)
+        self.text_chars += chars
+
+    def record_blank(self, page_index):
+        self.blank_pages.append(page_index + 1)
+
+    def to_dict(self):
+        return {
+            "pages": self.pages,
+            "text_only_pages": self.text_only_pages,
+            "payload_bytes": self.payload_bytes,
+            "raster_pixels": self.raster_pixels,
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "seconds": round(self.seconds, 2),
+            "document_pages": self.document_pages,
+            "degraded": self.degraded,
+            "degraded_reason": self.degraded_reason,
+            "sent_pages": self.sent_pages if self.degraded else None,
+            "text_pages": self.text_pages,
+            "blank_pages": self.blank_pages,
+            "text_chars": self.text_chars,
+            "workers": self.workers
+        }
+
+
+def current_rss_mb():
+    # /proc is exact and per-moment on Linux; elsewhere fall back to the process peak
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def encode_pixmap(pix, config):
+    if config.image_format == "png":
+        return pix.tobytes("png")
+    if config.image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=config.quality)
+    from PIL import Image
+    buffer = BytesIO()
+    Image.frombytes("RGB", (pix.width, pix.height), pix.samples).save(buffer, "WEBP", quality=config.quality)
+    return buffer.getvalue()
+
+
+def render_fitz_page(page, config, has_images=True):
+    """Rasterises one fitz page; returns (encoded bytes, pixel count)."""
+    dpi = config.page_dpi(page.rect.width, page.rect.height, has_images)
+    pix = page.get_pixmap(dpi=dpi)
+    data = encode_pixmap(pix, config)
+    pixels = pix.width * pix.height
+    del pix
+    return data, pixels
+
+
+def sample_pages(candidates, limit, head=RENDER_HEAD_PAGES):
+    """The first `head` candidates plus evenly spaced picks from the rest, `limit` in all."""
+    candidates = list(candidates)
+    if limit >= len(candidates):
+        return candidates
+    if limit <= 0:
+        return []
+    head = min(head, limit)
+    rest, remaining = candidates[head:], limit - head
+    if remaining == 0:
+        return candidates[:head]
+    step = len(rest) / remaining
+    return candidates[:head] + [rest[int(i * step)] for i in range(remaining)]
+
+
+def format_page_list(pages):
+    """[1, 2, 3, 7, 9, 10] -> "1-3, 7, 9-10"."""
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def classify_page(profile):
+    """"image", "text" or "blank" for a ParsedSubmission.page_profile()."""
+    density = profile["chars"] / profile["area_sq_in"] if profile["area_sq_in"] else 0.0
+    if profile["chars"] <= TRIAGE_BLANK_MAX_CHARS and profile["image_coverage"] < TRIAGE_BLANK_MAX_COVERAGE:
+        return "blank"
+    if profile["image_coverage"] >= TRIAGE_IMAGE_COVERAGE or (profile["images"] and density < TRIAGE_TEXT_DENSITY):
+        return "image"
+    return "text"
+
+
+def text_part(submission, index, stats):
+    text = submission.page_text(index).strip()
+    stats.record_text(index, len(text))
+    return f"[Page {index + 1}, sent as extracted text]\n{text}"
+
+
+def iter_page_parts(submission, config=None, stats=None, max_pages=RENDER_MAX_PAGES,
+                    max_payload_mb=RENDER_MAX_PAYLOAD_MB, memory_ceiling_mb=RENDER_MEMORY_CEILING_MB,
+                    triage=RENDER_TRIAGE, image_budget=RENDER_IMAGE_BUDGET):
+    """
+    Renders pages and yields Gemini parts. Only the encoded bytes outlive each
+    iteration; the raw pixmap is dropped before the next page renders. Large jobs
+    are rendered a few pages ahead on the render pool (autograder_render_pool).
+    With triage, parts come in page order: "[Page n]" then the image blob for pages
+    that need visual judgment, extracted text for the rest, nothing for blank pages.
+    Without it every page is rasterised, and documents over the page or payload
+    budget are sampled (see sample_pages) with the reason recorded on stats, so the
+    caller can tell Gemini it sees a subset.
+    """
+    config = config or RenderConfig()
+    stats = stats if stats is not None else RenderStats()
+    start = time.perf_counter()
+    stats.document_pages = submission.page_count
+    if triage:
+        # 0 means no limit for either
+        limits = [limit for limit in (max_pages, image_budget) if limit]
+        parts = _iter_triaged_parts(submission, config, stats, min(limits) if limits else submission.page_count,
+                                    max_payload_mb, memory_ceiling_mb)
+    else:
+        parts = _iter_sampled_parts(submission, config, stats, max_pages, max_payload_mb, memory_ceiling_mb)
+    yield from parts
+    stats.seconds += time.perf_counter() - start
+
+
+def _iter_sampled_parts(submission, config, stats, max_pages, max_payload_mb, memory_ceiling_mb):
+    max_payload_bytes = max_payload_mb * 1024 * 1024
+    pending = list(range(submission.page_count))
+    if max_pages and len(pending) > max_pages:
+        pending = sample_pages(pending, max_pages)
+        stats.degraded_reason = f"{submission.page_count} pages is over the {max_pages}-page limit"
+    has_images = {index: submission.page_image_count(index) > 0 for index in pending}
+    sent_bytes = 0
+    with render_pool.render_pages(submission, config, list(has_images.items())) as renders:
+        stats.workers = render_pool.effective_workers if renders.pooled else 0
+        while pending:
+            index = pending.pop(0)
+            if memory_ceiling_mb and current_rss_mb() > memory_ceiling_mb:
+                stats.degraded_reason = f"stopped at {memory_ceiling_mb:g} MB RSS ceiling"
+                break
+            data, pixels = renders.get(index)
+            stats.record(len(data), pixels, not has_images[index], index)
+            sent_bytes += len(data)
+            yield {"mime_type": config.mime_type, "data": data}
+            # Re-plan the rest from the average page size so far if it won't fit
+            average = sent_bytes / stats.pages
+            if pending and sent_bytes + average * len(pending) > max_payload_bytes:
+                affordable = max(int((max_payload_bytes - sent_bytes) // average), 0)
+                pending = sample_pages(pending, affordable, head=0)
+                stats.degraded_reason = f"payload budget of {max_payload_mb:g} MB"
+
+
+def _iter_triaged_parts(submission, config, stats, image_budget, max_payload_mb, memory_ceiling_mb):
+    max_payload_bytes = max_payload_mb * 1024 * 1024
+    kinds = [classify_page(submission.page_profile(index)) for index in range(submission.page_count)]
+    for index in range(min(TRIAGE_HEAD_PAGES, len(kinds))):
+        if kinds[index] != "blank":
+            kinds[index] = "image"
+    # Over budget, keep an even spread of image pages (opening pages first); the rest go as text
+    raster = set(sample_pages([index for index, kind in enumerate(kinds) if kind == "image"], image_budget,
+                              head=TRIAGE_HEAD_PAGES))
+    has_images = {index: submission.page_image_count(index) > 0 for index in sorted(raster)}
+    sent_bytes = 0
+    with render_pool.render_pages(submission, config, list(has_images.items())) as renders:
+        stats.workers = render_pool.effective_workers if renders.pooled else 0
+        for index, kind in enumerate(kinds):
+            if kind == "blank":
+                stats.record_blank(index)
+                continue
+            if index not in raster:
+                yield text_part(submission, index, stats)
+                continue
+            if memory_ceiling_mb and current_rss_mb() > memory_ceiling_mb:
+                # Out of memory for rasters, but the text of the remaining pages is still cheap
+                print(f" Past the {memory_ceiling_mb:g} MB RSS ceiling; sending the remaining pages as text")
+                raster.clear()
+                yield text_part(submission, index, stats)
+                continue
+            data, pixels = renders.get(index)
+            stats.record(len(data), pixels, not has_images[index], index)
+            sent_bytes += len(data)
+            yield f"[Page {index + 1}]"
+            yield {"mime_type": config.mime_type, "data": data}
+            # Re-plan the remaining rasters from the average page size so far if they won't fit
+            pending = sorted(page for page in raster if page > index)
+            average = sent_bytes / stats.pages
+            if pending and sent_bytes + average * len(pending) > max_payload_bytes:
+                affordable = max(int((max_payload_bytes - sent_bytes) // average), 0)
+                raster = {page for page in raster if page <= index} | set(sample_pages(pending, affordable, head=0))
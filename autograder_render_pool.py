@@ -0,0 +1,369 @@
+import os
+import math
+import threading
+from concurrent.futures import wait
+
+# Process pool for the CPU-bound PyMuPDF work: rasterising pages for the rubric call
+# and extracting embedded images. A fitz document can't be shared across threads
+# (every call in this process goes through FITZ_LOCK), so each worker opens its own
+# copy of the PDF and handles a short run of pages. Workers hand encoded buffers back
+# through shared memory rather than pickling them down the result pipe. Jobs under
+# RENDER_POOL_MIN_PAGES pages stay in-process, where they skip the hand-off.
+#
+# The default leaves one core for the web server and job threads; 0 turns the pool off.
+# Either way the pool is only used when at least two workers fit beside this process:
+# a single worker (or workers sharing this process's core) only adds the hand-off.
+RENDER_WORKERS = int(os.getenv("AUTOGRADER_RENDER_WORKERS", str(min(max((os.cpu_count() or 1) - 1, 0), 8))))
+RENDER_POOL_MIN_PAGES = int(os.getenv("AUTOGRADER_RENDER_POOL_MIN_PAGES", "8"))
+RENDER_POOL_CHUNK_PAGES = int(os.getenv("AUTOGRADER_RENDER_POOL_CHUNK_PAGES", "4"))
+RENDER_SHARED_MEMORY = os.getenv("AUTOGRADER_RENDER_SHARED_MEMORY", "1") == "1"
+
+
+def _open_document(source):
+    import fitz
+    if isinstance(source, str):
+        return fitz.open(source)
+    if isinstance(source, tuple):
+        from multiprocessing import shared_memory
+        name, size = source
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            data = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+        return fitz.open(stream=data, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _pack(buffers, use_shared_memory):
+    """Buffers -> (shared memory name, [(offset, length)]), or (None, buffers) without it."""
+    total = sum(len(buffer) for buffer in buffers)
+    if not use_shared_memory or not total:
+        return None, buffers
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=total)
+    except OSError:
+        # No /dev/shm (some containers); the pipe still works
+        return None, buffers
+    spans, offset = [], 0
+    for buffer in buffers:
+        shm.buf[offset:offset + len(buffer)] = buffer
+        spans.append((offset, len(buffer)))
+        offset += len(buffer)
+    name = shm.name
+    shm.close()
+    return name, spans
+
+
+def _render_chunk(source, pages, config, use_shared_memory):
+    """[(page index, has_images)] -> ([(index, pixel count, 1)], packed encoded pages)."""
+    from autograder_render import render_fitz_page
+    doc = _open_document(source)
+    items, buffers = [], []
+    try:
+        for index, has_images in pages:
+            data, pixels = render_fitz_page(doc[index], config, has_images)
+            items.append((index, pixels, 1))
+            buffers.append(data)
+    finally:
+        doc.close()
+    return items, _pack(buffers, use_shared_memory)
+
+
+def _extract_chunk(source, xrefs, use_shared_memory):
+    """
+    [xref] -> ([(xref, (base_image without "image", blob mime type), buffer count)], packed).
+    Each image contributes its original bytes, plus a PNG when Gemini can't take the
+    original format.
+    """
+    from autograder_pdf import BLOB_MIME_TYPES, convert_image_blob
+    doc = _open_document(source)
+    items, buffers = [], []
+    try:
+        for xref in xrefs:
+            base_image = doc.extract_image(xref)
+            image = base_image.pop("image")
+            buffers.append(image)
+            if base_image["ext"].lower() in BLOB_MIME_TYPES:
+                items.append((xref, (base_image, None), 1))
+            else:
+                blob = convert_image_blob(doc, xref, dict(base_image, image=image))
+                buffers.append(blob["data"])
+                items.append((xref, (base_image, blob["mime_type"]), 2))
+    finally:
+        doc.close()
+    return items, _pack(buffers, use_shared_memory)
+
+
+def _unpack(packed):
+    name, spans = packed
+    if name is None:
+        return spans
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return [bytes(shm.buf[offset:offset + length]) for offset, length in spans]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _release(future):
+    # A chunk nobody will read still owns a shared memory block
+    if not future.cancelled() and future.exception() is None:
+        name, _ = future.result()[1]
+        if name is not None:
+            _unpack(future.result()[1])
+
+
+def usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def split_runs(items, workers, max_run=RENDER_POOL_CHUNK_PAGES):
+    """Contiguous runs of items, about len/workers long and at most max_run."""
+    size = max(1, min(math.ceil(len(items) / max(workers, 1)), max_run or len(items)))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class _SharedSource:
+    """How workers reach the PDF: its path, or its bytes in one shared memory block."""
+
+    def __init__(self, submission, use_shared_memory):
+        self._shm = None
+        if submission.pdf_path is not None:
+            self.source = submission.pdf_path
+        elif use_shared_memory:
+            from multiprocessing import shared_memory
+            pdf_bytes = submission.pdf_bytes
+            self._shm = shared_memory.SharedMemory(create=True, size=max(len(pdf_bytes), 1))
+            self._shm.buf[:len(pdf_bytes)] = pdf_bytes
+            self.source = (self._shm.name, len(pdf_bytes))
+        else:
+            self.source = submission.pdf_bytes
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class ChunkStream:
+    """
+    Results for a planned list of keys, computed a few chunks ahead of the reader on
+    the render pool. get(key) expects keys in (roughly) plan order: chunks the reader
+    skips past are dropped. Any key that isn't planned, or whose chunk failed, is
+    computed in this process with local(key) instead.
+    """
+
+    def __init__(self, pool, chunks, submit, finish, local, source=None):
+        self._pool = pool
+        self._chunks = chunks
+        self._chunk_of = {key: position for position, chunk in enumerate(chunks) for key in chunk}
+        self._submit = submit
+        self._finish = finish
+        self._local = local
+        self._source = source
+        self._futures = {}
+        self._results = {}
+        self._next_submit = 0
+        self._next_read = 0
+        self.window = pool.effective_workers * 2
+        self._fill()
+
+    @property
+    def pooled(self):
+        return bool(self._chunks)
+
+    def _fill(self):
+        self._next_submit = max(self._next_submit, self._next_read)
+        while self._next_submit < len(self._chunks) and self._next_submit < self._next_read + self.window:
+            try:
+                self._futures[self._next_submit] = self._submit(self._chunks[self._next_submit])
+            except Exception as e:
+                self._pool.reset(e)
+                self._abandon()
+                return
+            self._next_submit += 1
+
+    def _abandon(self):
+        # The rest of the document is handled in-process
+        for position in list(self._futures):
+            self._drop(position)
+        self._chunks = self._chunks[:self._next_read]
+
+    def _drop(self, position):
+        future = self._futures.pop(position, None)
+        if future is not None and not future.cancel():
+            future.add_done_callback(_release)
+
+    def get(self, key):
+        if key in self._results:
+            return self._results.pop(key)
+        position = self._chunk_of.get(key)
+        if position is None or position < self._next_read or position >= len(self._chunks):
+            return self._local(key)
+        for skipped in range(self._next_read, position):
+            self._drop(skipped)
+        self._next_read = position
+        self._fill()
+        future = self._futures.pop(position, None)
+        self._next_read = position + 1
+        if future is None:
+            return self._local(key)
+        try:
+            items, packed = future.result()
+            buffers = _unpack(packed)
+        except Exception as e:
+            self._pool.reset(e)
+            self._abandon()
+            return self._local(key)
+        finally:
+            self._fill()
+        start = 0
+        for item_key, meta, count in items:
+            self._results[item_key] = self._finish(meta, buffers[start:start + count])
+            start += count
+        return self._results.pop(key) if key in self._results else self._local(key)
+
+    def close(self):
+        futures = list(self._futures.values())
+        for position in list(self._futures):
+            self._drop(position)
+        self._results.clear()
+        # Running chunks may not have opened the shared PDF yet
+        running = [future for future in futures if not future.cancelled() and not future.done()]
+        if running:
+            wait(running)
+        if self._source is not None:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RenderPool:
+    def __init__(self, workers=RENDER_WORKERS, min_pages=RENDER_POOL_MIN_PAGES,
+                 use_shared_memory=RENDER_SHARED_MEMORY):
+        self.workers = workers
+        self.min_pages = min_pages
+        self.use_shared_memory = use_shared_memory
+        self.chunks = 0
+        self.failures = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def effective_workers(self):
+        """Workers actually started: capped by the cores left beside this process, 0 under two."""
+        workers = min(self.workers, usable_cpus() - 1)
+        return workers if workers >= 2 else 0
+
+    def wanted(self, pages):
+        return self.effective_workers > 0 and pages >= max(self.min_pages, 1)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn: the parent holds FITZ_LOCK and other threads' state, which a fork would copy
+                self._executor = ProcessPoolExecutor(max_workers=self.effective_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def submit(self, fn, *args):
+        future = self._get_executor().submit(fn, *args)
+        with self._lock:
+            self.chunks += 1
+        return future
+
+    def reset(self, error):
+        """A worker died or the pool couldn't start: finish in-process and start afresh next time."""
+        from concurrent.futures.process import BrokenProcessPool
+        print(f" Render pool failed ({error}); finishing in-process")
+        with self._lock:
+            self.failures += 1
+            if isinstance(error, (BrokenProcessPool, OSError)) and self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def render_pages(self, submission, config, pages):
+        """
+        A ChunkStream of page index -> (encoded bytes, pixel count) for `pages`, a
+        list of (index, has_images) in the order they'll be read.
+        """
+        has_images = dict(pages)
+
+        def local(index):
+            return submission.render_page(index, config, has_images.get(index, True))
+
+        if not self.wanted(len(pages)):
+            return ChunkStream(self, [], None, None, local)
+        source = _SharedSource(submission, self.use_shared_memory)
+        runs = split_runs(list(pages), self.effective_workers)
+        return ChunkStream(
+            self, [[index for index, _ in run] for run in runs],
+            lambda chunk: self.submit(_render_chunk, source.source, [(i, has_images[i]) for i in chunk], config,
+                                      self.use_shared_memory),
+            lambda pixels, buffers: (buffers[0], pixels),
+            local, source
+        )
+
+    def extract_images(self, submission, placements):
+        """
+        A ChunkStream of xref -> (base_image, converted blob or None) for the first
+        placement of each image, split by page so each worker takes a run of pages.
+        """
+        by_page, seen = {}, set()
+        for placement in placements:
+            if placement["xref"] not in seen:
+                seen.add(placement["xref"])
+                by_page.setdefault(placement["page"], []).append(placement["xref"])
+
+        def local(xref):
+            from autograder_pdf import FITZ_LOCK
+            with FITZ_LOCK:
+                return submission.doc.extract_image(xref), None
+
+        def finish(meta, buffers):
+            base_image, blob_mime = meta
+            blob = {"mime_type": blob_mime, "data": buffers[1]} if blob_mime else None
+            return dict(base_image, image=buffers[0]), blob
+
+        if not self.wanted(len(by_page)):
+            return ChunkStream(self, [], None, None, local)
+        source = _SharedSource(submission, self.use_shared_memory)
+        runs = split_runs(sorted(by_page), self.effective_workers)
+        return ChunkStream(
+            self, [[xref for page in run for xref in by_page[page]] for run in runs],
+            lambda chunk: self.submit(_extract_chunk, source.source, chunk, self.use_shared_memory),
+            finish, local, source
+        )
+
+    def warm_up(self):
+        """Starts the worker processes now rather than on the first large document."""
+        if self.effective_workers > 0:
+            wait([self.submit(os.getpid) for _ in range(self.effective_workers)])
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.effective_workers, "configured_workers": self.workers,
+                    "running": self._executor is not None, "chunks": self.chunks, "failures": self.failures}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+render_pool = RenderPool()
@@ -0,0 +1,155 @@
+import re
+from functools import lru_cache
+
+# Single-pass parser for Gemini's rubric response. One precompiled tokenizer walks
+# the text once and yields criterion labels, "Score: n/5" lines, bare "n/5"
+# fractions and the summary-table marker; each criterion takes the first score
+# that follows its label. This replaces a dozen ".*?" DOTALL searches over the
+# whole response plus a second parse of the summary table, with the same results.
+
+# (score key, label searched for in the response), in the order scores are reported
+SCORE_LABELS = [
+    ("architect_chosen", "Architect Selection"),
+    ("doc_and_slides", "Organization"),
+    ("bio_750_words", "Biographical Content"),
+    ("bio_structure", "Biographical Structure"),
+    ("bio_references", "Citation of Architect Biography"),
+    ("10_buildings_with_images", "Coverage of 10 Famous Buildings"),
+    ("image_quality", "Selection & Quality of Images"),
+    ("image_citations", "Image Citation & Attribution"),
+    ("image_relevance", "Image Relevance"),
+    ("personal_bio_photo", "Personal Bio"),
+    ("presentation_polish", "Overall Completeness"),
+    ("overall_completeness", "Overall Completeness"),
+]
+
+# Summary-table category -> score key; a row matches if either contains the other
+SUMMARY_CATEGORY_KEYS = {
+    "Architect Selection & Scope": "architect_chosen",
+    "Organization & Document Setup": "doc_and_slides",
+    "Biographical Content": "bio_750_words",
+    "Citation of Architect Biography": "bio_references",
+    "Selection & Quality of Images": "image_quality",
+    "Image Citation & Attribution": "image_citations",
+    "Coverage of 10 Famous Buildings": "10_buildings_with_images",
+    "Image Relevance": "image_relevance",
+    "Personal Bio & Photo": "personal_bio_photo",
+    "Overall Completeness & Presentation": "presentation_polish"
+}
+
+SUMMARY_MARKERS = ["Summary Table", "Here's a table summarizing the scores:", "Here's a table summarizing your scores:"]
+
+_LABELS = sorted({label.lower() for _, label in SCORE_LABELS}, key=len, reverse=True)
+_TOKENS = (
+    r"(?P<summary>" + "|".join(re.escape(marker.lower()) for marker in SUMMARY_MARKERS) + r")"
+    r"|(?P<label>" + "|".join(re.escape(label) for label in _LABELS) + r")"
+    r"|score:\s*(?P<score>\d+)(?P<score_denominator>\s*/\s*5)?"
+    r"|(?P<fraction>\d+)(?P<fraction_spacing>\s*)/(?P<fraction_spacing_after>\s*)5"
+)
+# Matching against the lowercased text without IGNORECASE lets the regex engine skip
+# ahead on its first-character set, about 3x faster on long responses. The
+# IGNORECASE form is for the rare text whose length changes when lowercased.
+TOKEN_PATTERN = re.compile(_TOKENS)
+TOKEN_PATTERN_IGNORECASE = re.compile(_TOKENS, re.IGNORECASE)
+SUMMARY_ROW_PATTERN = re.compile(r"\|\s*([^|]+)\s*\|\s*(\d+)/5\s*\|")
+
+# In order of preference, the kinds of score that can follow a label:
+#   "Score: 4/5", then a bare "4/5", then "Score: 4", then "4 / 5"
+SCORE_KINDS = ("score_fraction", "fraction", "score", "spaced_fraction")
+
+
+@lru_cache(maxsize=64)
+def parse_rubric_response(text):
+    """
+    Returns {"scores": {key: {"score", "justification"}}, "summary_scores": {key: score}}.
+    A criterion whose label never appears scores 0; summary_scores is empty when
+    the response has no summary table. Cached, since the same response is read by
+    both gemini_detailed_rubric_eval and run_autograder_full.
+    """
+    labels_by_text = {}
+    for key, label in SCORE_LABELS:
+        labels_by_text.setdefault(label.lower(), []).append(key)
+    lowered = text.lower()
+    tokens = (TOKEN_PATTERN.finditer(lowered) if len(lowered) == len(text)
+              else TOKEN_PATTERN_IGNORECASE.finditer(text))
+
+    label_end = {}
+    in_heading = set()
+    found = {kind: {} for kind in SCORE_KINDS}
+    waiting = {kind: [] for kind in SCORE_KINDS}
+    justification = {}
+    summary_start = None
+
+    for token in tokens:
+        if token.group("label") is not None:
+            for key in labels_by_text[token.group("label").lower()]:
+                if key not in label_end:
+                    label_end[key] = token.end()
+                    if text[max(token.start() - 8, 0):token.start()].rstrip(" \t").endswith("**"):
+                        in_heading.add(key)
+                    for kind in SCORE_KINDS:
+                        waiting[kind].append(key)
+            continue
+        if token.group("summary") is not None:
+            if summary_start is None:
+                summary_start = token.start()
+            continue
+
+        if token.group("score") is not None:
+            value = int(token.group("score"))
+            denominator = token.group("score_denominator")
+            kinds = ["score"]
+            if denominator is not None:
+                kinds.append("spaced_fraction")
+                if denominator == "/5":
+                    kinds += ["score_fraction", "fraction"]
+        else:
+            value = int(token.group("fraction"))
+            kinds = ["spaced_fraction"]
+            if not token.group("fraction_spacing") and not token.group("fraction_spacing_after"):
+                kinds.append("fraction")
+
+        for kind in kinds:
+            for key in waiting[kind]:
+                found[kind][key] = value
+                if kind == "score_fraction":
+                    justification[key] = text[label_end[key]:token.start()]
+            waiting[kind] = []
+
+    scores = {}
+    for key, _ in SCORE_LABELS:
+        score = next((found[kind][key] for kind in SCORE_KINDS if key in found[kind]), 0)
+        scores[key] = {"score": score,
+                       "justification": _clean_justification(justification.get(key, ""), key in in_heading)}
+
+    return {"scores": scores, "summary_scores": _parse_summary(text, summary_start)}
+
+
+def _clean_justification(text, in_heading=False):
+    if in_heading:
+        # The label is only the start of a bold heading ("**Architect Selection & Scope**");
+        # drop the rest of the heading
+        rest_of_heading, closed, after = text.partition("**")
+        if closed and "\n" not in rest_of_heading:
+            text = after
+    text = text.strip().lstrip("*:").strip()
+    if text.lower().startswith("feedback:"):
+        text = text[len("feedback:"):]
+    return text.strip()
+
+
+def _parse_summary(text, start):
+    summary_scores = {}
+    if start is None:
+        return summary_scores
+    end = text.find("\n\n", start)
+    section = text[start:] if end == -1 else text[start:end]
+    for category, score in SUMMARY_ROW_PATTERN.findall(section):
+        category = category.strip()
+        for table_category, key in SUMMARY_CATEGORY_KEYS.items():
+            if table_category in category or category in table_category:
+                summary_scores[key] = int(score)
+                if key == "presentation_polish":
+                    summary_scores["overall_completeness"] = int(score)
+                break
+    return summary_scores
@@ -0,0 +1,172 @@
+import os
+import re
+import zlib
+import hashlib
+import threading
+from autograder_cache import CACHE_FOLDER
+
+# Students paraphrase ("My table of contents lists...") rather than write the rubric
+# descriptors verbatim, so the substring matcher rarely fires. This scores every
+# document sentence against every descriptor by cosine similarity. Descriptor
+# embeddings are computed once per embedder and descriptor set and kept on disk.
+SEMANTIC_FACTORS = os.getenv("AUTOGRADER_SEMANTIC_FACTORS", "1") == "1"
+EMBEDDING_MODEL = os.getenv("AUTOGRADER_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("AUTOGRADER_EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_FOLDER = os.path.join(CACHE_FOLDER, "embeddings")
+HASH_DIM = 4096
+
+# Sentences are split on terminal punctuation and line breaks; fragments shorter
+# than this many words (page numbers, stray labels) aren't scored
+MIN_SENTENCE_WORDS = 2
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]?")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were with".split()
+)
+
+
+class HashedNgramEmbedder:
+    """
+    Dependency-free fallback: word unigrams/bigrams and in-word character trigrams,
+    hashed into a fixed-size vector. Captures lexical overlap and inflections, not
+    synonyms, so it has its own (lower) thresholds.
+    """
+    name = f"hashed-ngrams-{HASH_DIM}"
+    match_threshold = float(os.getenv("AUTOGRADER_HASHED_MATCH_THRESHOLD", "0.4"))
+    reject_threshold = float(os.getenv("AUTOGRADER_HASHED_REJECT_THRESHOLD", "0.2"))
+
+    def _features(self, text):
+        words = [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+        features = [f"w:{word}" for word in words]
+        features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def encode(self, texts):
+        import numpy as np
+        vectors = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+        rows, columns = [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                rows.append(row)
+                columns.append(zlib.crc32(feature.encode("utf-8")) % HASH_DIM)
+        np.add.at(vectors, (rows, columns), 1.0)
+        np.log1p(vectors, out=vectors)
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    match_threshold = float(os.getenv("AUTOGRADER_SEMANTIC_MATCH_THRESHOLD", "0.6"))
+    reject_threshold = float(os.getenv("AUTOGRADER_SEMANTIC_REJECT_THRESHOLD", "0.35"))
+
+    def __init__(self, model_name=EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.name = f"st-{model_name.replace('/', '_')}"
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts):
+        return _normalize(self.model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True))
+
+
+def _normalize(vectors):
+    import numpy as np
+    vectors = vectors.astype(np.float32, copy=False)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def create_embedder():
+    try:
+        return SentenceTransformerEmbedder()
+    except ImportError:
+        return HashedNgramEmbedder()
+    except Exception as e:
+        # Installed but unusable (offline grader, hub download error, corrupt model cache)
+        print(f" Could not load embedding model {EMBEDDING_MODEL} ({e}); using hashed n-grams")
+        return HashedNgramEmbedder()
+
+
+def split_sentences(text):
+    """(start, end, sentence) for each scoreable sentence, offsets into text."""
+    sentences = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group().strip()
+        if len(sentence.split()) >= MIN_SENTENCE_WORDS:
+            sentences.append((match.start(), match.end(), sentence))
+    return sentences
+
+
+class SemanticFactorMatcher:
+    def __init__(self, factors, embedder, folder=EMBEDDING_FOLDER):
+        self.embedder = embedder
+        self.keys = []
+        descriptors = []
+        for criterion, columns in factors.items():
+            for col, texts in columns.items():
+                for idx, desc in enumerate(texts, start=1):
+                    self.keys.append((criterion, col, idx))
+                    descriptors.append(desc)
+        self.descriptor_vectors = self._load_descriptors(descriptors, folder)
+        self._lock = threading.Lock()
+
+    def _load_descriptors(self, descriptors, folder):
+        import numpy as np
+        digest = hashlib.sha256("\x1f".join(descriptors).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(folder, f"factors_{self.embedder.name}_{digest}.npz")
+        if os.path.exists(path):
+            try:
+                return np.load(path)["vectors"]
+            except (OSError, ValueError, KeyError):
+                pass
+        vectors = self.embedder.encode(descriptors)
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, vectors=vectors)
+        os.replace(tmp_path, path)
+        return vectors
+
+    def score(self, text):
+        """
+        Best-matching sentence per descriptor, as dicts with criterion, col, idx,
+        score, start and end. Sentences are embedded EMBEDDING_BATCH_SIZE at a time,
+        so memory stays flat however long the document is.
+        """
+        import numpy as np
+        sentences = split_sentences(text)
+        best_scores = np.full(len(self.keys), -1.0, dtype=np.float32)
+        best_sentences = np.zeros(len(self.keys), dtype=np.int64)
+        for batch_start in range(0, len(sentences), EMBEDDING_BATCH_SIZE):
+            batch = sentences[batch_start:batch_start + EMBEDDING_BATCH_SIZE]
+            with self._lock:
+                vectors = self.embedder.encode([sentence for _, _, sentence in batch])
+            similarities = vectors @ self.descriptor_vectors.T
+            batch_best = similarities.argmax(axis=0)
+            batch_scores = similarities[batch_best, np.arange(len(self.keys))]
+            improved = batch_scores > best_scores
+            best_scores[improved] = batch_scores[improved]
+            best_sentences[improved] = batch_best[improved] + batch_start
+
+        results = []
+        for position, (criterion, col, idx) in enumerate(self.keys):
+            start, end = (sentences[best_sentences[position]][:2] if sentences else (0, 0))
+            results.append({"criterion": criterion, "col": col, "idx": idx,
+                            "score": round(float(max(best_scores[position], 0.0)), 3),
+                            "start": start, "end": end})
+        return results
+
+    def matched(self, scores):
+        return [score for score in scores if score["score"] >= self.embedder.match_threshold]
+
+    def unresolved_criteria(self, scores):
+        """
+        Criteria the scores can't settle: nothing clearly matched, but some descriptor
+        landed between the thresholds. Only these are worth an LLM reflection.
+        """
+        best = {}
+        for score in scores:
+            best[score["criterion"]] = max(best.get(score["criterion"], 0.0), score["score"])
+        return [criterion for criterion, value in best.items()
+                if self.embedder.reject_threshold <= value < self.embedder.match_threshold]
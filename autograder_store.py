@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+# Indexed replacement for the one-JSON-file-per-submission folder
+STORE_PATH = os.getenv(
+    "AUTOGRADER_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "submissions.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_pid TEXT NOT NULL,
+    student_name TEXT,
+    architect_name TEXT,
+    timestamp TEXT NOT NULL,
+    grade TEXT,
+    score REAL,
+    rubric_scores TEXT,
+    detailed_evaluation TEXT,
+    UNIQUE (student_pid, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_pid ON submissions (student_pid);
+CREATE INDEX IF NOT EXISTS idx_submissions_architect ON submissions (architect_name);
+CREATE INDEX IF NOT EXISTS idx_submissions_grade ON submissions (grade);
+CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions (timestamp);
+"""
+
+COLUMNS = ["student_name", "student_pid", "architect_name", "timestamp", "grade", "score",
+           "rubric_scores", "detailed_evaluation"]
+# List views leave out detailed_evaluation, which is most of each row's size
+SUMMARY_COLUMNS = [column for column in COLUMNS if column != "detailed_evaluation"]
+
+SORT_COLUMNS = {
+    "timestamp": "timestamp",
+    "score": "score",
+    "grade": "grade",
+    "name": "student_name",
+    "pid": "student_pid",
+    "architect": "architect_name"
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SubmissionStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # sqlite3 connections can't cross threads, and grading jobs save from workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, submission):
+        row = [submission.get(column) for column in COLUMNS]
+        row[COLUMNS.index("rubric_scores")] = json.dumps(submission.get("rubric_scores") or {})
+        with self._connect() as conn:
+            # Same pid + second replaces the earlier row, as the old same-named file did
+            cursor = conn.execute(
+                f"INSERT OR REPLACE INTO submissions ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                row
+            )
+        return cursor.lastrowid
+
+    def _to_dict(self, row, columns=COLUMNS):
+        submission = {column: row[column] for column in columns}
+        submission["rubric_scores"] = json.loads(row["rubric_scores"] or "{}")
+        return submission
+
+    def all(self):
+        rows = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM submissions ORDER BY timestamp DESC"
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def query(self, page=1, limit=DEFAULT_PAGE_SIZE, grade=None, architect=None, q=None, sort="-timestamp"):
+        """
+        One page of summary rows plus the total match count. grade matches by letter
+        prefix ("B" also matches "B+"/"B-"), q searches name and PID, and sort is a
+        SORT_COLUMNS key or rubric.<criterion>, prefixed with "-" for descending.
+        """
+        page = max(1, int(page))
+        limit = min(max(1, int(limit)), MAX_PAGE_SIZE)
+        clauses, params = [], []
+        if grade:
+            clauses.append("grade LIKE ? ESCAPE '\\'")
+            params.append(_escape_like(grade) + "%")
+        if architect:
+            clauses.append("architect_name = ?")
+            params.append(architect)
+        if q:
+            clauses.append("(student_name LIKE ? ESCAPE '\\' OR student_pid LIKE ? ESCAPE '\\')")
+            params.extend(["%" + _escape_like(q) + "%"] * 2)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        descending = sort.startswith("-")
+        sort_key = sort.lstrip("-")
+        criterion = sort_key[len("rubric."):] if sort_key.startswith("rubric.") else ""
+        if criterion.replace("_", "").isalnum():
+            order_by = "json_extract(rubric_scores, ?)"
+            order_params = [f'$."{criterion}"']
+        else:
+            order_by = SORT_COLUMNS.get(sort_key, "timestamp")
+            order_params = []
+        direction = "DESC" if descending else "ASC"
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM submissions {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM submissions {where} "
+            f"ORDER BY {order_by} {direction}, timestamp DESC LIMIT ? OFFSET ?",
+            params + order_params + [limit, (page - 1) * limit]
+        ).fetchall()
+        return {
+            "submissions": [self._to_dict(row, SUMMARY_COLUMNS) for row in rows],
+            "total": total,
+            "page": page,
+            "limit": limit
+        }
+
+    def architects(self):
+        rows = self._connect().execute(
+            "SELECT DISTINCT architect_name FROM submissions WHERE architect_name IS NOT NULL ORDER BY architect_name"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, student_pid, timestamp):
+        row = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM submissions WHERE student_pid = ? AND timestamp = ?",
+            (student_pid, timestamp)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def summaries_after(self, last_id):
+        """Summary rows with id > last_id, oldest first, for incremental readers."""
+        rows = self._connect().execute(
+            f"SELECT id, {', '.join(SUMMARY_COLUMNS)} FROM submissions WHERE id > ? ORDER BY id",
+            (last_id,)
+        ).fetchall()
+        return [(row["id"], self._to_dict(row, SUMMARY_COLUMNS)) for row in rows]
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+    def import_json_folder(self, folder):
+        """One-shot import of the legacy submissions/<pid>_<timestamp>.json files."""
+        imported = 0
+        if not os.path.isdir(folder):
+            return imported
+        for filename in sorted(os.listdir(folder)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, filename), 'r') as f:
+                    submission = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {filename}: {e}")
+                continue
+            self.add(submission)
+            imported += 1
+        print(f"Imported {imported} submissions from {folder}")
+        return imported
+
+
+if __name__ == "__main__":
+    # python autograder_store.py import [submissions_folder]
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("usage: python autograder_store.py import [submissions_folder]")
+        sys.exit(1)
+    default_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'submissions')
+    SubmissionStore().import_json_folder(sys.argv[2] if len(sys.argv) > 2 else default_folder)
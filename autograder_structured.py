@@ -0,0 +1,252 @@
+import os
+import re
+import json
+import threading
+from autograder_ratelimit import generate_with_retry
+
+# Schema-constrained JSON output for the rubric and image calls. Free-form replies
+# are regexed for scores, and a reply that doesn't parse silently scores 0, so staff
+# re-run the whole multi-page vision call. Here the model is asked for JSON matching
+# a schema, each field is validated, and only the fields that failed are re-asked
+# for, in a short text-only call that shows the model its previous reply.
+STRUCTURED_OUTPUT = os.getenv("AUTOGRADER_STRUCTURED_OUTPUT", "1") == "1"
+STRUCTURED_MAX_REASKS = int(os.getenv("AUTOGRADER_STRUCTURED_MAX_REASKS", "2"))
+# Bump when a schema or the re-ask prompt changes; part of the rubric cache key
+STRUCTURED_VERSION = "1"
+
+REASK_PROMPT = """Your previous reply could not be used as-is: {problem}.
+
+Previous reply:
+{previous}
+{context}
+Reply with ONLY a JSON object containing exactly these fields: {fields}.
+Keep what you already wrote in your previous reply wherever it is still correct.
+"""
+REASK_PREVIOUS_CHARS = 20000
+
+
+class StructuredOutputStats:
+    """
+    Process-wide counters. repaired counts every request (rubric or image verdict) that
+    came back invalid and was completed by re-asks. reruns_avoided counts only the
+    rubric calls among them: each would otherwise have meant re-sending the whole
+    document at least once.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.valid_first_try = 0
+        self.reasks = 0
+        self.repaired = 0
+        self.reruns_avoided = 0
+        self.unrepaired = 0
+        self.fields_defaulted = 0
+        self._lock = threading.Lock()
+
+    def record(self, label, valid_first_try, reasks, missing):
+        repaired = not valid_first_try and not missing
+        with self._lock:
+            self.requests += 1
+            self.valid_first_try += int(valid_first_try)
+            self.reasks += reasks
+            self.repaired += int(repaired)
+            self.reruns_avoided += int(repaired and label == "rubric")
+            self.unrepaired += int(bool(missing))
+            self.fields_defaulted += len(missing)
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": self.requests, "valid_first_try": self.valid_first_try, "reasks": self.reasks,
+                    "repaired": self.repaired, "reruns_avoided": self.reruns_avoided, "unrepaired": self.unrepaired,
+                    "fields_defaulted": self.fields_defaulted}
+
+
+structured_stats = StructuredOutputStats()
+
+
+def json_config(schema):
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def load_json(text):
+    """The JSON value in a reply, tolerating code fences and surrounding prose; None if there isn't one."""
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    match = re.search(r"[\[{]", text)
+    if match is None:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(text, match.start())[0]
+    except ValueError:
+        return None
+
+
+def as_int(value, low, high):
+    # Models write 4, "4", "4/5" or 4.0 for the same score
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = re.match(r"\s*(\d+)(?:\s*/\s*\d+)?\s*$", value)
+        value = int(match.group(1)) if match else None
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return value if isinstance(value, int) and low <= value <= high else None
+
+
+def as_text(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def as_bool(value):
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return value if isinstance(value, bool) else None
+
+
+def validate_object(data, validators):
+    """(valid fields, names of missing or invalid fields) for a reply against per-field validators."""
+    values, missing = {}, []
+    for name, validate in validators.items():
+        value = validate(data.get(name)) if isinstance(data, dict) else None
+        if value is None:
+            missing.append(name)
+        else:
+            values[name] = value
+    return values, missing
+
+
+def _subschema(schema, names):
+    return {"type": "OBJECT", "properties": {name: schema["properties"][name] for name in names}, "required": names}
+
+
+def request_object(model, contents, schema, validators, context="", label="reply"):
+    """
+    Asks for a JSON object matching schema and validates every field. Fields that are
+    missing or invalid are re-asked for (text only, up to STRUCTURED_MAX_REASKS times)
+    rather than repeating the original call. Returns (values, missing, raw reply text);
+    fields still missing after the re-asks are left to the caller's defaults.
+    """
+    raw = generate_with_retry(model, contents, label=label, generation_config=json_config(schema)).text
+    values, missing = validate_object(load_json(raw), validators)
+    valid_first_try = not missing
+    reasks = 0
+    while missing and reasks < STRUCTURED_MAX_REASKS:
+        reasks += 1
+        print(f" Structured {label} missing or invalid: {', '.join(missing)}; re-asking ({reasks}/{STRUCTURED_MAX_REASKS})")
+        problem = "it was not valid JSON" if load_json(raw) is None else f"fields missing or invalid: {', '.join(missing)}"
+        prompt = REASK_PROMPT.format(problem=problem, previous=raw[:REASK_PREVIOUS_CHARS],
+                                     context=f"\n{context}\n" if context else "", fields=", ".join(missing))
+        try:
+            raw = generate_with_retry(model, [prompt], label=f"{label} re-ask",
+                                      generation_config=json_config(_subschema(schema, missing))).text
+        except Exception as e:
+            # Includes running out of the submission's token budget
+            print(f" Re-ask failed: {e}")
+            break
+        repaired, missing = validate_object(load_json(raw), {name: validators[name] for name in missing})
+        values.update(repaired)
+    structured_stats.record(label, valid_first_try, reasks, missing)
+    return values, missing, raw
+
+
+# Rubric: one property per category key, each {"feedback", "score"}
+def rubric_schema(categories):
+    return {
+        "type": "OBJECT",
+        "properties": {
+            key: {
+                "type": "OBJECT",
+                "description": title,
+                "properties": {
+                    "feedback": {"type": "STRING", "description": "Justification, citing the rubric anchor used"},
+                    "score": {"type": "INTEGER", "description": "Score from 1 to 5"}
+                },
+                "required": ["feedback", "score"]
+            }
+            for key, title in categories
+        },
+        "required": [key for key, _ in categories]
+    }
+
+
+def validate_criterion(value):
+    if not isinstance(value, dict):
+        return None
+    score, feedback = as_int(value.get("score"), 1, 5), as_text(value.get("feedback"))
+    if score is None or feedback is None:
+        return None
+    return {"score": score, "justification": feedback}
+
+
+def structured_rubric_note(categories):
+    fields = "\n".join(f"- {key}: {title}" for key, title in categories)
+    return ("\nReply in JSON instead of the text format above: an object with one field per category, "
+            "each holding your feedback and a score from 1 to 5. The fields are:\n" + fields + "\n")
+
+
+def request_rubric_scores(model, contents, categories, context=""):
+    """
+    (scores by category key, keys still missing) from a structured rubric call.
+    contents is the rubric prompt, ending with structured_rubric_note(categories), and the pages.
+    """
+    validators = {key: validate_criterion for key, _ in categories}
+    values, missing, _ = request_object(model, contents, rubric_schema(categories), validators,
+                                        context=context, label="rubric")
+    return values, missing
+
+
+def format_structured_evaluation(scores, categories):
+    """Evaluation text in the same shape as a free-form reply, summary table included."""
+    sections, rows = [], []
+    for key, title in categories:
+        entry = scores.get(key)
+        if entry is None:
+            sections.append(f"**{title}**\nfeedback: No valid evaluation was returned for this criterion.\nScore: 0/5\n")
+            rows.append(f"| {title} | 0/5 |")
+        else:
+            sections.append(f"**{title}**\nfeedback: {entry['justification']}\nScore: {entry['score']}/5\n")
+            rows.append(f"| {title} | {entry['score']}/5 |")
+    return "\n".join(sections) + "\nSummary Table\n| Criterion | Score |\n|---|---|\n" + "\n".join(rows) + "\n"
+
+
+# Image verdicts keep their existing shape; relevance comes back as an integer and
+# is reported as "n/10" like the free-form replies
+IMAGE_VERDICT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "building_detected": {"type": "STRING", "description": "Building name, or Unknown"},
+        "interior_or_exterior": {"type": "STRING", "description": "interior, exterior or unknown"},
+        "relevance_score": {"type": "INTEGER", "description": "Relevance from 0 to 10"},
+        "justification": {"type": "STRING"},
+        "architectural_features_visible": {"type": "BOOLEAN"}
+    },
+    "required": ["building_detected", "interior_or_exterior", "relevance_score", "justification",
+                 "architectural_features_visible"]
+}
+def as_relevance(value):
+    score = as_int(value, 0, 10)
+    return None if score is None else f"{score}/10"
+
+
+IMAGE_VERDICT_VALIDATORS = {
+    "building_detected": as_text,
+    "interior_or_exterior": as_text,
+    "relevance_score": as_relevance,
+    "justification": as_text,
+    "architectural_features_visible": as_bool
+}
+
+
+def image_batch_schema():
+    item = dict(IMAGE_VERDICT_SCHEMA, properties=dict(IMAGE_VERDICT_SCHEMA["properties"],
+                                                      image_index={"type": "INTEGER"}))
+    return {"type": "ARRAY", "items": item}
+
+
+def request_image_verdict(model, contents):
+    """(verdict, complete) for one image; a partial verdict is topped up by text-only re-asks."""
+    values, missing, _ = request_object(model, contents, IMAGE_VERDICT_SCHEMA, IMAGE_VERDICT_VALIDATORS, label="image verdict")
+    return values, not missing
@@ -1,19 +1,19 @@
-import os
 import re
-import fitz  # PyMuPDF
-from PIL import Image
-from io import BytesIO
-import spacy
-import pandas as pd
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load models and API keys
-nlp = spacy.load("en_core_web_sm")
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-text_model = genai.GenerativeModel("gemini-2.0-flash")
+import json
+import hashlib
+import threading
+from autograder_pdf import ParsedSubmission
+from autograder_ratelimit import generate_with_retry
+from autograder_models import get_nlp, get_text_model, get_embedder
+from autograder_semantic import SEMANTIC_FACTORS, EMBEDDING_MODEL
+
+# Models come from the shared registry in autograder_models, loaded on first use
+def __getattr__(name):
+    if name == "nlp":
+        return get_nlp()
+    if name == "text_model":
+        return get_text_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 1) Factorized rubric definition
 rubric_factors = {
@@ -177,48 +177,182 @@ rubric_factors = {
     }
 }
 
-def check_factors(text: str, criterion: str) -> dict:
+REFLECTION_PROMPT_HEADER = (
+    "I have graded a submission against a factorized rubric. For each criterion, these are the factors "
+    "that passed, as column.index (column 1 = Exemplary, 2 = Good, 3 = Satisfactory, 4 = Needs Improvement; "
+    "index is the factor's position in that column):\n"
+)
+REFLECTION_PROMPT_FOOTER = "\n\nPlease verify whether these factor checks align with the rubric definitions, and suggest any corrections."
+
+# Changes whenever the factors or reflection prompt change; part of the result cache key
+FACTORS_VERSION = hashlib.sha256(
+    json.dumps([rubric_factors, REFLECTION_PROMPT_HEADER, REFLECTION_PROMPT_FOOTER,
+                SEMANTIC_FACTORS, EMBEDDING_MODEL], sort_keys=True).encode()
+).hexdigest()[:16]
+
+def factors_version():
+    """
+    FACTORS_VERSION plus the embedder actually in use and its thresholds, so results
+    scored by the hashed fallback and by the real model are never served for each
+    other. Loads the embedder, which grading the factors would do anyway.
+    """
+    if not SEMANTIC_FACTORS:
+        return FACTORS_VERSION
+    embedder = get_embedder()
+    identity = json.dumps([embedder.name, embedder.match_threshold, embedder.reject_threshold])
+    return f"{FACTORS_VERSION}-{hashlib.sha256(identity.encode()).hexdigest()[:8]}"
+
+def _trie_pattern(phrases):
+    # Regex over a character trie of the phrases: shared prefixes are tested once, and
+    # the greedy optional tail means the longest phrase starting at a position wins
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        alternation = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{alternation})?" if "" in node else alternation
+
+    return build(trie)
+
+
+class FactorMatcher:
+    """
+    All rubric_factors phrases compiled into one pattern. find() makes a single pass
+    over the lowercased text and returns every occurrence of every phrase, including
+    phrases that overlap or sit inside a longer one, so it agrees with a per-phrase
+    substring test.
+    """
+
+    def __init__(self, factors=None):
+        factors = factors or rubric_factors
+        self.keys_by_phrase = {}
+        for criterion, columns in factors.items():
+            for col, descriptors in columns.items():
+                for idx, desc in enumerate(descriptors, start=1):
+                    self.keys_by_phrase.setdefault(desc.lower(), []).append((criterion, col, idx))
+        phrases = list(self.keys_by_phrase)
+        # A lookahead match reports only the longest phrase at each start; these are
+        # the shorter phrases (and their offsets) implied by each match
+        self._contained = {
+            phrase: [(other, start.start()) for other in phrases if other != phrase
+                     for start in re.finditer(f"(?={re.escape(other)})", phrase)]
+            for phrase in phrases
+        }
+        self._pattern = re.compile(f"(?=({_trie_pattern(phrases)}))")
+
+    def find(self, text):
+        """Hits as dicts with criterion, col, idx, start and end (offsets into text.lower())."""
+        seen = set()
+        hits = []
+        for match in self._pattern.finditer(text.lower()):
+            phrase, start = match.group(1), match.start()
+            for found, offset in [(phrase, 0)] + self._contained[phrase]:
+                if (found, start + offset) in seen:
+                    continue
+                seen.add((found, start + offset))
+                for criterion, col, idx in self.keys_by_phrase[found]:
+                    hits.append({"criterion": criterion, "col": col, "idx": idx,
+                                 "start": start + offset, "end": start + offset + len(found)})
+        hits.sort(key=lambda hit: hit["start"])
+        return hits
+
+
+factor_matcher = FactorMatcher()
+_semantic_matcher = None
+_semantic_lock = threading.Lock()
+
+def get_semantic_matcher():
+    global _semantic_matcher
+    with _semantic_lock:
+        if _semantic_matcher is None:
+            from autograder_semantic import SemanticFactorMatcher
+            _semantic_matcher = SemanticFactorMatcher(rubric_factors, get_embedder())
+        return _semantic_matcher
+
+def check_factors(text: str, criterion: str, hits=None) -> dict:
     """
     Returns a dict mapping (criterion, col, idx) → bool indicating whether each factor passed.
+    Pass hits from factor_matcher.find(text) to avoid rescanning when checking every criterion.
     """
-    results = {}
-    content = text.lower()
-    for col, factors in rubric_factors[criterion].items():
-        for idx, desc in enumerate(factors, start=1):
-            key = (criterion, col, idx)
-            # simple substring check; you can refine with regex if needed
-            results[key] = desc.lower() in content
+    if hits is None:
+        hits = factor_matcher.find(text)
+    results = {
+        (criterion, col, idx): False
+        for col, factors in rubric_factors[criterion].items()
+        for idx in range(1, len(factors) + 1)
+    }
+    for hit in hits:
+        if hit["criterion"] == criterion:
+            results[(criterion, hit["col"], hit["idx"])] = True
     return results
 
-def extract_text(pdf_path):
-    doc = fitz.open(pdf_path)
-    return "\n".join(page.get_text() for page in doc)
-
-def run_autograder_with_factors(pdf_path: str, architect_name: str):
-    text = extract_text(pdf_path)
-    # 4a) Collect factor passes for each criterion
-    factor_results = {}
-    for criterion in rubric_factors:
-        factor_results[criterion] = check_factors(text, criterion)
-    # 4b) Build factor table for True results
+def build_factor_table(hits):
+    """One row per criterion; Col_1..Col_4 list the factors that passed, '-' if none."""
+    passed = {}
+    for hit in hits:
+        passed.setdefault((hit["criterion"], hit["col"]), set()).add(hit["idx"])
     factor_table = []
-    for criterion, checks in factor_results.items():
+    for criterion in rubric_factors:
         row = { 'Criterion': criterion }
-        # columns 1-4
         for col in range(1,5):
-            passed = [f"({criterion}, {col}, {idx})"
-                      for (crit, c, idx), ok in checks.items()
-                      if crit == criterion and c == col and ok]
-            row[f'Col_{col}'] = ', '.join(passed) or '-'
+            indices = sorted(passed.get((criterion, col), ()))
+            row[f'Col_{col}'] = ', '.join(f"({criterion}, {col}, {idx})" for idx in indices) or '-'
         factor_table.append(row)
+    return factor_table
+
+def format_factor_summary(hits):
+    """
+    One line per criterion listing the passed factors, for the reflection prompt.
+    The markdown factor table repeats the criterion name in every cell and pads
+    every column, so it is several times larger for the same information.
+    """
+    passed = {}
+    for hit in hits:
+        passed.setdefault(hit["criterion"], set()).add((hit["col"], hit["idx"]))
+    return "\n".join(
+        f"- {criterion}: " + (", ".join(f"{col}.{idx}" for col, idx in sorted(passed[criterion]))
+                              if criterion in passed else "none")
+        for criterion in rubric_factors
+    )
+
+def extract_text(pdf_path):
+    with ParsedSubmission.opened(pdf_path) as submission:
+        return "\n".join(submission.page_text(i) for i in range(submission.page_count))
+
+def run_autograder_with_factors(pdf_path, architect_name: str):
+    text = extract_text(pdf_path)
+    # 4) One pass over the text finds every factor phrase; the table comes straight from the hits
+    hits = factor_matcher.find(text)
+    unresolved = None
+    if SEMANTIC_FACTORS:
+        # Paraphrased factors count too; only criteria the embeddings can't settle need the LLM
+        semantic = get_semantic_matcher()
+        scores = semantic.score(text)
+        hits += semantic.matched(scores)
+        unresolved = semantic.unresolved_criteria(scores)
+    factor_table = build_factor_table(hits)
+    import pandas as pd
     df_factors = pd.DataFrame(factor_table)
+    if unresolved == []:
+        print("Factor checks resolved locally; skipping reflection call")
+        return {
+            "factor_table": df_factors,
+            "reflection": "All factor checks were resolved by local semantic matching; no corrections suggested."
+        }
     # 5) Reflective prompt to LLM
     reflective_prompt = (
-        "I have graded a submission using the following factor table:\n" +
-        df_factors.to_markdown(index=False) +
-        "\n\nPlease verify whether these factor checks align with the rubric definitions, and suggest any corrections."
+        REFLECTION_PROMPT_HEADER +
+        format_factor_summary(hits) +
+        REFLECTION_PROMPT_FOOTER
     )
-    reflect = text_model.generate_content([reflective_prompt]).text
+    reflect = generate_with_retry(get_text_model(), [reflective_prompt], label="reflection").text
     return {
         "factor_table": df_factors,
         "reflection": reflect
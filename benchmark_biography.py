@@ -0,0 +1,41 @@
+import sys
+import time
+import tracemalloc
+from autograder_logic import count_alpha_words, extract_text_from_pdf
+
+# Compares the biography word count through the full spaCy pipeline (tagger, parser,
+# NER) with the tokenizer-only path evaluate_biography now uses.
+#   python benchmark_biography.py [submission.pdf]
+# Without a PDF, a synthetic ~20k-word document is used.
+SYNTHETIC_PARAGRAPH = (
+    "Bjarke Ingels founded BIG in Copenhagen in 2005 after working for Rem Koolhaas at OMA. "
+    "His practice is known for pragmatic utopian architecture, combining public space, "
+    "landscape and sustainability into bold, diagrammatic forms such as the 8 House, "
+    "VIA 57 West and the CopenHill waste-to-energy plant with its ski slope. "
+)
+
+
+def measure(text, full_parse):
+    tracemalloc.start()
+    start = time.perf_counter()
+    words = count_alpha_words(text, full_parse=full_parse)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"words": words, "seconds": seconds, "peak_mb": peak / (1024 * 1024)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        text = extract_text_from_pdf(sys.argv[1])
+    else:
+        text = "\n\n".join([SYNTHETIC_PARAGRAPH] * 400)
+    # Load the model before timing either path
+    count_alpha_words("warm up")
+    full = measure(text, full_parse=True)
+    fast = measure(text, full_parse=False)
+    for label, result in (("full pipeline", full), ("tokenizer only", fast)):
+        print(f"{label:>15}: {result['words']} words in {result['seconds']:.3f}s, "
+              f"peak {result['peak_mb']:.1f} MB traced")
+    print(f"speedup {full['seconds'] / max(fast['seconds'], 1e-9):.1f}x, counts "
+          f"{'match' if full['words'] == fast['words'] else 'DIFFER'}")
@@ -0,0 +1,78 @@
+import sys
+import time
+import fitz
+from autograder_pdf import ParsedSubmission
+from autograder_render import RenderStats, iter_page_parts
+from autograder_render_pool import render_pool, usable_cpus
+from autograder_ratelimit import estimate_tokens
+
+# Compares rasterising every page with page triage (text pages as text, blank pages
+# dropped, image pages under the image budget) on one submission, then both again on
+# the render pool (AUTOGRADER_RENDER_WORKERS, or every spare core if that's 0). The
+# pool only runs with two or more spare cores, so on smaller machines that part is skipped.
+#   python benchmark_render.py [submission.pdf]
+# Without a PDF, a synthetic 120-page portfolio is built: a text biography and
+# bibliography, photo pages for 10 buildings, and a few blank separator pages.
+PROSE = ("Bjarke Ingels founded BIG in Copenhagen in 2005 after working for Rem Koolhaas at OMA. His practice "
+         "combines public space, landscape and sustainability into bold, diagrammatic forms. ") * 12
+
+
+def synthetic_pdf():
+    doc = fitz.open()
+    photo = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1600, 1000), False)
+    for y in range(0, 1000, 50):
+        photo.set_rect(fitz.IRect(0, y, 1600, y + 25), (40 + y // 8, 90, 160))
+    photo_bytes = photo.tobytes("jpeg")
+    for index in range(120):
+        page = doc.new_page()
+        if index % 20 == 19:
+            continue  # blank separator
+        if 30 <= index < 100 and index % 2 == 0:
+            page.insert_image(fitz.Rect(50, 80, 560, 400), stream=photo_bytes)
+            page.insert_text((50, 430), f"Figure {index}: exterior view. Photo: ArchDaily.")
+        else:
+            page.insert_textbox(fitz.Rect(50, 50, 560, 760), PROSE, fontsize=10)
+    return doc.tobytes()
+
+
+def measure(pdf_bytes, triage, workers=0):
+    render_pool.workers = workers
+    with ParsedSubmission(pdf_bytes=pdf_bytes) as submission:
+        stats = RenderStats()
+        start = time.perf_counter()
+        parts = list(iter_page_parts(submission, stats=stats, triage=triage))
+        seconds = time.perf_counter() - start
+    text_bytes = sum(len(part.encode("utf-8")) for part in parts if isinstance(part, str))
+    return {"seconds": seconds, "images": stats.pages, "covered": stats.pages + len(stats.text_pages),
+            "document_pages": stats.document_pages, "text_pages": len(stats.text_pages),
+            "blank_pages": len(stats.blank_pages), "mb": (stats.payload_bytes + text_bytes) / (1024 * 1024),
+            "tokens": estimate_tokens(parts)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = synthetic_pdf()
+    workers = render_pool.workers or usable_cpus() - 1
+    full = measure(pdf_bytes, triage=False)
+    triaged = measure(pdf_bytes, triage=True)
+    for label, result in (("every page", full), ("triage", triaged)):
+        # Without triage, long documents are sampled down to the page limit
+        print(f"{label:>10}: {result['images']} images, {result['text_pages']} text pages, "
+              f"{result['blank_pages']} blank dropped (covers {result['covered']}/{result['document_pages']} pages); "
+              f"{result['mb']:.1f} MB, ~{result['tokens']} tokens, {result['seconds']:.2f}s")
+    print(f"payload {full['mb'] / max(triaged['mb'], 1e-9):.1f}x smaller, "
+          f"render {full['seconds'] / max(triaged['seconds'], 1e-9):.1f}x faster")
+    render_pool.workers = workers
+    if not render_pool.effective_workers:
+        print(f"render pool off: {usable_cpus()} usable CPU(s), so every page renders in-process")
+        sys.exit(0)
+    # Worker start-up is paid once per server, not per submission
+    render_pool.warm_up()
+    for label, in_process, triage in (("every page", full, False), ("triage", triaged, True)):
+        pooled = measure(pdf_bytes, triage=triage, workers=workers)
+        print(f"{label:>10}: {in_process['seconds']:.2f}s in-process, {pooled['seconds']:.2f}s on {render_pool.effective_workers} "
+              f"worker(s) ({in_process['seconds'] / max(pooled['seconds'], 1e-9):.1f}x)")
+    render_pool.shutdown()
@@ -0,0 +1,114 @@
+import re
+import sys
+import time
+import random
+from autograder_rubric_parser import SCORE_LABELS, parse_rubric_response
+
+# Compares the single-pass rubric parser with the previous per-label regex scans
+# (kept below as legacy_parse) on long synthetic Gemini responses, and checks that
+# both give the same scores.
+#   python benchmark_rubric_parser.py [response.txt]
+CATEGORIES = [
+    "Architect Selection & Scope", "Organization & Document Setup", "Biographical Content (750 words)",
+    "Citation of Architect Biography", "Selection & Quality of Images", "Image Citation & Attribution",
+    "Coverage of 10 Famous Buildings", "Image Relevance", "Personal Bio & Photo",
+    "Overall Completeness & Presentation"
+]
+FILLER = ("The submission discusses the architect's early work in detail, with page 3 of 12 "
+          "showing the museum facade and 2 interior views. ")
+SCORE_FORMATS = ["Score: {}/5", "Score: {} / 5", "Score: {}", "{}/5", "{} / 5", "rated {} out of 5"]
+
+
+def legacy_parse(response_text):
+    def extract_score(label, out_of):
+        patterns = [
+            rf"{label}.*?Score:\s*(\d+)/{out_of}",
+            rf"{label}.*?(\d+)/{out_of}",
+            rf"{label}.*?Score:\s*(\d+)",
+            rf"{label}.*?(\d+)\s*/\s*{out_of}"
+        ]
+        for pattern in patterns:
+            match = re.search(pattern, response_text, re.IGNORECASE | re.DOTALL)
+            if match:
+                return int(match.group(1))
+        summary_match = re.search(r"\*\*FINAL SUMMARY\*\*.*?(?=\*\*OVERALL COMMENTS|\Z)", response_text,
+                                  re.DOTALL | re.IGNORECASE)
+        if summary_match:
+            for pattern in patterns:
+                match = re.search(pattern, summary_match.group(0), re.IGNORECASE | re.DOTALL)
+                if match:
+                    return int(match.group(1))
+        return 0
+
+    scores = {key: extract_score(label, 5) for key, label in SCORE_LABELS}
+
+    summary_scores = {}
+    table_section_pattern = r"(?:Summary Table|Here's a table summarizing the scores:|Here's a table summarizing your scores:).*?(?=\n\n|$)"
+    table_section_match = re.search(table_section_pattern, response_text, re.DOTALL | re.IGNORECASE)
+    if table_section_match:
+        category_mapping = {
+            "Architect Selection & Scope": "architect_chosen",
+            "Organization & Document Setup": "doc_and_slides",
+            "Biographical Content": "bio_750_words",
+            "Citation of Architect Biography": "bio_references",
+            "Selection & Quality of Images": "image_quality",
+            "Image Citation & Attribution": "image_citations",
+            "Coverage of 10 Famous Buildings": "10_buildings_with_images",
+            "Image Relevance": "image_relevance",
+            "Personal Bio & Photo": "personal_bio_photo",
+            "Overall Completeness & Presentation": "presentation_polish"
+        }
+        for category, score in re.findall(r"\|\s*([^|]+)\s*\|\s*(\d+)/5\s*\|", table_section_match.group(0)):
+            category = category.strip()
+            for table_category, internal_key in category_mapping.items():
+                if table_category in category or category in table_category:
+                    summary_scores[internal_key] = int(score)
+                    if internal_key == "presentation_polish":
+                        summary_scores["overall_completeness"] = int(score)
+                    break
+    return scores, summary_scores
+
+
+def synthetic_response(rng, filler_sentences):
+    sections = []
+    categories = rng.sample(CATEGORIES, rng.randint(6, len(CATEGORIES)))
+    for category in categories:
+        score_text = rng.choice(SCORE_FORMATS).format(rng.randint(1, 5))
+        feedback = FILLER * rng.randint(1, filler_sentences)
+        sections.append(f"**{category}**\nfeedback: {feedback}\n{score_text}\n")
+    response = "\n".join(sections)
+    if rng.random() < 0.8:
+        marker = rng.choice(["Summary Table", "Here's a table summarizing your scores:"])
+        rows = "\n".join(f"| {category} | {rng.randint(1, 5)}/5 |" for category in categories)
+        response += f"\n{marker}\n| Criterion | Score |\n|---|---|\n{rows}\n\n**OVERALL COMMENTS**\n{FILLER}"
+    return response
+
+
+def parse_new(text):
+    parsed = parse_rubric_response.__wrapped__(text)
+    return {key: value["score"] for key, value in parsed["scores"].items()}, parsed["summary_scores"]
+
+
+def timed(parse, texts):
+    start = time.perf_counter()
+    results = [parse(text) for text in texts]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rng = random.Random(21)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            texts = [f.read()] * 20
+    else:
+        # Mostly short responses for coverage of the score formats, plus long ones for timing
+        texts = [synthetic_response(rng, 3) for _ in range(300)] + [synthetic_response(rng, 400) for _ in range(20)]
+    legacy, legacy_seconds = timed(legacy_parse, texts)
+    new, new_seconds = timed(parse_new, texts)
+    mismatches = sum(1 for old, current in zip(legacy, new) if old != current)
+    chars = sum(len(text) for text in texts)
+    print(f"{len(texts)} responses, {chars / 1024:.0f} KB")
+    print(f"   legacy regex: {legacy_seconds:.3f}s")
+    print(f"    single pass: {new_seconds:.3f}s")
+    print(f"speedup {legacy_seconds / max(new_seconds, 1e-9):.1f}x, "
+          f"{'all scores match' if not mismatches else f'{mismatches} responses DIFFER'}")
@@ -0,0 +1,72 @@
+import os
+import sys
+
+# The fake model would otherwise be held to the real per-minute quota
+os.environ.setdefault("AUTOGRADER_GEMINI_RPM", "1000000")
+os.environ.setdefault("AUTOGRADER_GEMINI_BURST", "1000000")
+
+from autograder_fake_model import FakeGenerativeModel
+from autograder_logic import RUBRIC_CATEGORIES, build_rubric_prompt
+from autograder_ratelimit import api_usage, generate_with_retry
+from autograder_rubric_parser import parse_rubric_response
+from autograder_structured import request_rubric_scores, structured_stats
+
+# Grades synthetic documents against a fake model that corrupts a fraction of its
+# replies, once with free-form replies (an unparseable reply means re-running the
+# whole multi-page call) and once in structured mode (invalid fields are re-asked
+# for from text). Reports how many whole-document re-runs structured mode avoids.
+#   python benchmark_structured_output.py [documents] [malformed fraction]
+PAGES = 20
+PAGE_BYTES = 150 * 1024
+MAX_RUNS = 5
+
+
+def page_parts():
+    return [{"mime_type": "image/jpeg", "data": bytes(PAGE_BYTES)} for _ in range(PAGES)]
+
+
+def free_form(model, prompt, parts, categories):
+    # A reply without a complete summary table falls back to guessed scores; staff re-run it
+    for run in range(1, MAX_RUNS + 1):
+        text = generate_with_retry(model, [prompt] + parts).text
+        if len(parse_rubric_response(text)["summary_scores"]) >= len(categories):
+            return run
+    return MAX_RUNS
+
+
+def structured(model, prompt, parts, categories):
+    for run in range(1, MAX_RUNS + 1):
+        _, missing = request_rubric_scores(model, [prompt] + parts, categories, context="Extracted document text: ...")
+        if not missing:
+            return run
+    return MAX_RUNS
+
+
+def measure(grade, documents, malformed):
+    model = FakeGenerativeModel(malformed=malformed, seed=22)
+    categories = [(key, title) for key, title, _ in RUBRIC_CATEGORIES]
+    prompt = build_rubric_prompt("Bjarke Ingels")
+    parts = page_parts()
+    before = api_usage.snapshot()
+    runs = sum(grade(model, prompt, parts, categories) for _ in range(documents))
+    after = api_usage.snapshot()
+    return {"full_runs": runs, "reruns": runs - documents, "calls": after["calls"] - before["calls"],
+            "mb_sent": (after["bytes_sent"] - before["bytes_sent"]) / (1024 * 1024)}
+
+
+if __name__ == "__main__":
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    malformed = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    free = measure(free_form, documents, malformed)
+    strict = measure(structured, documents, malformed)
+    print(f"{documents} documents x {PAGES} pages, {malformed:.0%} of replies malformed")
+    for label, result in (("free-form", free), ("structured", strict)):
+        print(f"{label:>11}: {result['reruns']} whole-document re-runs, {result['calls']} calls, "
+              f"{result['mb_sent']:.0f} MB sent")
+    # Two different numbers: the difference between the two runs above (free-form failures
+    # compound, since a re-run can fail again), and the reruns_avoided counter served at
+    # /api/cache, which counts structured rubric calls completed by re-asks
+    counters = structured_stats.snapshot()
+    print(f"whole-document re-runs saved vs free-form: {free['reruns'] - strict['reruns']}; "
+          f"rubric calls repaired by re-asks (reruns_avoided): {counters['reruns_avoided']}")
+    print(f"structured counters: {counters}")
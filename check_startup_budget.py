@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+# Measures a cold `import autograder_backend` in a fresh interpreter and fails if it
+# is over budget or pulled in a dependency that should only load on first use.
+# Run it before deploying: python check_startup_budget.py
+STARTUP_BUDGET_SECONDS = float(os.getenv("AUTOGRADER_STARTUP_BUDGET_SECONDS", "1.5"))
+STARTUP_BUDGET_RSS_MB = float(os.getenv("AUTOGRADER_STARTUP_BUDGET_RSS_MB", "150"))
+LAZY_MODULES = ["spacy", "pandas", "matplotlib", "IPython", "google.generativeai", "tqdm", "numpy",
+                "sentence_transformers"]
+
+PROBE = """
+import json, sys, time, resource
+start = time.perf_counter()
+import autograder_backend
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+print(json.dumps({
+    "seconds": seconds,
+    "rss_mb": rss_mb,
+    "loaded": [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+def measure_startup():
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Importing the backend opens the database and creates its folders; keep those
+    # out of the working tree
+    with tempfile.TemporaryDirectory(prefix="autograder_startup_") as scratch:
+        env = dict(os.environ,
+                   AUTOGRADER_DB_PATH=os.path.join(scratch, "submissions.db"),
+                   AUTOGRADER_CACHE_DIR=os.path.join(scratch, "cache"),
+                   AUTOGRADER_SUBMISSIONS_FOLDER=os.path.join(scratch, "submissions"))
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=here, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    result = measure_startup()
+    print(f"import autograder_backend: {result['seconds']:.2f}s (budget {STARTUP_BUDGET_SECONDS}s), "
+          f"peak RSS {result['rss_mb']:.0f} MB (budget {STARTUP_BUDGET_RSS_MB:.0f} MB)")
+    problems = []
+    if result["seconds"] > STARTUP_BUDGET_SECONDS:
+        problems.append("startup time over budget")
+    if result["rss_mb"] > STARTUP_BUDGET_RSS_MB:
+        problems.append("RSS over budget")
+    if result["loaded"]:
+        problems.append(f"eagerly imported: {', '.join(result['loaded'])}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
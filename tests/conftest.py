@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# Everything here runs offline: the fake model answers every Gemini call, and the
+# database, caches and submissions go to a scratch directory instead of the tree.
+# These are read when the autograder modules are imported, so set them first.
+_scratch = tempfile.mkdtemp(prefix="autograder_tests_")
+os.environ["AUTOGRADER_FAKE_MODEL"] = "1"
+os.environ["AUTOGRADER_DB_PATH"] = os.path.join(_scratch, "submissions.db")
+os.environ["AUTOGRADER_CACHE_DIR"] = os.path.join(_scratch, "cache")
+os.environ["AUTOGRADER_SUBMISSIONS_FOLDER"] = os.path.join(_scratch, "submissions")
+os.environ.setdefault("AUTOGRADER_GEMINI_RPM", "6000")
+os.environ.setdefault("AUTOGRADER_GEMINI_BURST", "100")
+os.environ.setdefault("AUTOGRADER_GEMINI_RETRY_BASE_DELAY", "0")
+
+import spacy
+
+if not spacy.util.is_package(os.getenv("AUTOGRADER_SPACY_MODEL", "en_core_web_sm")):
+    # Without the trained model, factor extraction still runs on a blank English pipeline
+    blank_model = os.path.join(_scratch, "spacy_blank_en")
+    spacy.blank("en").to_disk(blank_model)
+    os.environ["AUTOGRADER_SPACY_MODEL"] = blank_model
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
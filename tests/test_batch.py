@@ -0,0 +1,40 @@
+import shutil
+import uuid
+
+import fitz
+
+from autograder_batch import BatchGrader, load_checkpoint
+from autograder_store import SubmissionStore
+
+ARCHITECT = "Bjarke Ingels"
+
+
+def _canvas_folder(tmp_path):
+    # Two students handed in the same file, and one student handed in two files
+    folder = tmp_path / "downloads"
+    folder.mkdir()
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 60), f"Bjarke Ingels portfolio {uuid.uuid4().hex}")
+    shared = folder / "alice_101_1_portfolio.pdf"
+    doc.save(str(shared))
+    shutil.copy(shared, folder / "bob_202_2_portfolio.pdf")
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 60), f"Bjarke Ingels resubmission {uuid.uuid4().hex}")
+    doc.save(str(folder / "alice_101_3_resubmission.pdf"))
+    return str(folder)
+
+
+def test_same_file_from_two_students_is_graded_for_both(tmp_path):
+    source = _canvas_folder(tmp_path)
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    store = SubmissionStore(str(tmp_path / "batch.db"))
+
+    report = BatchGrader(ARCHITECT, workers=3, checkpoint_path=checkpoint, store=store).run(source)
+    assert report["graded"] == 3 and report["failed"] == 0
+    # alice's two gradings land within the same second and must both be kept
+    assert sorted(row["student_pid"] for row in store.all()) == ["101", "101", "202"]
+    assert len(load_checkpoint(checkpoint, ARCHITECT)) == 3
+
+    report = BatchGrader(ARCHITECT, workers=3, checkpoint_path=checkpoint, store=store).run(source)
+    assert report["graded"] == 0 and report["skipped"] == 3
+    assert store.count() == 3
@@ -0,0 +1,47 @@
+import os
+
+from autograder_cache import ResultCache, make_cache_key
+
+
+def test_key_depends_on_every_part_and_its_position():
+    key = make_cache_key("rubric", "abc", "Zaha Hadid", "model", "v1")
+    assert key == make_cache_key("rubric", "abc", "Zaha Hadid", "model", "v1")
+    assert key != make_cache_key("rubric", "abc", "Zaha Hadid", "model", "v2")
+    assert make_cache_key("a", "b") != make_cache_key("b", "a")
+    assert make_cache_key("a b", "c") != make_cache_key("a", "b c")
+
+
+def test_round_trip_and_counts(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    assert cache.get("missing", kind="image") is None
+    cache.put("k", {"grade": "A", "rubric_scores": {"image_quality": 5}})
+    assert cache.get("k", kind="image") == {"grade": "A", "rubric_scores": {"image_quality": 5}}
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["by_kind"] == {"image": {"hits": 1, "misses": 1}}
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    (tmp_path / "torn.json").write_text('{"grade": ')
+    assert cache.get("torn") is None
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 6)
+    for i, key in enumerate(["old", "used", "new"]):
+        cache.put(key, {"payload": "x" * 400})
+        os.utime(tmp_path / f"{key}.json", (1000 + i, 1000 + i))
+    cache.get("old")  # a hit makes it the most recently used
+    cache.max_bytes = 2 * os.path.getsize(tmp_path / "new.json")
+    assert cache.evict() == 1
+    assert cache.get("used") is None
+    assert cache.get("old") is not None and cache.get("new") is not None
+
+
+def test_purge_removes_everything(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("a", {})
+    cache.put("b", {})
+    assert cache.purge() == 2
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,77 @@
+import re
+import random
+
+import pytest
+
+from autograder_with_factors import (
+    FactorMatcher, rubric_factors, factor_matcher, check_factors, build_factor_table
+)
+
+
+def substring_checks(text, criterion):
+    # The per-phrase substring test FactorMatcher replaced
+    content = text.lower()
+    return {(criterion, col, idx): desc.lower() in content
+            for col, factors in rubric_factors[criterion].items()
+            for idx, desc in enumerate(factors, start=1)}
+
+
+def substring_table(text):
+    table = []
+    for criterion in rubric_factors:
+        checks = substring_checks(text, criterion)
+        row = {"Criterion": criterion}
+        for col in range(1, 5):
+            passed = [f"({criterion}, {col}, {idx})" for (_, c, idx), ok in checks.items() if c == col and ok]
+            row[f"Col_{col}"] = ", ".join(passed) or "-"
+        table.append(row)
+    return table
+
+
+def every_occurrence(factors, text):
+    content = text.lower()
+    return sorted(
+        (criterion, col, idx, match.start())
+        for criterion, columns in factors.items()
+        for col, descriptors in columns.items()
+        for idx, desc in enumerate(descriptors, start=1)
+        for match in re.finditer(f"(?={re.escape(desc.lower())})", content)
+    )
+
+
+def random_text(rng, phrases, words=200):
+    filler = ["the", "building", "a", "of", "and", "design", "light", "Copenhagen", "in", "."]
+    pieces = []
+    for _ in range(words):
+        if rng.random() < 0.15:
+            phrase = rng.choice(phrases)
+            # Whole phrases, upper-cased ones and fragments cut mid-word
+            pieces.append(rng.choice([phrase, phrase.upper(), phrase[:rng.randint(1, len(phrase))]]))
+        else:
+            pieces.append(rng.choice(filler))
+    return rng.choice([" ", "", "\n"]).join(pieces)
+
+
+ALL_PHRASES = [desc for columns in rubric_factors.values() for descriptors in columns.values()
+               for desc in descriptors]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_the_substring_check(seed):
+    text = random_text(random.Random(seed), ALL_PHRASES)
+    hits = factor_matcher.find(text)
+    for criterion in rubric_factors:
+        assert check_factors(text, criterion, hits) == substring_checks(text, criterion)
+    assert build_factor_table(hits) == substring_table(text)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_reports_overlapping_and_nested_phrases(seed):
+    factors = {"c1": {1: ["art", "heart", "earth"], 2: ["hearth", "he"]}, "c2": {1: ["art"], 2: ["rth h"]}}
+    matcher = FactorMatcher(factors)
+    text = random_text(random.Random(seed), ["art", "heart", "earth", "hearth", "he", "rth h"], words=60)
+    hits = matcher.find(text)
+    assert sorted((h["criterion"], h["col"], h["idx"], h["start"]) for h in hits) == every_occurrence(factors, text)
+    assert all(text.lower()[h["start"]:h["end"]] == factors[h["criterion"]][h["col"]][h["idx"] - 1] for h in hits)
+    assert [h["start"] for h in hits] == sorted(h["start"] for h in hits)
+
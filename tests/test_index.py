@@ -0,0 +1,95 @@
+import json
+import itertools
+
+import pytest
+
+from autograder_store import SubmissionStore
+from autograder_index import SubmissionIndex
+
+GRADES = ["A", "A-", "B+", "B", "B-", "C+", "C", "D", "F"]
+ARCHITECTS = ["Bjarke Ingels", "Zaha Hadid", "Tadao Ando", None]
+
+
+def _submission(i):
+    rubric_scores = {"image_quality": i % 6, "bio_references": (i * 7) % 5}
+    if i % 4 == 0:
+        del rubric_scores["image_quality"]
+    return {
+        "student_name": f"Student {i % 13} {'Smith' if i % 3 else 'Lee_%'}",
+        "student_pid": f"A{1000 + i % 17}",
+        "architect_name": ARCHITECTS[i % len(ARCHITECTS)],
+        "timestamp": f"202401{1 + i % 28:02d}_{i // 28:02d}{i % 60:02d}00",
+        "grade": GRADES[i % len(GRADES)],
+        "score": None if i % 11 == 0 else round(40 + (i * 37) % 60, 1),
+        "rubric_scores": rubric_scores,
+        "detailed_evaluation": "..."
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SubmissionStore(str(tmp_path / "submissions.db"))
+    for i in range(120):
+        store.add(_submission(i))
+    return store
+
+
+QUERIES = [
+    {},
+    {"page": 2, "limit": 25},
+    {"page": 9, "limit": 25},
+    {"grade": "B"},
+    {"grade": "b+"},
+    {"architect": "Zaha Hadid"},
+    {"architect": "Zaha Hadid", "grade": "A", "page": 2, "limit": 5},
+    {"q": "smith"},
+    {"q": "lee_%"},
+    {"q": "a101", "grade": "C"},
+] + [{"sort": sort, "page": page, "limit": 20, "architect": architect}
+     for sort, page, architect in itertools.product(
+         ["-timestamp", "timestamp", "score", "-score", "grade", "-name", "pid", "rubric.image_quality",
+          "-rubric.bio_references"],
+         [1, 3], [None, "Tadao Ando"])]
+
+
+@pytest.mark.parametrize("params", QUERIES, ids=json.dumps)
+def test_index_matches_store(store, params):
+    index = SubmissionIndex(store)
+    assert index.query(**params) == store.query(**params)
+
+
+def test_index_picks_up_rows_from_other_processes(store, tmp_path):
+    index = SubmissionIndex(store)
+    # Another process (batch or import CLI) writes through its own connection
+    SubmissionStore(store.path).add(_submission(500))
+    assert index.query(limit=200) == store.query(limit=200)
+    assert index.architects() == store.architects()
+
+
+def test_rows_written_during_a_folder_import_are_indexed(store, tmp_path):
+    folder = tmp_path / "submissions"
+    folder.mkdir()
+    index = SubmissionIndex(store, watch_folder=str(folder))
+    dropped = _submission(501)
+    (folder / f"{dropped['student_pid']}_{dropped['timestamp']}.json").write_text(json.dumps(dropped))
+    # Lands after the folder import but before the index looks at the store again
+    store_add = store.add
+
+    def add_then_another_process_writes(submission):
+        row_id = store_add(submission)
+        SubmissionStore(store.path).add(_submission(502))
+        return row_id
+
+    store.add = add_then_another_process_writes
+    index.refresh()
+    store.add = store_add
+    assert index.query(limit=200) == store.query(limit=200)
+    assert index.query(limit=200)["total"] == 122
+
+
+def test_index_add_replaces_same_pid_and_second(store):
+    index = SubmissionIndex(store)
+    replacement = dict(_submission(5), grade="F", architect_name="Zaha Hadid")
+    store.add(replacement)
+    index.add(replacement)
+    assert index.query(limit=200) == store.query(limit=200)
@@ -0,0 +1,15 @@
+from autograder_jobs import JobQueue
+
+
+def test_finished_job_already_has_its_terminal_event():
+    # The SSE stream stops once a job is finished and it has sent every event, so the
+    # done/error event must be in job.events by the time job.finished turns true
+    queue = JobQueue(max_workers=2)
+    try:
+        for fn, terminal in [(lambda: "ok", "done"), (lambda: 1 / 0, "error")] * 25:
+            job = queue.submit(fn)
+            job.future.result(timeout=10)
+            assert job.finished
+            assert job.events[-1]["stage"] == terminal
+    finally:
+        queue.shutdown()
@@ -0,0 +1,55 @@
+import uuid
+
+import fitz
+import pytest
+
+from autograder_pdf import ParsedSubmission
+from autograder_logic import extract_text_from_pdf, extract_images_from_pdf, get_caption_candidates
+from autograder_pipeline import run_rubric_cached, run_factors_cached
+
+ARCHITECT = "Bjarke Ingels"
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), f"Architect Background\nBjarke Ingels {uuid.uuid4().hex}")
+    image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 48), False)
+    image.set_rect(image.irect, (200, 80, 40))
+    page.insert_image(fitz.Rect(50, 100, 114, 148), pixmap=image)
+    page.insert_text((50, 170), "Photo: 8 House, Copenhagen")
+    path = tmp_path / "submission.pdf"
+    doc.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    submissions = []
+    init = ParsedSubmission.__init__
+
+    def tracking_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        submissions.append(self)
+
+    monkeypatch.setattr(ParsedSubmission, "__init__", tracking_init)
+    return submissions
+
+
+def test_stages_given_a_path_close_what_they_open(pdf, opened):
+    extract_text_from_pdf(pdf)
+    images = extract_images_from_pdf(pdf)
+    get_caption_candidates("", images, pdf)
+    run_rubric_cached(pdf, ARCHITECT)
+    run_factors_cached(pdf, ARCHITECT)
+    assert len(opened) >= 5
+    assert all(submission.doc.is_closed for submission in opened)
+
+
+def test_stages_leave_a_callers_submission_open(pdf):
+    with ParsedSubmission(pdf) as submission:
+        extract_text_from_pdf(submission)
+        run_rubric_cached(submission, ARCHITECT)
+        assert not submission.doc.is_closed
+    assert submission.doc.is_closed
@@ -0,0 +1,70 @@
+import json
+
+import fitz
+import pytest
+
+from autograder_pipeline import grade_pdf
+
+ARCHITECT = "Bjarke Ingels"
+RESULT_KEYS = {
+    "feedback", "detailed_evaluation", "score", "grade", "rubric_scores", "factor_table",
+    "factor_reflection", "timings", "render_stats", "prescore", "incomplete_criteria", "tokens", "cached"
+}
+
+
+@pytest.fixture
+def submission_pdf(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "Table of Contents\nArchitect Background\n10 Buildings\n"
+                               "Academic References\nPersonal Bio\n")
+    page = doc.new_page()
+    page.insert_text((50, 60), "Bjarke Ingels founded BIG in Copenhagen in 2005.\n"
+                               "His firm designed 8 House, VIA 57 West and CopenHill.\n"
+                               "The buildings respond to climate, community and public space.\n")
+    page = doc.new_page()
+    image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 320, 240), False)
+    image.set_rect(image.irect, (40, 120, 200))
+    page.insert_image(fitz.Rect(50, 50, 370, 290), pixmap=image)
+    path = tmp_path / "submission.pdf"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_grade_pdf_with_fake_model(submission_pdf):
+    events = []
+    graded = grade_pdf(submission_pdf, "Test Student", "A1", ARCHITECT,
+                       on_event=lambda stage, data=None: events.append(stage))
+
+    assert events[0] == "parsed"
+    assert events.index("rubric_scored") < events.index("feedback_ready")
+    assert "factors_ready" in events
+
+    assert RESULT_KEYS <= set(graded)
+    assert isinstance(graded["score"], (int, float))
+    assert isinstance(graded["grade"], str) and graded["grade"]
+    assert graded["rubric_scores"] and all(isinstance(v, (int, float)) for v in graded["rubric_scores"].values())
+    assert isinstance(graded["feedback"], str) and graded["feedback"]
+    assert isinstance(graded["factor_table"], list)
+    json.dumps(graded)
+
+
+def test_job_events_end_with_done(submission_pdf):
+    import autograder_backend as backend
+    client = backend.app.test_client()
+
+    with open(submission_pdf, "rb") as f:
+        response = client.post("/", data={"name": "Test Student", "pid": "A1", "architect": ARCHITECT,
+                                          "file": (f, "submission.pdf")})
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+
+    stream = client.get(f"/api/jobs/{job_id}/events")
+    body = b"".join(stream.response).decode()
+    stages = [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+
+    # The stream has to end on its own with the terminal event, not stop just short of it
+    assert stages[:3] == ["queued", "running", "parsed"]
+    assert stages[-1] == "done"
+    assert stages.count("done") == 1
+    assert client.get(f"/api/jobs/{job_id}").json["status"] == "done"
@@ -0,0 +1,81 @@
+from autograder_prescore import (
+    PRESCORE_CONFIDENCE, BIO_TARGET_WORDS, detect_structure, find_biography_section, score_organization,
+    score_biography, score_references, score_image_quality, confident_signals
+)
+
+FULL_STRUCTURE = ("Table of Contents\nArchitect Background\n10 Buildings\nAcademic References\nPersonal Bio\n\n"
+                  "Architect Background\nBjarke Ingels was born in Copenhagen.\n\n"
+                  "10 Buildings\n8 House\n\nAcademic References\nIngels, B. (2010). Yes Is More.\n\n"
+                  "Personal Bio\nI am a student.\n")
+
+
+def _confident(signal):
+    return signal["confidence"] >= PRESCORE_CONFIDENCE
+
+
+def test_complete_structure_scores_five():
+    structure = detect_structure(FULL_STRUCTURE)
+    assert structure["has_toc"]
+    assert len(structure["sections"]) == 4
+    signal = score_organization(structure)
+    assert signal["score"] == 5 and _confident(signal)
+
+
+def test_works_cited_is_not_a_buildings_heading():
+    structure = detect_structure("Table of Contents\nBiography\nWorks Cited\nAbout Me\n")
+    assert "10 buildings" not in structure["sections"]
+    assert "academic references" in structure["sections"]
+    assert not _confident(score_organization(structure))
+
+
+def test_one_heading_line_counts_for_one_section():
+    assert detect_structure("Background and Buildings\n")["sections"] == ["architect background"]
+    # ...but the shared line moves to whichever section has no other heading
+    assert detect_structure("Background and Buildings\nBiography\n")["sections"] == [
+        "architect background", "10 buildings"
+    ]
+
+
+def test_missing_structure_is_confidently_low():
+    signal = score_organization(detect_structure("Some notes about Bjarke Ingels.\n"))
+    assert signal["score"] == 2 and _confident(signal)
+
+
+def test_partial_structure_goes_to_gemini():
+    signal = score_organization(detect_structure("Contents\nBiography\n10 Buildings\n"))
+    assert not _confident(signal)
+
+
+def test_biography_cutoffs():
+    assert score_biography(int(BIO_TARGET_WORDS * 0.2) - 1)["score"] == 1
+    assert _confident(score_biography(int(BIO_TARGET_WORDS * 0.2) - 1))
+    assert score_biography(int(BIO_TARGET_WORDS * 0.2))["score"] == 2
+    assert _confident(score_biography(int(BIO_TARGET_WORDS * 0.5) - 1))
+    assert not _confident(score_biography(int(BIO_TARGET_WORDS * 0.5)))
+
+
+def test_references_rules():
+    assert _confident(score_references([], False))
+    assert not _confident(score_references([], True))
+    with_doi = [f"Author {i} (2020). Title. doi:10.1/{i}" for i in range(6)]
+    signal = score_references(with_doi, True)
+    assert signal["score"] == 5 and not _confident(signal)
+
+
+def test_image_quality_rules():
+    signal = score_image_quality(0, 0)
+    assert signal["score"] == 1 and _confident(signal)
+    # A few images is not clear-cut: they could be few but excellent
+    assert not _confident(score_image_quality(3, 3))
+    assert not _confident(score_image_quality(80, 80))
+
+
+def test_confident_signals_threshold():
+    signals = {"a": {"score": 1, "confidence": PRESCORE_CONFIDENCE}, "b": {"score": 4, "confidence": 0.3}}
+    assert list(confident_signals(signals)) == ["a"]
+
+
+def test_biography_section_skips_table_of_contents():
+    start, end = find_biography_section(FULL_STRUCTURE)
+    assert FULL_STRUCTURE[start:end].strip() == "Bjarke Ingels was born in Copenhagen."
+    assert find_biography_section("no headings here") == (0, len("no headings here"))
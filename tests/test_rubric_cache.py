@@ -0,0 +1,67 @@
+import uuid
+
+import fitz
+
+from autograder_fake_model import FakeGenerativeModel
+import autograder_pipeline
+from autograder_pipeline import run_rubric_cached
+
+ARCHITECT = "Bjarke Ingels"
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+def _one_page_pdf(tmp_path):
+    # Unique text, so no earlier test's cached result can answer for it
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 60), f"Bjarke Ingels portfolio {uuid.uuid4().hex}")
+    path = tmp_path / "one_page.pdf"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_failed_rubric_call_is_not_cached(tmp_path, monkeypatch):
+    pdf = _one_page_pdf(tmp_path)
+
+    def unavailable(self, contents, generation_config=None, **kwargs):
+        raise ServiceUnavailable("503 Service Unavailable")
+
+    monkeypatch.setattr(FakeGenerativeModel, "generate_content", unavailable)
+    failed = run_rubric_cached(pdf, ARCHITECT)
+    assert failed["rubric_failed"]
+    assert failed["cached"] is False
+
+    # Once Gemini is back the PDF is graded again rather than served the outage's F
+    monkeypatch.undo()
+    regraded = run_rubric_cached(pdf, ARCHITECT)
+    assert regraded["cached"] is False
+    assert not regraded["rubric_failed"]
+    assert regraded["final_percent"] > failed["final_percent"]
+    assert run_rubric_cached(pdf, ARCHITECT)["cached"] is True
+
+
+def test_unscored_criteria_are_not_cached(tmp_path, monkeypatch):
+    pdf = _one_page_pdf(tmp_path)
+    run_autograder_full = autograder_pipeline.run_autograder_full
+
+    def leaves_a_criterion_unscored(*args, **kwargs):
+        result = run_autograder_full(*args, **kwargs)
+        result["incomplete_criteria"] = ["image_relevance"]
+        return result
+
+    monkeypatch.setattr(autograder_pipeline, "run_autograder_full", leaves_a_criterion_unscored)
+    assert run_rubric_cached(pdf, ARCHITECT)["cached"] is False
+    monkeypatch.undo()
+    assert run_rubric_cached(pdf, ARCHITECT)["cached"] is False
+    assert run_rubric_cached(pdf, ARCHITECT)["cached"] is True
+
+
+def test_identical_bytes_under_another_name_hit_the_cache(tmp_path):
+    pdf = _one_page_pdf(tmp_path)
+    assert run_rubric_cached(pdf, ARCHITECT)["cached"] is False
+    copy = tmp_path / "renamed.pdf"
+    copy.write_bytes(open(pdf, "rb").read())
+    assert run_rubric_cached(str(copy), ARCHITECT)["cached"] is True
+    assert run_rubric_cached(str(copy), "Zaha Hadid")["cached"] is False
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from autograder_rubric_parser import SCORE_LABELS, parse_rubric_response
+from benchmark_rubric_parser import legacy_parse, synthetic_response, parse_new
+
+RESPONSE = """**Architect Selection & Scope**
+feedback: Bjarke Ingels is clearly identified.
+Score: 5/5
+
+**Organization & Document Setup**: The table of contents is missing. Score: 3/5
+
+**Biographical Content** About 600 words, page 2 of 9. 4/5
+
+Summary Table
+| Criterion | Score |
+|---|---|
+| Architect Selection & Scope | 5/5 |
+| Organization & Document Setup | 3/5 |
+| Overall Completeness & Presentation | 4/5 |
+
+**OVERALL COMMENTS**
+| Image Relevance | 1/5 |
+"""
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_the_legacy_regex_parser(seed):
+    rng = random.Random(seed)
+    for _ in range(30):
+        text = synthetic_response(rng, 3)
+        assert parse_new(text) == legacy_parse(text)
+
+
+def test_scores_and_justifications():
+    scores = parse_rubric_response(RESPONSE)["scores"]
+    assert scores["architect_chosen"] == {"score": 5, "justification": "Bjarke Ingels is clearly identified."}
+    assert scores["doc_and_slides"] == {"score": 3, "justification": "The table of contents is missing."}
+    # A bare fraction counts, but "2 of 9" doesn't, and it has no Score: line to cut a justification from
+    assert scores["bio_750_words"] == {"score": 4, "justification": ""}
+    # Labels that never appear score 0
+    assert scores["bio_structure"]["score"] == 0
+    assert set(scores) == {key for key, _ in SCORE_LABELS}
+
+
+def test_justification_outside_a_heading_keeps_its_bold_text():
+    scores = parse_rubric_response("Image Relevance: your **best** image fits. Score: 4/5")["scores"]
+    assert scores["image_relevance"] == {"score": 4, "justification": "your **best** image fits."}
+
+
+def test_summary_table_stops_at_the_blank_line():
+    summary = parse_rubric_response(RESPONSE)["summary_scores"]
+    assert summary == {"architect_chosen": 5, "doc_and_slides": 3, "presentation_polish": 4,
+                       "overall_completeness": 4}
+
+
+def test_no_summary_table():
+    assert parse_rubric_response("**Image Relevance** Score: 2/5")["summary_scores"] == {}
+
+
+def test_text_that_changes_length_when_lowercased():
+    # "İ" lowercases to two characters, so offsets into the lowercased text would drift
+    text = "İstanbul notes. **Image Relevance**\nfeedback: Mostly on topic.\nScore: 4/5"
+    assert parse_rubric_response(text)["scores"]["image_relevance"] == {"score": 4,
+                                                                       "justification": "Mostly on topic."}
+    assert parse_new(text) == legacy_parse(text)
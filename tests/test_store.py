@@ -0,0 +1,48 @@
+from autograder_store import SubmissionStore, MAX_PAGE_SIZE
+
+
+def _add(store, pid, timestamp, **fields):
+    submission = {"student_pid": pid, "timestamp": timestamp, "student_name": pid, "architect_name": "Zaha Hadid",
+                  "grade": "A", "score": 90.0, "rubric_scores": {}, "detailed_evaluation": "..."}
+    submission.update(fields)
+    store.add(submission)
+
+
+def _pids(result):
+    return [row["student_pid"] for row in result["submissions"]]
+
+
+def test_grade_matches_by_letter_prefix(tmp_path):
+    store = SubmissionStore(str(tmp_path / "s.db"))
+    for i, grade in enumerate(["B+", "B", "B-", "A-", "C+"]):
+        _add(store, f"p{i}", f"20240101_00000{i}", grade=grade)
+    assert sorted(_pids(store.query(grade="B"))) == ["p0", "p1", "p2"]
+    assert _pids(store.query(grade="B+")) == ["p0"]
+
+
+def test_search_treats_like_wildcards_literally(tmp_path):
+    store = SubmissionStore(str(tmp_path / "s.db"))
+    _add(store, "A_1", "20240101_000001", student_name="Ana 100%")
+    _add(store, "AB1", "20240101_000002", student_name="Ana 1000")
+    assert _pids(store.query(q="a_1")) == ["A_1"]
+    assert _pids(store.query(q="100%")) == ["A_1"]
+
+
+def test_rubric_sort_puts_missing_scores_first(tmp_path):
+    store = SubmissionStore(str(tmp_path / "s.db"))
+    _add(store, "p1", "20240101_000001", rubric_scores={"image_quality": 4})
+    _add(store, "p2", "20240101_000002", rubric_scores={})
+    _add(store, "p3", "20240101_000003", rubric_scores={"image_quality": 2})
+    assert _pids(store.query(sort="rubric.image_quality")) == ["p2", "p3", "p1"]
+    assert _pids(store.query(sort="-rubric.image_quality")) == ["p1", "p3", "p2"]
+
+
+def test_paging_is_clamped(tmp_path):
+    store = SubmissionStore(str(tmp_path / "s.db"))
+    for i in range(5):
+        _add(store, f"p{i}", f"20240101_00000{i}")
+    result = store.query(page=0, limit=2)
+    assert result["page"] == 1 and result["total"] == 5 and _pids(result) == ["p4", "p3"]
+    assert _pids(store.query(page=3, limit=2)) == ["p0"]
+    assert store.query(limit=10 ** 6)["limit"] == MAX_PAGE_SIZE
+    assert "detailed_evaluation" not in store.query()["submissions"][0]
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from autograder_fake_model import FakeResponse
+from autograder_structured import (
+    STRUCTURED_MAX_REASKS, StructuredOutputStats, load_json, as_int, request_rubric_scores, request_image_verdict
+)
+import autograder_structured
+
+CATEGORIES = [("architect_chosen", "Architect Selection & Scope"), ("image_quality", "Selection & Quality of Images")]
+PAGES = [{"mime_type": "image/png", "data": b"page one"}, {"mime_type": "image/png", "data": b"page two"}]
+
+
+class ScriptedModel:
+    """Returns the scripted replies in order (an Exception is raised) and records every call."""
+
+    def __init__(self, *replies):
+        self.model_name = "scripted"
+        self.replies = list(replies)
+        self.calls = []
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        self.calls.append({"contents": list(contents), "schema": (generation_config or {}).get("response_schema")})
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return FakeResponse(reply if isinstance(reply, str) else json.dumps(reply))
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    stats = StructuredOutputStats()
+    monkeypatch.setattr(autograder_structured, "structured_stats", stats)
+    return stats
+
+
+def criterion(score, feedback="Because."):
+    return {"score": score, "feedback": feedback}
+
+
+def test_valid_reply_needs_one_call(stats):
+    model = ScriptedModel({"architect_chosen": criterion(5), "image_quality": criterion("4/5")})
+    scores, missing = request_rubric_scores(model, ["prompt"] + PAGES, CATEGORIES)
+    assert missing == []
+    assert scores["image_quality"] == {"score": 4, "justification": "Because."}
+    assert len(model.calls) == 1
+    assert stats.snapshot()["valid_first_try"] == 1 and stats.snapshot()["reasks"] == 0
+
+
+def test_only_invalid_fields_are_reasked_without_the_pages(stats):
+    model = ScriptedModel(
+        {"architect_chosen": criterion(5), "image_quality": criterion(9)},
+        {"image_quality": criterion(3, "Low resolution.")}
+    )
+    scores, missing = request_rubric_scores(model, ["prompt"] + PAGES, CATEGORIES, context="document text")
+    assert missing == []
+    assert scores == {"architect_chosen": {"score": 5, "justification": "Because."},
+                      "image_quality": {"score": 3, "justification": "Low resolution."}}
+    reask = model.calls[1]
+    assert all(isinstance(part, str) for part in reask["contents"])
+    assert "image_quality" in reask["contents"][0] and "document text" in reask["contents"][0]
+    assert list(reask["schema"]["properties"]) == ["image_quality"]
+    assert stats.snapshot() == {"requests": 1, "valid_first_try": 0, "reasks": 1, "repaired": 1,
+                                "reruns_avoided": 1, "unrepaired": 0, "fields_defaulted": 0}
+
+
+def test_invalid_json_is_reported_as_such():
+    model = ScriptedModel('{"architect_chosen": {"score": 5', {"architect_chosen": criterion(5),
+                                                                "image_quality": criterion(2)})
+    scores, missing = request_rubric_scores(model, ["prompt"] + PAGES, CATEGORIES)
+    assert missing == [] and len(scores) == 2
+    assert "it was not valid JSON" in model.calls[1]["contents"][0]
+
+
+def test_gives_up_after_the_reask_limit(stats):
+    model = ScriptedModel(*[{"architect_chosen": criterion(5)}] + [{}] * STRUCTURED_MAX_REASKS)
+    scores, missing = request_rubric_scores(model, ["prompt"] + PAGES, CATEGORIES)
+    assert missing == ["image_quality"] and list(scores) == ["architect_chosen"]
+    assert len(model.calls) == 1 + STRUCTURED_MAX_REASKS
+    assert stats.snapshot()["unrepaired"] == 1 and stats.snapshot()["fields_defaulted"] == 1
+
+
+def test_failed_reask_keeps_what_was_valid():
+    model = ScriptedModel({"architect_chosen": criterion(4)}, ValueError("token budget exhausted"))
+    scores, missing = request_rubric_scores(model, ["prompt"] + PAGES, CATEGORIES)
+    assert missing == ["image_quality"] and scores["architect_chosen"]["score"] == 4
+    assert len(model.calls) == 2
+
+
+def test_repaired_image_verdicts_are_not_rubric_reruns(stats):
+    verdict = {"building_detected": "8 House", "interior_or_exterior": "exterior", "relevance_score": 8,
+               "justification": "Facade.", "architectural_features_visible": "yes"}
+    model = ScriptedModel(verdict, {"architectural_features_visible": True})
+    request_image_verdict(model, ["prompt", PAGES[0]])
+    assert stats.snapshot()["repaired"] == 1 and stats.snapshot()["reruns_avoided"] == 0
+
+
+def test_load_json_tolerates_fences_and_prose():
+    assert load_json('Here you go:\n```json\n{"a": 1}\n```\nThanks') == {"a": 1}
+    assert load_json("[1, 2]") == [1, 2]
+    assert load_json("no json here") is None
+    assert load_json('{"a": ') is None
+
+
+def test_as_int_accepts_the_usual_spellings():
+    assert [as_int(value, 1, 5) for value in (4, "4", "4/5", " 4 / 5 ", 4.0)] == [4] * 5
+    assert [as_int(value, 1, 5) for value in (0, 6, "N/A", 4.5, True, None)] == [None] * 6